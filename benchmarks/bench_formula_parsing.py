@@ -0,0 +1,70 @@
+"""
+Benchmark of formula normalization throughput, pymatgen's Composition pipeline against extract.formula.
+
+Normalizes a synthetic stream of abstract tokens (mostly words, with formulas of the kinds found in abstracts:
+plain, doped, bracketed and fractional) without caching and reports tokens per second for both implementations,
+and checks that they agree on every token.
+
+    python -m benchmarks.bench_formula_parsing --tokens 20000
+"""
+import argparse
+import random
+import re
+import string
+import time
+from pymatgen.core.composition import Composition
+from pymatgen.core.periodic_table import Element
+from matstract.extract.formula import normalize_formula
+
+FORMULAS = ["LiFePO4", "SrZrO3", "Ca(NO3)2", "Li2(FePO4)2", "Sr(Zr0.5Ti0.5)O3", "Bi2Te3", "CH3NH3PbI3",
+            "La0.7Sr0.3MnO3", "LiNi0.8Co0.15Al0.05O2", "Li7La3Zr2O12", "K4[Fe(CN)6]", "TiO2", "ZnO", "GaN",
+            "Pb(Zr0.52Ti0.48)O3", "YBa2Cu3O6.5", "Al2(SO4)3", "Nd2Fe14B", "Li10GeP2S12", "H2O"]
+
+
+def pymatgen_normalize(formula):
+    try:
+        integer_formula, factor = Composition(formula).get_integer_formula_and_factor()
+        composition = Composition(integer_formula)
+        if any(not Element.is_valid_symbol(str(key)) for key in composition.keys()):
+            return False
+        return ''.join(sorted(re.findall(r'[A-Z][a-z]?\d*', composition.get_reduced_formula_and_factor()[0])))
+    except Exception:
+        return False
+
+
+def tokens(n, formula_share):
+    stream = []
+    for _ in range(n):
+        if random.random() < formula_share:
+            stream.append(random.choice(FORMULAS))
+        else:
+            word = ''.join(random.choice(string.ascii_lowercase) for _ in range(random.randint(2, 10)))
+            stream.append(word.capitalize() if random.random() < 0.1 else word)
+    return stream
+
+
+def throughput(func, stream):
+    t0 = time.perf_counter()
+    results = [func(t) for t in stream]
+    return len(stream) / (time.perf_counter() - t0), results
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--tokens", type=int, default=20000)
+    arg_parser.add_argument("--formula-share", type=float, default=0.2, help="share of formulas in the tokens")
+    args = arg_parser.parse_args()
+
+    random.seed(0)
+    stream = tokens(args.tokens, args.formula_share)
+    pymatgen_rate, expected = throughput(pymatgen_normalize, stream)
+    native_rate, results = throughput(lambda t: normalize_formula(t) or False, stream)
+    print("{:<12} {:>14}".format("", "tokens/s"))
+    print("{:<12} {:>14,.0f}".format("pymatgen", pymatgen_rate))
+    print("{:<12} {:>14,.0f}".format("native", native_rate))
+    print("speedup {:.1f}x, {} disagreements".format(native_rate / pymatgen_rate,
+                                                    sum(a != b for a, b in zip(expected, results))))
+
+
+if __name__ == '__main__':
+    main()
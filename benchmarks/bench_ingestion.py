@@ -0,0 +1,150 @@
+"""
+Ingestion throughput benchmark for matstract.collect.scopus.
+
+Starts a fake Elsevier API on localhost (search and article endpoints serving the sample article XML with
+configurable latency and error rate), seeds elsevier_log with blocks, runs contribute against an in-memory Mongo
+stand-in (mongomock, or a local mongod with --mongo-uri) and reports articles/sec, p50/p99 fetch latency and
+database write time for each number of workers.
+
+    python -m benchmarks.bench_ingestion --articles 500 --workers 1 4 16 --latency 0.05 --error-rate 0.02
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import mongomock
+from pymongo import MongoClient
+from matstract.collect import scopus
+from matstract.collect.ratelimit import RateLimiter
+
+SAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'matstract', 'collect', 'tests',
+                      'article.xml')
+SAMPLE_DOI = "10.1016/j.actamat.2018.01.057"
+
+
+class FakeElsevierHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        time.sleep(max(0., random.gauss(server.latency, server.latency / 4)))
+        url = urlparse(self.path)
+        if random.random() < server.error_rate:
+            return self.reply(503, b"Service Unavailable", "text/plain", {"Retry-After": "0"})
+        if url.path.startswith("/content/search/scopus"):
+            params = parse_qs(url.query)
+            cursor, count = params["cursor"][0], int(params["count"][0])
+            start = 0 if cursor == "*" else int(cursor)
+            dois = server.dois[start:start + count]
+            body = {"search-results": {"opensearch:totalResults": str(len(server.dois)),
+                                       "cursor": {"@current": cursor, "@next": str(start + count)},
+                                       "entry": [{"prism:doi": doi} for doi in dois] or
+                                                [{"error": "Result set was empty"}]}}
+            return self.reply(200, json.dumps(body).encode('utf-8'), "application/json")
+        doi = url.path.split("/content/article/doi/")[-1]
+        return self.reply(200, server.article.replace(SAMPLE_DOI, doi).encode('utf-8'), "text/xml")
+
+    def reply(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_fake_elsevier(dois, latency, error_rate):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeElsevierHandler)
+    server.daemon_threads = True
+    server.dois = dois
+    server.latency = latency
+    server.error_rate = error_rate
+    server.article = open(SAMPLE, 'r').read()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = "http://127.0.0.1:{}".format(server.server_port)
+    scopus.ARTICLE_URL = base + "/content/article/doi/{}"
+    scopus.SEARCH_URL = base + "/content/search/scopus"
+    return server
+
+
+def timed(func, samples):
+    def wrapper(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            samples.append(time.perf_counter() - t0)
+    return wrapper
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))] if samples else float('nan')
+
+
+def run(db, user_creds, num_workers, checkpoint_every, num_blocks):
+    fetches, writes = [], []
+    download, insert_entries = scopus.download, scopus.insert_entries
+    scopus.download, scopus.insert_entries = timed(download, fetches), timed(insert_entries, writes)
+    try:
+        t0 = time.perf_counter()
+        scopus.contribute(user_creds=user_creds, max_block_size=10 ** 9, num_blocks=num_blocks,
+                          num_workers=num_workers, checkpoint_every=checkpoint_every, db=db)
+        seconds = time.perf_counter() - t0
+    finally:
+        scopus.download, scopus.insert_entries = download, insert_entries
+    articles = db.elsevier.count_documents({"completed": True})
+    return {"workers": num_workers, "articles": articles, "seconds": seconds, "rate": articles / seconds,
+            "p50": percentile(fetches, .5), "p99": percentile(fetches, .99), "db": sum(writes)}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--articles", type=int, default=500, help="articles per block")
+    arg_parser.add_argument("--blocks", type=int, default=1)
+    arg_parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    arg_parser.add_argument("--latency", type=float, default=0.05, help="mean API latency in seconds")
+    arg_parser.add_argument("--error-rate", type=float, default=0., help="fraction of requests answered with 503")
+    arg_parser.add_argument("--checkpoint-every", type=int, default=50)
+    arg_parser.add_argument("--rate", type=float, default=1000, help="API requests per second allowed")
+    arg_parser.add_argument("--mongo-uri", default=None, help="use this mongod instead of mongomock")
+    args = arg_parser.parse_args()
+
+    dois = ["10.1016/j.bench.{}".format(i) for i in range(args.articles)]
+    server = start_fake_elsevier(dois, args.latency, args.error_rate)
+    scopus.LIMITER = RateLimiter(rate=args.rate, backoff_base=0.01)
+    user_creds = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+    json.dump({"name": "benchmark"}, user_creds)
+    user_creds.close()
+
+    print("{:>8} {:>9} {:>9} {:>12} {:>10} {:>10} {:>9}".format(
+        "workers", "articles", "seconds", "articles/s", "p50 ms", "p99 ms", "db s"))
+    try:
+        for num_workers in args.workers:
+            client = MongoClient(args.mongo_uri) if args.mongo_uri else mongomock.MongoClient()
+            client.drop_database("matstract_bench")
+            db = client.matstract_bench
+            db.elsevier_log.insert_many([{"year": str(2000 + i), "issn": "0000-0000", "num_articles": args.articles,
+                                          "status": "incomplete"} for i in range(args.blocks)])
+            result = run(db, user_creds.name, num_workers, args.checkpoint_every, args.blocks)
+            print("{workers:>8} {articles:>9} {seconds:>9.2f} {rate:>12.1f} {p50_ms:>10.1f} {p99_ms:>10.1f} "
+                  "{db:>9.3f}".format(p50_ms=result["p50"] * 1e3, p99_ms=result["p99"] * 1e3, **result))
+            client.drop_database("matstract_bench")
+        print("API calls: {calls}, throttled: {throttled}, retried: {retried}, failed: {failed}".format(
+            **scopus.LIMITER.stats()))
+    finally:
+        os.remove(user_creds.name)
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
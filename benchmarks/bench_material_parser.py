@@ -0,0 +1,65 @@
+"""
+Benchmark of MaterialParser.parse_many against get_chemical_structure called on every mention.
+
+Parses a list of mentions like those of a corpus (formulas with fractional and variable amounts, mixtures, names
+resolved from the PubChem cache, repeated with a Zipf-like frequency) and reports mentions per second. PubChem is
+not queried: the cache is a temporary database filled beforehand and read offline.
+
+    python -m benchmarks.bench_material_parser --mentions 100000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from matstract.extract.pubchem import NameCache
+from matstract.extract.parsing import MaterialParser
+
+FORMULAS = ["LiFePO4", "Li1-xFexPO4", "Li3Fe2(PO4)3", "Sr(Zr0.5Ti0.5)O3", "La0.7Sr0.3MnO3", "Ba1-xSrxTiO3",
+            "YBa2Cu3O7-δ", "Li(Ni1/3Mn1/3Co1/3)O2", "(Bi0.5Na0.5)1-xBaxTiO3", "Cu2-xSe", "Pb(Zr0.52Ti0.48)O3",
+            "Li4+xTi5O12", "Ca(NO3)2", "Zn1-xMgxO", "Mg2Si1-xSnx", "Ce1-xGdxO2-x/2", "TiO2", "Bi2Te3", "GaN",
+            "CH3NH3PbI3", "Li7La3Zr2O12", "Al2(SO4)3", "Nd2Fe14B", "LiNi0.8Co0.15Al0.05O2", "(1-x)BaTiO3-xSrTiO3",
+            "BaTiO3-SrTiO3", "CuSO4⋅5H2O", "Fe[CN]6"]
+
+NAMES = {"lithium cobalt oxide": "CoLiO2", "titanium dioxide": "O2Ti", "zinc oxide": "OZn", "graphene": None,
+         "perovskite": None, "silicon": "Si"}
+
+
+def mentions(n, rng):
+    vocabulary = FORMULAS + list(NAMES)
+    # rarer mentions get a number suffix so that the corpus has a long tail of distinct mentions
+    weights = [1. / (rank + 1) for rank in range(len(vocabulary))]
+    picked = rng.choices(vocabulary, weights, k=n)
+    return [m if rng.random() > 0.05 or m in NAMES else m + str(rng.randint(2, 9)) for m in picked]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--mentions", type=int, default=100000)
+    args = arg_parser.parse_args()
+
+    corpus = mentions(args.mentions, random.Random(0))
+    with tempfile.TemporaryDirectory() as directory:
+        cache = NameCache(os.path.join(directory, "names.sqlite"), offline=True)
+        for name, formula in NAMES.items():
+            cache.put(name, formula)
+        parser = MaterialParser(pubchem_cache=cache)
+
+        t0 = time.perf_counter()
+        expected = [parser.get_chemical_structure(m) for m in corpus]
+        single_rate = len(corpus) / (time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        structures = parser.parse_many(corpus)
+        batch_rate = len(corpus) / (time.perf_counter() - t0)
+
+    print("{} mentions, {} distinct".format(len(corpus), len(structures)))
+    print("{:<24} {:>14}".format("", "mentions/s"))
+    print("{:<24} {:>14,.0f}".format("get_chemical_structure", single_rate))
+    print("{:<24} {:>14,.0f}".format("parse_many", batch_rate))
+    print("speedup {:.1f}x, {} disagreements".format(
+        batch_rate / single_rate, sum(structures[m] != s for m, s in zip(corpus, expected))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Latency of named entity tagging of an abstract with FeatureGenerator.predict_sentence against transform per word.
+
+Tags a typical abstract the way the extract_ne web callback does, with the pickled feature generator and classifier
+of matstract/nlp. The words are first tagged one by one with transform, which parses the sentence with
+ChemDataExtractor for every word, then a sentence at a time with predict_sentence. Reports the milliseconds per
+abstract and the number of ChemDataExtractor parses.
+
+    python -m benchmarks.bench_ner_features --repeat 3
+"""
+import _pickle
+import argparse
+import os
+import time
+from unittest import mock
+from chemdataextractor.doc import Text
+from matstract.extract.parsing import TextParser
+
+ABSTRACT = """Olivine LiFePO4 is a promising cathode material for lithium ion batteries because of its low cost,
+high thermal stability and theoretical capacity of 170 mAh g−1. However, its low electronic conductivity limits the
+rate capability. Here, carbon coated LiFe1-xMnxPO4 (x = 0, 0.2, 0.4) nanoparticles were synthesized by a sol-gel
+method and annealed at 700 °C under Ar. X-ray diffraction shows that Mn substitutes Fe without impurity phases such
+as Li3PO4 or Fe2P. The LiFe0.8Mn0.2PO4/C electrode delivers 158 mAh g−1 at 0.1 C and retains 95% of its capacity after
+500 cycles at 5 C, which we attribute to the faster Li diffusion measured by cyclic voltammetry and impedance
+spectroscopy."""
+
+NLP = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'matstract', 'nlp')
+
+
+def tag_per_word(feature_generator, clf, tagged_tokens):
+    tags = []
+    for sent in tagged_tokens:
+        prev_bio = '<out_of_bounds>'
+        for idx, word_tag in enumerate(sent):
+            prev_bio = clf.predict(feature_generator.transform(word_tag, sent, idx, prev_bio))[0]
+            tags.append(prev_bio)
+    return tags
+
+
+def tag_per_sentence(feature_generator, clf, tagged_tokens):
+    return [tag for sent in tagged_tokens for tag in feature_generator.predict_sentence(sent, clf)]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    args = arg_parser.parse_args()
+
+    with open(os.path.join(NLP, 'lr_classifier.p'), 'rb') as f:
+        clf = _pickle.load(f)
+    with open(os.path.join(NLP, 'feature_generator.p'), 'rb') as f:
+        feature_generator = _pickle.load(f)
+    tagged_tokens = Text(ABSTRACT).pos_tagged_tokens
+    # loads the ChemDataExtractor models
+    TextParser().extract_chemdata(ABSTRACT)
+
+    extract_chemdata = TextParser.extract_chemdata
+    print("{} sentences, {} words".format(len(tagged_tokens), sum(len(sent) for sent in tagged_tokens)))
+    print("{:<14} {:>12} {:>12}".format("", "ms/abstract", "CDE parses"))
+    results = []
+    for name, tag in [("transform", tag_per_word), ("sentence", tag_per_sentence)]:
+        with mock.patch.object(TextParser, "extract_chemdata", autospec=True,
+                               side_effect=extract_chemdata) as parses:
+            t0 = time.perf_counter()
+            for _ in range(args.repeat):
+                tags = tag(feature_generator, clf, tagged_tokens)
+            latency = (time.perf_counter() - t0) / args.repeat
+        results.append((latency, tags))
+        print("{:<14} {:>12,.1f} {:>12}".format(name, latency * 1e3, parses.call_count // args.repeat))
+    (per_word, expected), (per_sentence, tags) = results
+    print("speedup {:.1f}x, {} disagreements".format(per_word / per_sentence,
+                                                    sum(a != b for a, b in zip(expected, tags))))
+
+
+if __name__ == '__main__':
+    main()
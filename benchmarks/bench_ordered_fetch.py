@@ -0,0 +1,62 @@
+"""
+Benchmark of reordering search results into Elasticsearch rank order.
+
+Compares the former list.index based sort (O(n^2)) with the position dictionary used by sort_results and
+iter_ordered, for documents returned in arbitrary order by a $in query. iter_ordered is also timed end to end
+against mongomock (or a local mongod with --mongo-uri) for the sizes up to --max-db-size.
+
+    python -m benchmarks.bench_ordered_fetch --sizes 1000 10000 100000
+"""
+import argparse
+import random
+import time
+import mongomock
+from bson import ObjectId
+from pymongo import MongoClient
+from matstract.models.database import sort_results, iter_ordered
+
+
+def index_sort(results, ids):
+    return sorted(results, key=lambda k: ids.index(k['_id']))
+
+
+def best_of(func, repeat=3):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    arg_parser.add_argument("--max-quadratic-size", type=int, default=10000,
+                            help="largest size timed with the list.index sort")
+    arg_parser.add_argument("--max-db-size", type=int, default=10000, help="largest size fetched from the db")
+    arg_parser.add_argument("--mongo-uri", default=None, help="use this mongod instead of mongomock")
+    args = arg_parser.parse_args()
+
+    print("{:>8} {:>16} {:>16} {:>18}".format("ids", "list.index ms", "positions ms", "iter_ordered ms"))
+    for n in args.sizes:
+        ids = [ObjectId() for _ in range(n)]
+        results = [{"_id": id, "title": "title", "year": 2018} for id in ids]
+        random.shuffle(results)
+
+        old = best_of(lambda: index_sort(results, ids), 1) if n <= args.max_quadratic_size else float('nan')
+        new = best_of(lambda: sort_results(results, ids))
+
+        fetch = float('nan')
+        if n <= args.max_db_size:
+            client = MongoClient(args.mongo_uri) if args.mongo_uri else mongomock.MongoClient()
+            collection = client.matstract_bench.abstracts
+            collection.drop()
+            collection.insert_many(results)
+            fetch = best_of(lambda: sum(1 for _ in iter_ordered(collection, ids, projection=["title", "year"])), 1)
+            collection.drop()
+        print("{:>8} {:>16.1f} {:>16.1f} {:>18.1f}".format(n, old * 1e3, new * 1e3, fetch * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark of the bytes moved and BSON decode time per page of search results, with and without a projection.
+
+Uses synthetic abstract documents shaped like those of the abstracts collection (raw and cleaned abstract,
+tokenized title/abstract, chemical mentions and display fields) and measures the encoded size and decode time
+of a page of results for the full documents and for the TABLE_FIELDS projection. With --mongo-uri the page is
+also fetched from a local mongod through AtlasConnection-style find queries.
+
+    python -m benchmarks.bench_projection --page-size 100
+"""
+import argparse
+import random
+import string
+import time
+import bson
+from bson import ObjectId
+from pymongo import MongoClient
+from matstract.models.database import iter_ordered
+from matstract.models.search import TABLE_FIELDS
+
+
+def words(n):
+    return [''.join(random.choice(string.ascii_lowercase) for _ in range(random.randint(2, 10))) for _ in range(n)]
+
+
+def abstract_document():
+    abstract = " ".join(words(220))
+    title = " ".join(words(14))
+    return {"_id": ObjectId(), "doi": "10.1016/j.bench.{}".format(random.randint(0, 10 ** 9)),
+            "title": title, "abstract": abstract, "raw_abstract": "\n               Abstract\n  " + abstract,
+            "authors": [" ".join(words(2)) for _ in range(6)], "year": "2017", "journal": "Acta Materialia",
+            "link": "https://www.sciencedirect.com/science/article/pii/S1359645417300000",
+            "subjects": words(4), "pulled_on": "2018-02-01T12:00:00", "pulled_by": "First Last",
+            "tokens": {"title": [words(14)], "abstract": [words(22) for _ in range(10)]},
+            "chem_mentions": [{"names": [w], "labels": [{"type": "CHM"}]} for w in words(15)]}
+
+
+def project(doc, fields):
+    return {k: v for k, v in doc.items() if k == "_id" or k in fields}
+
+
+def best_of(func, repeat=20):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--page-size", type=int, default=100)
+    arg_parser.add_argument("--mongo-uri", default=None, help="also time fetching the page from this mongod")
+    args = arg_parser.parse_args()
+
+    docs = [abstract_document() for _ in range(args.page_size)]
+    pages = [("full documents", docs), ("TABLE_FIELDS", [project(d, TABLE_FIELDS) for d in docs])]
+    collection = None
+    if args.mongo_uri:
+        collection = MongoClient(args.mongo_uri).matstract_bench.abstracts
+        collection.drop()
+        collection.insert_many(docs)
+    ids = [d["_id"] for d in docs]
+
+    print("{:<16} {:>10} {:>12} {:>12}".format("", "kB/page", "decode ms", "fetch ms"))
+    for (name, page), projection in zip(pages, [None, TABLE_FIELDS]):
+        encoded = [bson.encode(d) for d in page]
+        decode = best_of(lambda: [bson.decode(e) for e in encoded])
+        fetch = float('nan')
+        if collection is not None:
+            fetch = best_of(lambda: list(iter_ordered(collection, ids, projection=projection)), 5)
+        print("{:<16} {:>10.1f} {:>12.2f} {:>12.1f}".format(
+            name, sum(len(e) for e in encoded) / 1e3, decode * 1e3, fetch * 1e3))
+    if collection is not None:
+        collection.drop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Micro-benchmark of ScopusArticle parsing: full ElementTree vs. the streaming coredata parser.
+
+The saved sample article is padded with paragraphs of body text to mimic FULL-view responses.
+
+    python -m benchmarks.bench_scopus_parsing --paragraphs 2000 --repeat 50
+"""
+import argparse
+import os
+import timeit
+import tracemalloc
+from matstract.collect.scopus import ScopusArticle
+
+SAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'matstract', 'collect', 'tests',
+                      'article.xml')
+
+
+def full_text_article(paragraphs):
+    xml = open(SAMPLE, 'r').read()
+    para = "<ce:para>Single crystals of LiFePO4 were grown by the floating zone method and annealed at " \
+           "<ce:italic>T</ce:italic> = 700 K for 12 h.</ce:para>\n"
+    return xml.replace("</xocs:serial-item>", para * paragraphs + "</xocs:serial-item>")
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--paragraphs", type=int, default=2000)
+    arg_parser.add_argument("--repeat", type=int, default=50)
+    args = arg_parser.parse_args()
+
+    content = full_text_article(args.paragraphs)
+    modes = [("tree", dict()),
+             ("streaming, with body", dict(streaming=True, body=True)),
+             ("streaming, abstract only", dict(streaming=True, body=False))]
+    print("{:.0f} kB of XML, {} runs each".format(len(content.encode('utf-8')) / 1e3, args.repeat))
+    for name, kwargs in modes:
+        parse = lambda: ScopusArticle("sample", content=content, **kwargs)
+        seconds = min(timeit.repeat(parse, number=1, repeat=args.repeat))
+        print("{:<26} {:8.2f} ms {:10.0f} kB peak".format(name, seconds * 1e3, peak_memory(parse) / 1e3))
+
+
+if __name__ == '__main__':
+    main()
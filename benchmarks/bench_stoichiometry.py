@@ -0,0 +1,57 @@
+"""
+Benchmark of MaterialParser.parse_formula with the linear stoichiometry evaluator against sympy.
+
+Parses a stream of formulas like those of abstracts (integer, fractional and variable amounts, parentheses) with
+extract.stoichiometry.simplify, then with every amount simplified by sympy as before, and reports formulas per
+second and the number of expressions that needed sympy.
+
+    python -m benchmarks.bench_stoichiometry --formulas 2000
+"""
+import argparse
+import random
+import time
+from unittest import mock
+from matstract.extract import stoichiometry
+from matstract.extract.parsing import MaterialParser
+
+FORMULAS = ["LiFePO4", "Li1-xFexPO4", "Li3Fe2(PO4)3", "Sr(Zr0.5Ti0.5)O3", "La0.7Sr0.3MnO3", "Ba1-xSrxTiO3",
+            "YBa2Cu3O7-δ", "Li(Ni1/3Mn1/3Co1/3)O2", "(Bi0.5Na0.5)1-xBaxTiO3", "Cu2-xSe", "Pb(Zr0.52Ti0.48)O3",
+            "Li4+xTi5O12", "Ca(NO3)2", "Zn1-xMgxO", "Mg2Si1-xSnx", "Ce1-xGdxO2-x/2", "TiO2", "Bi2Te3", "GaN",
+            "CH3NH3PbI3", "Li7La3Zr2O12", "Al2(SO4)3", "Nd2Fe14B", "LiNi0.8Co0.15Al0.05O2"]
+
+
+def throughput(parser, formulas):
+    t0 = time.perf_counter()
+    results = [dict(parser.parse_formula(f)) for f in formulas]
+    return len(formulas) / (time.perf_counter() - t0), results
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--formulas", type=int, default=2000)
+    args = arg_parser.parse_args()
+
+    random.seed(0)
+    formulas = [random.choice(FORMULAS) for _ in range(args.formulas)]
+    parser = MaterialParser()
+    fallbacks = []
+    simplify_with_sympy = stoichiometry.sympy_simplify
+
+    def sympy_simplify(expression):
+        fallbacks.append(expression)
+        return simplify_with_sympy(expression)
+
+    with mock.patch.object(stoichiometry, "sympy_simplify", sympy_simplify):
+        linear_rate, results = throughput(parser, formulas)
+    with mock.patch.object(stoichiometry, "simplify", simplify_with_sympy):
+        sympy_rate, expected = throughput(parser, formulas)
+
+    print("{:<8} {:>14}".format("", "formulas/s"))
+    print("{:<8} {:>14,.0f}".format("sympy", sympy_rate))
+    print("{:<8} {:>14,.0f}".format("linear", linear_rate))
+    print("speedup {:.1f}x, {} expressions simplified by sympy, {} disagreements".format(
+        linear_rate / sympy_rate, len(fallbacks), sum(a != b for a, b in zip(expected, results))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+import gzip
+import hashlib
+import os
+import tempfile
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class CacheMiss(LookupError):
+    """ Raised in offline mode when a response is not in the cache. """
+    pass
+
+
+class XMLCache(object):
+    """ On-disk, compressed cache of raw Elsevier API responses keyed on DOI.
+
+    Each response is stored in its own file named after the SHA-1 of the DOI, compressed with zstd if the
+    zstandard package is installed (gzip otherwise). Reading a file refreshes its modification time, and when the
+    cache grows beyond max_bytes the least recently used files are evicted.
+
+    In offline mode the cache is the only source of content: a miss raises CacheMiss instead of going to the
+    network, so a collection can be replayed without network access.
+    """
+
+    def __init__(self, directory, max_bytes=10 * 1024 ** 3, offline=False, compression=None):
+        """
+        Args:
+            directory: (str) directory holding the cache. Created if it does not exist.
+            max_bytes: (int) size bound of the cache on disk. Default is 10 GB.
+            offline: (bool) whether misses should raise CacheMiss instead of being downloaded. Default is False.
+            compression: (str, optional) "zstd" or "gzip". Defaults to zstd if available.
+        """
+        if compression is None:
+            compression = "zstd" if zstandard is not None else "gzip"
+        if compression == "zstd" and zstandard is None:
+            raise ImportError("zstd compression requires the zstandard package.")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.compression = compression
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0}
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(os.path.getsize(path) for path in self._files())
+
+    def _files(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith((".gz", ".zst")):
+                    yield os.path.join(root, name)
+
+    def _path(self, doi, extension):
+        key = hashlib.sha1(doi.lower().encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key[:2], key + extension)
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def __contains__(self, doi):
+        return any(os.path.exists(self._path(doi, ext)) for ext in (".zst", ".gz"))
+
+    def get(self, doi):
+        """ Returns the cached response for doi, or None if it is not cached. """
+        for extension in (".zst", ".gz"):
+            path = self._path(doi, extension)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                # evicted by another thread after the read, the data is still valid
+                pass
+            self._count("hits")
+            if extension == ".gz":
+                return gzip.decompress(data).decode('utf-8')
+            if zstandard is None:
+                raise ImportError("Cached response {} is zstd compressed; install zstandard.".format(path))
+            return zstandard.ZstdDecompressor().decompress(data).decode('utf-8')
+        self._count("misses")
+        return None
+
+    def put(self, doi, content):
+        """ Stores the response for doi, evicting least recently used responses if the cache is full. """
+        data = content.encode('utf-8')
+        if self.compression == "zstd":
+            data, path = zstandard.ZstdCompressor(level=10).compress(data), self._path(doi, ".zst")
+        else:
+            data, path = gzip.compress(data), self._path(doi, ".gz")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._size += len(data) - old_size
+            full = self._size > self.max_bytes
+        if full:
+            self.evict()
+
+    def evict(self, target=0.9):
+        """ Deletes least recently used responses until the cache is below target * max_bytes. """
+        with self._lock:
+            files = sorted(((os.stat(path), path) for path in self._files()), key=lambda f: f[0].st_mtime)
+            self._size = sum(stat.st_size for stat, _ in files)
+            for stat, path in files:
+                if self._size <= target * self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                self._size -= stat.st_size
+                self.counters["evictions"] += 1
+
+    def size(self):
+        """ Returns the size of the cache on disk in bytes. """
+        with self._lock:
+            return self._size
@@ -0,0 +1,191 @@
+import random
+import re
+import threading
+import time
+import datetime
+from email.utils import parsedate_to_datetime
+from requests.exceptions import HTTPError, ConnectionError, Timeout
+
+
+class TokenBucket(object):
+    """ Token bucket allowing on average `rate` calls per second with bursts of up to `capacity` calls. """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        """
+        Args:
+            rate: (float) tokens added to the bucket per second.
+            capacity: (float, optional) maximum number of tokens in the bucket. Defaults to rate.
+            clock: (callable) monotonic clock returning seconds.
+            sleep: (callable) function used to wait for tokens.
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, tokens=1):
+        """ Takes tokens from the bucket, blocking until they are available.
+
+        Args:
+            tokens: (float) number of tokens to take. Default is 1.
+
+        Returns:
+            (float) number of seconds spent waiting.
+
+        """
+        waited = 0.
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            self._sleep(delay)
+            waited += delay
+
+
+def status_code(error):
+    """ Returns the HTTP status code of a failed request, or None if it cannot be determined.
+
+    elsapy raises HTTPErrors without a response attached, so the code is parsed from the message instead.
+
+    Args:
+        error: (Exception) exception raised by the request.
+
+    Returns:
+        (int) status code or None
+
+    """
+    response = getattr(error, "response", None)
+    if response is not None:
+        return response.status_code
+    match = re.match(r"HTTP (\d{3}) Error", str(error))
+    return int(match.group(1)) if match else None
+
+
+def retry_after(error):
+    """ Returns the number of seconds requested by the Retry-After header of a failed response, or None.
+
+    Args:
+        error: (Exception) exception raised by the request.
+
+    Returns:
+        (float) seconds to wait or None
+
+    """
+    response = getattr(error, "response", None)
+    if response is None or response.headers.get("Retry-After") is None:
+        return None
+    value = response.headers["Retry-After"]
+    try:
+        return max(0., float(value))
+    except ValueError:
+        try:
+            date = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0., (date - datetime.datetime.now(date.tzinfo)).total_seconds())
+
+
+class RateLimiter(object):
+    """ Shared throttle and retry layer for Elsevier API calls.
+
+    Keeps one token bucket per API key, so that all threads of a collector share the key's quota, and retries
+    throttled (429), server-side (5xx) and connection failures with exponential backoff and full jitter,
+    honouring the Retry-After header when the API sends one.
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, rate=9, capacity=None, max_retries=5, backoff_base=1., backoff_max=60.,
+                 clock=time.monotonic, sleep=time.sleep):
+        """
+        Args:
+            rate: (float) requests per second allowed per API key. Default is 9.
+            capacity: (float, optional) burst size per API key. Defaults to rate.
+            max_retries: (int) maximum number of retries of a single call. Default is 5.
+            backoff_base: (float) backoff in seconds before the first retry. Default is 1.
+            backoff_max: (float) upper bound of the backoff in seconds. Default is 60.
+            clock: (callable) monotonic clock returning seconds.
+            sleep: (callable) function used for waiting.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._clock = clock
+        self._sleep = sleep
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.counters = {"calls": 0, "throttled": 0, "throttled_seconds": 0., "retried": 0, "failed": 0}
+
+    def bucket(self, key):
+        """ Returns the token bucket of an API key, creating it on first use. """
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = TokenBucket(self.rate, self.capacity, clock=self._clock, sleep=self._sleep)
+            return self._buckets[key]
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def stats(self):
+        """ Returns a snapshot of the counters. """
+        with self._lock:
+            return dict(self.counters)
+
+    def backoff(self, attempt, error=None):
+        """ Returns the number of seconds to wait before retry number attempt (starting at 0). """
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        requested = retry_after(error) if error is not None else None
+        if requested is not None:
+            delay = max(delay, min(requested, self.backoff_max))
+        return delay
+
+    def is_retryable(self, error):
+        if isinstance(error, (ConnectionError, Timeout)):
+            return True
+        return isinstance(error, HTTPError) and status_code(error) in self.RETRY_STATUSES
+
+    def call(self, func, key=None):
+        """ Calls func under the rate limit of key, retrying transient failures.
+
+        Args:
+            func: (callable) function without arguments performing a single API request.
+            key: (str) API key the request is charged to.
+
+        Returns:
+            The return value of func.
+
+        Raises:
+            The last exception raised by func if it is not retryable or the retries are exhausted.
+
+        """
+        bucket = self.bucket(key)
+        attempt = 0
+        while True:
+            waited = bucket.acquire()
+            self._count("calls")
+            if waited > 0:
+                self._count("throttled")
+                self._count("throttled_seconds", waited)
+            try:
+                return func()
+            except Exception as e:
+                if attempt >= self.max_retries or not self.is_retryable(e):
+                    self._count("failed")
+                    raise
+                self._sleep(self.backoff(attempt, e))
+                self._count("retried")
+                attempt += 1
@@ -0,0 +1,165 @@
+import datetime
+import os
+import socket
+import threading
+from contextlib import contextmanager
+from pymongo import ReturnDocument
+
+
+def worker_id(user):
+    """ Returns an id for the current collector process, e.g. "First Last@hostname:1234". """
+    return "{}@{}:{}".format(user, socket.gethostname(), os.getpid())
+
+
+class BlockScheduler(object):
+    """ Work queue of year/ISSN blocks stored in the elsevier_log collection.
+
+    A worker claims a block with a single atomic find_one_and_update, which sets the block "in progress" and gives
+    the worker a lease on it until lease_expires. While the block is being collected the lease is renewed by a
+    heartbeat thread. Blocks whose lease has expired (e.g. because their worker crashed) are claimable again, so
+    any number of collector processes can share the queue.
+    """
+
+    def __init__(self, log, worker, lease_seconds=600):
+        """
+        Args:
+            log: (pymongo.collection.Collection) the elsevier_log collection.
+            worker: (str) id of this worker, see worker_id.
+            lease_seconds: (float) duration of a lease. Default is 600.
+        """
+        self.log = log
+        self.worker = worker
+        self.lease_seconds = lease_seconds
+
+    def _now(self):
+        return datetime.datetime.utcnow()
+
+    def _expired(self):
+        # blocks left in progress by workers predating leases have no lease_expires
+        return [{"status": "in progress", "lease_expires": {"$lt": self._now()}},
+                {"status": "in progress", "lease_expires": {"$exists": False}}]
+
+    def _claimable(self, max_block_size):
+        return {"num_articles": {"$lt": max_block_size},
+                "$or": [{"status": "incomplete"}] + self._expired()}
+
+    def claim(self, max_block_size=100):
+        """ Claims the largest claimable block smaller than max_block_size.
+
+        Args:
+            max_block_size: (int) maximum number of articles in block. Default is 100.
+
+        Returns:
+            (dict) the claimed log entry, or None if there are no claimable blocks.
+
+        """
+        now = self._now()
+        return self.log.find_one_and_update(
+            self._claimable(max_block_size),
+            {"$set": {"status": "in progress", "lease_owner": self.worker,
+                      "lease_expires": now + datetime.timedelta(seconds=self.lease_seconds),
+                      "updated_by": self.worker, "updated_on": now.isoformat()},
+             "$inc": {"attempts": 1}},
+            sort=[("num_articles", -1)],
+            return_document=ReturnDocument.AFTER)
+
+    def remaining(self, max_block_size=100):
+        """ Returns the number of claimable blocks smaller than max_block_size. """
+        return self.log.count_documents(self._claimable(max_block_size))
+
+    def _owned(self, block):
+        return {"_id": block["_id"], "status": "in progress", "lease_owner": self.worker}
+
+    def heartbeat(self, block):
+        """ Renews the lease on block.
+
+        Returns:
+            (bool) False if the lease has been lost to another worker.
+
+        """
+        expires = self._now() + datetime.timedelta(seconds=self.lease_seconds)
+        return self.log.update_one(self._owned(block), {"$set": {"lease_expires": expires}}).matched_count == 1
+
+    def checkpoint(self, block, progress):
+        """ Records the progress of the collection of block in its log entry and renews the lease.
+
+        Args:
+            block: (dict) a block returned by claim.
+            progress: (dict) progress of the collection, see scopus.collect_block. The batch statistics are not
+                stored.
+
+        Returns:
+            (bool) False if the lease has been lost to another worker.
+
+        """
+        now = self._now()
+        checkpoint = {k: v for k, v in progress.items() if k != "batches"}
+        checkpoint["updated_on"] = now.isoformat()
+        result = self.log.update_one(self._owned(block),
+                                     {"$set": {"checkpoint": checkpoint,
+                                               "lease_expires": now + datetime.timedelta(seconds=self.lease_seconds)}})
+        return result.matched_count == 1
+
+    def complete(self, block):
+        """ Marks block as complete.
+
+        Returns:
+            (bool) False if the lease had been lost to another worker, in which case the block is left alone.
+
+        """
+        date = self._now().isoformat()
+        result = self.log.update_one(self._owned(block),
+                                     {"$set": {"status": "complete", "completed_by": self.worker,
+                                               "completed_on": date, "updated_by": self.worker, "updated_on": date},
+                                      "$unset": {"lease_owner": "", "lease_expires": ""}})
+        return result.matched_count == 1
+
+    def release(self, block):
+        """ Puts block back in the queue. """
+        self.log.update_one(self._owned(block),
+                            {"$set": {"status": "incomplete", "updated_by": self.worker,
+                                      "updated_on": self._now().isoformat()},
+                             "$unset": {"lease_owner": "", "lease_expires": ""}})
+
+    def requeue_expired(self):
+        """ Puts all blocks with an expired lease, or without a lease, back in the queue.
+
+        Returns:
+            (int) number of requeued blocks.
+
+        """
+        return self.log.update_many({"$or": self._expired()},
+                                    {"$set": {"status": "incomplete"},
+                                     "$unset": {"lease_owner": "", "lease_expires": ""}}).modified_count
+
+    @contextmanager
+    def lease(self, block, interval=None):
+        """ Keeps the lease on block alive while the body of the with statement runs.
+
+        The block is released back to the queue if the body raises.
+
+        Args:
+            block: (dict) a block returned by claim.
+            interval: (float, optional) seconds between heartbeats. Defaults to a third of the lease.
+
+        """
+        interval = self.lease_seconds / 3. if interval is None else interval
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(interval):
+                if not self.heartbeat(block):
+                    print("Lost lease on block {}.".format(block["_id"]))
+                    return
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield block
+        except BaseException:
+            stop.set()
+            self.release(block)
+            raise
+        finally:
+            stop.set()
+            thread.join()
@@ -1,11 +1,22 @@
 import requests
+import collections
+import io
+import itertools
 import json
+import os
+import threading
 import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from requests.adapters import HTTPAdapter
 from requests.exceptions import HTTPError
-from elsapy.elsclient import ElsClient
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError
 from matstract.models.database import AtlasConnection
-from elsapy.elssearch import ElsSearch
+from matstract.collect.ratelimit import RateLimiter
+from matstract.collect.cache import XMLCache, CacheMiss
+from matstract.collect.scheduler import BlockScheduler, worker_id
 import datetime
+import time
 from tqdm import tqdm
 import re
 
@@ -24,12 +35,51 @@ namespaces = {'dtd': 'http://www.elsevier.com/xml/svapi/abstract/dtd',
               'atom': 'http://www.w3.org/2005/Atom',
               'opensearch': 'http://a9.com/-/spec/opensearch/1.1/'}
 
-config = json.load(open('matstract/collect/scopus_config.json', 'r'))
+try:
+    config_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scopus_config.json')
+    config = json.load(open(config_file, 'r'))
+except FileNotFoundError:
+    config = {"apikey": os.environ.get("ELSEVIER_APIKEY", ""),
+              "insttoken": os.environ.get("ELSEVIER_INSTTOKEN", "")}
 APIKEY = config["apikey"]
 
-## Initialize client
-CLIENT = ElsClient(config['apikey'], num_res=100)
-CLIENT.inst_token = config['insttoken']
+# Throttle and retry layer shared by all Elsevier API calls of this process.
+LIMITER = RateLimiter(rate=config.get("requests_per_second", 9), max_retries=config.get("max_retries", 5))
+
+# Local cache of raw API responses consulted by get_content. Disabled unless cache_dir is configured.
+CACHE = XMLCache(config["cache_dir"], max_bytes=config.get("cache_max_bytes", 10 * 1024 ** 3),
+                 offline=config.get("offline", False)) if config.get("cache_dir") else None
+
+# Article retrieval and search endpoints. Override to point the collector at a mirror or a stub server.
+ARTICLE_URL = "https://api.elsevier.com/content/article/doi/{}"
+SEARCH_URL = "https://api.elsevier.com/content/search/scopus"
+
+
+class ScopusServiceError(ValueError):
+    """ Raised when the article retrieval API answers with a service-error document instead of the article. """
+    pass
+
+
+def make_session(pool_size=10):
+    """
+    Builds a requests Session whose connection pool can hold pool_size keep-alive connections, so that
+    concurrent downloads reuse TCP/TLS connections instead of opening a new one per article.
+
+    Args:
+        pool_size: (int) maximum number of pooled connections per host. Default is 10.
+
+    Returns:
+        (requests.Session) session with the pooled adapter mounted for http and https.
+
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+SESSION = make_session()
 
 
 def check_scopus_collection(year, issn):
@@ -80,6 +130,83 @@ def build_scopus_query(year=None, issn=None):
     return base + y + i
 
 
+class ScopusSearch(object):
+    """ A Scopus search that yields the DOIs of its results page by page.
+
+    Pages are requested lazily with the cursor-based pagination of the Scopus Search API, so the first DOIs are
+    available (and their articles can be downloaded) while later pages are still to be fetched, and searches are not
+    capped at 5,000 results. Callers that report which DOIs they are done with (see done) can save resume_token
+    and pass it as cursor to continue a large search where it stopped.
+    """
+
+    def __init__(self, query, cursor="*", count=100):
+        """
+        Args:
+            query: (str) Scopus query string, see build_scopus_query.
+            cursor: (str) cursor of the first page, e.g. a saved resume_token. Default is "*" (from the start).
+            count: (int) number of results per page. Default is 100.
+        """
+        self.query = query
+        self.cursor = cursor
+        self.count = count
+        self.total = None
+        self._pending = collections.OrderedDict()
+        self._next = cursor
+        self._lock = threading.Lock()
+
+    def pages(self):
+        """ Yields the list of DOIs of each page of results.
+
+        If the API rejects the cursor the search was resumed from, e.g. because it expired, the search starts over
+        from the first page.
+        """
+        cursor = self.cursor
+        while cursor is not None:
+            params = {"query": self.query, "count": self.count, "cursor": cursor, "field": "prism:doi"}
+            try:
+                results = download(SEARCH_URL, format='json', params=params).json()["search-results"]
+            except HTTPError:
+                if cursor == "*" or cursor != self.cursor:
+                    raise
+                cursor = "*"
+                continue
+            self.total = int(results.get("opensearch:totalResults", 0))
+            entries = [e for e in results.get("entry", []) if "error" not in e]
+            dois = [e["prism:doi"] for e in entries if "prism:doi" in e]
+            next_cursor = results.get("cursor", {}).get("@next")
+            if len(entries) < self.count or next_cursor == cursor:
+                next_cursor = None
+            with self._lock:
+                self._pending[cursor] = set(dois)
+                self._next = next_cursor
+            self._advance()
+            yield dois
+            cursor = next_cursor
+
+    def __iter__(self):
+        for dois in self.pages():
+            for doi in dois:
+                yield doi
+
+    def _advance(self):
+        with self._lock:
+            while self._pending and not next(iter(self._pending.values())):
+                self._pending.popitem(last=False)
+
+    def done(self, doi):
+        """ Records that the caller no longer needs doi, so that resume_token can move past its page. """
+        with self._lock:
+            for dois in self._pending.values():
+                dois.discard(doi)
+        self._advance()
+
+    @property
+    def resume_token(self):
+        """ Cursor of the first page with DOIs that are not done, or None if the search is finished. """
+        with self._lock:
+            return next(iter(self._pending)) if self._pending else self._next
+
+
 def find_articles(year=None, issn=None, get_all=True):
     """
     Returns a list of the DOI's for all articles published in the specified year and journal.
@@ -87,26 +214,20 @@ def find_articles(year=None, issn=None, get_all=True):
     Args:
         year (str): year of publication
         issn (str): ISSN (or EISSN) of journal
-        get_all (bool): Whether all results should be returned or just the 1st result. Default is True.
+        get_all (bool): Whether all results should be returned or just the 1st page of results. Default is True.
 
     Returns:
         dois (str): The dois for all articles published in corresponding journal in the specified year
 
     """
 
-    query = build_scopus_query(year=year, issn=issn)
-    search = ElsSearch(query, index='scopus', )
-    search.execute(els_client=CLIENT, get_all=get_all)
-    dois = []
-    for r in search.results:
-        try:
-            dois.append(r['prism:doi'])
-        except:
-            continue
-    return dois
+    pages = ScopusSearch(build_scopus_query(year=year, issn=issn)).pages()
+    if not get_all:
+        pages = itertools.islice(pages, 1)
+    return [doi for dois in pages for doi in dois]
 
 
-def download(url, format='xml', params=None):
+def download(url, format='xml', params=None, session=None):
     """
     Helper function to download a file and return its content.
 
@@ -115,48 +236,58 @@ def download(url, format='xml', params=None):
         params: (dict, optional) Dictionary containing query parameters.  For required keys
             and accepted values see e.g.
             https://api.elsevier.com/documentation/AuthorRetrievalAPI.wadl
+        session: (requests.Session, optional) Session to send the request with. Defaults to the
+            module-level pooled SESSION.
 
     Returns:
         resp : (byte-like object)
             The content of the file, which needs to be serialized.
 
     Raises:
-        (HTTPError) If the status of the response is not ok.
+        (HTTPError) If the status of the response is not ok after retrying throttled and failed requests.
 
     """
 
+    session = SESSION if session is None else session
     header = {'Accept': 'application/{}'.format(format), 'X-ELS-APIKey': APIKEY}
-    resp = requests.get(url, headers=header, params=params)
-    resp.raise_for_status()
 
-    return resp
+    def send():
+        resp = session.get(url, headers=header, params=params)
+        resp.raise_for_status()
+        return resp
+
+    return LIMITER.call(send, APIKEY)
 
 
 def get_content(DOI, refresh=True, *args, **kwds):
     """ Helper function to read file content as xml.
 
+    Unless refresh is True, the response is read from CACHE if it is there. Downloaded responses are stored in
+    CACHE. If CACHE is in offline mode, nothing is downloaded.
+
     Args:
         input_doi (str): DOI of article
-        *args:
-        **kwds:
+        refresh (bool): Whether to download the content even if it is cached. Default is True.
+        *args: passed on to download
+        **kwds: passed on to download
 
     Returns:
         Content of returned XML file
 
+    Raises:
+        (CacheMiss) If CACHE is offline and the content is not cached.
+
     """
 
-    if not refresh:
-        db = open_db_connection()
-        elsevier = db.elsevier
-        entries = elsevier.find({"doi": DOI})
-        if len(entries):
-            if len(entries) > 1:
-                print("More than one entry for given DOI! Only using only first entry.")
-            entry = entries[0]
-            if entry["collected"]:
-                content = entry["xml"]
-                return content
+    if CACHE is not None and (not refresh or CACHE.offline):
+        content = CACHE.get(DOI)
+        if content is not None:
+            return content
+        if CACHE.offline:
+            raise CacheMiss("{} is not in the cache and the cache is offline.".format(DOI))
     content = download(*args, **kwds).text
+    if CACHE is not None:
+        CACHE.put(DOI, content)
     return content
 
 
@@ -211,9 +342,126 @@ def clean_text(text):
         return None
 
 
+# Fields of the coredata element of an article, as (attribute, prefixed tag). Each attribute of ScopusArticle is
+# set to the text of the matching element(s) of coredata.
+COREDATA_FIELDS = [
+    # Scopus URL of article
+    ("scopus_url", "prism:url"),
+    # Scopus source_id of the article
+    ("scopus_id", "dc:identifier"),
+    # EID of article
+    ("eid", "eid"),
+    # DOI of article
+    ("doi", "prism:doi"),
+    # Title of article
+    ("title", "dc:title"),
+    # Authors of Article
+    ("authors", "dc:creator"),
+    # Journal Name
+    ("journal", "prism:publicationName"),
+    # Date of publication
+    ("cover_date", "prism:coverDate"),
+    # Date of publication (cover)
+    ("cover_display_date", "prism:coverDisplayDate"),
+    # Journal ISSN (or EISSN, or both)
+    ("issn", "prism:issn"),
+    # Volume that article appears in
+    ("volume", "prism:volume"),
+    # Issue that article appears in.
+    ("issue", "prism:issueIdentifier"),
+    # Article number
+    ("article_number", "prism:number"),
+    # Page number of first page
+    ("first_page", "prism:startingPage"),
+    # Page number of last page
+    ("last_page", "prism:endingPage"),
+    # Page range of article
+    ("page_range", "prism:pageRange"),
+    # Format of Article
+    ("format", "dc:format"),
+    # Subjects of article
+    ("subjects", "dcterms:subject"),
+    # Copywrite info
+    ("copyright", "prism:copyright"),
+    # Name of publisher
+    ("publisher", "prism:publisher"),
+    # Name of issue
+    ("issue_name", "prism:IssueName"),
+    # Raw copy of abstract as returned by scopus
+    ("raw_abstract", "dc:description"),
+]
+
+ARTICLE_NS = '{http://www.elsevier.com/xml/svapi/article/dtd}'
+
+
+def _qualified_tag(tag):
+    prefix, _, local = tag.rpartition(":")
+    return "{{{}}}{}".format(namespaces[prefix], local) if prefix else ARTICLE_NS + local
+
+
+# Precompiled lookup from fully qualified tag to attribute name, used by the streaming parser.
+COREDATA_TAGS = {_qualified_tag(tag): attr for attr, tag in COREDATA_FIELDS}
+
+
+def _read_coredata_element(record, elem):
+    if elem.tag in COREDATA_TAGS:
+        record[COREDATA_TAGS[elem.tag]].append(elem.text if elem.text else "".join(elem.itertext()) or None)
+    elif elem.tag == ARTICLE_NS + 'link' and elem.get("rel") != "self":
+        record["url"] = elem.get("href")
+
+
+def parse_article(content, body=False):
+    """
+    Extracts the coredata fields of an article in a single pass over the XML, with one dict lookup per element.
+
+    Unless body is True, the XML is parsed incrementally and parsing stops at the end of coredata, so the full
+    text of FULL-view responses is never built into a tree. With body=True the document is parsed in one go (which
+    is faster than an incremental parse when all of it is needed) and the text of originalText is extracted too.
+
+    Args:
+        content: (str or bytes) XML returned by the article retrieval API.
+        body: (bool) whether to also extract the text of originalText. Default is False.
+
+    Returns:
+        record: (dict) attribute name -> text (list of texts for repeated elements, None if absent), plus
+            "url" (link to the article), "service_error" and, if body is True, "body".
+
+    """
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    record = {attr: [] for attr, _ in COREDATA_FIELDS}
+    record["url"] = None
+    record["service_error"] = None
+    coredata_tag = ARTICLE_NS + 'coredata'
+
+    if body:
+        root = ET.fromstring(content)
+        if root.tag.endswith('service-error'):
+            record["service_error"] = root
+        coredata = root.find(coredata_tag)
+        for elem in coredata if coredata is not None else []:
+            _read_coredata_element(record, elem)
+        original_text = root.find(ARTICLE_NS + 'originalText')
+        record["body"] = " ".join("".join(original_text.itertext()).split()) if original_text is not None else None
+    else:
+        elem = None
+        for _, elem in ET.iterparse(io.BytesIO(content), events=("end",)):
+            if elem.tag == coredata_tag:
+                break
+            _read_coredata_element(record, elem)
+        else:
+            if elem is not None and elem.tag.endswith('service-error'):
+                record["service_error"] = elem
+
+    for attr, _ in COREDATA_FIELDS:
+        values = record[attr]
+        record[attr] = None if len(values) == 0 else values[0] if len(values) == 1 else values
+    return record
+
+
 class ScopusArticle(object):
 
-    def __init__(self, input_doi='', refresh=True):
+    def __init__(self, input_doi='', refresh=True, session=None, content=None, streaming=False, body=True):
         """
         A class that represents a Scopus article.
 
@@ -222,210 +470,347 @@ class ScopusArticle(object):
             input_doi: (str) DOI of article
 
             refresh: (bool) Whether the article should be pulled from scopus or whether it should be
-                    pulled from the mongodb.
+                    pulled from the local cache (see get_content).
+
+            session: (requests.Session, optional) Session used to download the article.
+
+            content: (str, optional) XML of the article. If given, nothing is downloaded.
+
+            streaming: (bool) Whether to extract the fields with parse_article instead of building the full
+                    ElementTree and searching it field by field. self.xml is None in that case.
+
+            body: (bool) Whether parse_article should also extract the full text into self.body. Set to False
+                    when only the abstract metadata is needed, so that parsing stops after coredata.
         """
 
-        url = "https://api.elsevier.com/content/article/doi/{}".format(input_doi)
+        url = ARTICLE_URL.format(input_doi)
         self.retrieval_url = url
 
-        params = {'view': "FULL"}
-        xml = ET.fromstring(get_content(input_doi, url=url, refresh=refresh, params=params))
+        if content is None:
+            params = {'view': "FULL"}
+            content = get_content(input_doi, url=url, refresh=refresh, params=params, session=session)
+
+        if streaming:
+            self.xml = None
+            record = parse_article(content, body=body)
+            error = record.pop("service_error")
+            if error is not None:
+                raise ScopusServiceError('\n{0}\n{1}'.format(input_doi, " ".join(error.itertext())))
+            self.__dict__.update(record)
+            if self.url is None:
+                self.url = url
+        else:
+            self._parse_tree(input_doi, content)
+
+        # Cleaned abstract text
+        self.abstract = clean_text(self.raw_abstract)
+
+    def _parse_tree(self, input_doi, content):
+        xml = ET.fromstring(content)
 
         # Remove default namespace if present
-        remove = u'{http://www.elsevier.com/xml/svapi/article/dtd}'
-        namespace_length = len(remove)
-        for elem in xml.getiterator():
-            if elem.tag.startswith(remove):
+        namespace_length = len(ARTICLE_NS)
+        for elem in xml.iter():
+            if elem.tag.startswith(ARTICLE_NS):
                 elem.tag = elem.tag[namespace_length:]
 
         self.xml = xml
         if xml.tag == 'service-error':
-            raise Exception('\n{0}\n{1}'.format(input_doi, self.xml))
+            raise ScopusServiceError('\n{0}\n{1}'.format(input_doi, " ".join(xml.itertext())))
 
         # Parse coredata
         coredata = xml.find('coredata', namespaces)
 
-        # Scopus URL of article
-        self.scopus_url = get_encoded_text(coredata, 'prism:url')
-
-        # Scopus source_id of the article
-        self.scopus_id = get_encoded_text(coredata, 'dc:identifier')
+        for attr, tag in COREDATA_FIELDS:
+            setattr(self, attr, get_encoded_text(coredata, tag))
 
         # URL of article
+        url = self.retrieval_url
         for link in get_encoded_text(coredata, 'link'):
             if not "self" in link.items()[1]:
                 url = link.items()[0][1]
         self.url = url
 
-        # EID of article
-        self.eid = get_encoded_text(coredata, 'eid')
 
-        # DOI of article
-        self.doi = get_encoded_text(coredata, 'prism:doi')
-
-        # Title of article
-        self.title = get_encoded_text(coredata, 'dc:title')
+def verify_access():
+    """ Confirms that the user is connected to a network with full access to Elsevier.
+    i.e. the LBNL Employee Network
 
-        # Authors of Article
-        self.authors = get_encoded_text(coredata, 'dc:creator')
+    Raises:
+        HTTPError: If user is not connected to network with full-text subscriber access to Elsevier content.
 
-        # Journal Name
-        self.journal = get_encoded_text(coredata, 'prism:publicationName')
+    """
+    try:
+        download(ARTICLE_URL.format("10.1016/j.actamat.2018.01.057"), params={'view': "FULL"})
+    except HTTPError:
+        raise HTTPError(" Cannot retreive full document from Elsevier API. \n \n"
+                        "Please confrim that you're connected to the LBNL employee network or "
+                        "the LBNL VPN.")
 
-        # Date of publication
-        self.cover_date = get_encoded_text(coredata, 'prism:coverDate')
 
-        # Date of publication (cover)
-        self.cover_display_date = get_encoded_text(coredata, 'prism:coverDisplayDate')
+def collect_entry(doi, user, session=None, refresh=False):
+    """ Collects the scopus entry for a single DOI and processes it for insertion into the Matstract database.
 
-        # Journal ISSN (or EISSN, or both)
-        self.issn = get_encoded_text(coredata, 'prism:issn')
+    Args:
+        doi (str): DOI of article
+        user: (dict): Credentials of user
+        session: (requests.Session, optional) Session used to download the article.
+        refresh (bool): Whether to download the article even if it is cached. Default is False.
 
-        # Volume that article appears in
-        self.volume = get_encoded_text(coredata, 'prism:volume')
+    Returns:
+        entry (dict): Entry to be inserted into database
 
-        # Issue that article appears in.
-        self.issue = get_encoded_text(coredata, 'prism:issueIdentifier')
+    """
+    date = datetime.datetime.now().isoformat()
+    try:
+        article = ScopusArticle(input_doi=doi, refresh=refresh, session=session, streaming=True, body=False)
+        abstract = article.abstract
+        raw_abstract = article.raw_abstract
+
+        if abstract is None or raw_abstract is None:
+            return {"doi": doi, "completed": False, "error": "No Abstract!",
+                    "pulled_on": date, "pulled_by": user}
+        if not isinstance(raw_abstract, str):
+            raw_abstract = raw_abstract.text
+        return {"doi": doi, "title": article.title, "abstract": abstract,
+                "raw_abstract": raw_abstract, "authors": article.authors, "url": article.url,
+                "subjects": article.subjects, "journal": article.journal,
+                "date": article.cover_date,
+                "completed": True, "pulled_on": date, "pulled_by": user}
+    except (requests.RequestException, ET.ParseError, CacheMiss, ScopusServiceError) as e:
+        # includes the connection errors and timeouts left after the retries of the rate limiter
+        return {"doi": doi, "completed": False, "error": str(e),
+                "pulled_on": date, "pulled_by": user}
+
+
+def collect_entries(dois, user, num_workers=1, refresh=False):
+    """ Collects the scopus entry for each DOI in dois and processes them for insertion into the Matstract database.
 
-        # Article number
-        self.article_number = get_encoded_text(coredata, 'prism:number')
+    With num_workers > 1 the articles are downloaded by a bounded thread pool sharing one pooled HTTP
+    session, keeping up to num_workers requests in flight. Entries are returned in the order of dois
+    either way.
 
-        # Page number of first page
-        self.first_page = get_encoded_text(coredata, 'prism:startingPage')
+    Args:
+        dois (list(str)): List of DOIs
+        user: (dict): Credentials of user
+        num_workers (int): Number of concurrent downloads. Default is 1 (sequential).
+        refresh (bool): Whether to download articles even if they are cached. Default is False.
 
-        # Page number of last page
-        self.last_page = get_encoded_text(coredata, 'prism:endingPage')
+    Returns:
+        entries (list(dict)): List of entries to be inserted into database
 
-        # Page range of article
-        self.page_range = get_encoded_text(coredata, 'prism:pageRange')
+    """
 
-        # Format of Article
-        self.format = get_encoded_text(coredata, 'dc:format')
+    if num_workers <= 1:
+        return [collect_entry(doi, user, refresh=refresh) for doi in tqdm(dois)]
 
-        # Subjects of article
-        self.subjects = get_encoded_text(coredata, 'dcterms:subject')
+    session = make_session(pool_size=num_workers)
+    try:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            collect = lambda doi: collect_entry(doi, user, session=session, refresh=refresh)
+            entries = list(tqdm(executor.map(collect, dois), total=len(dois)))
+    finally:
+        session.close()
+    return entries
 
-        # Copywrite info
-        self.copyright = get_encoded_text(coredata, 'prism:copyright')
 
-        # Name of publisher
-        self.publisher = get_encoded_text(coredata, 'prism:publisher')
+def iter_entries(dois, user, num_workers=1, refresh=False):
+    """ Yields the scopus entry for each DOI in dois as soon as it has been collected.
 
-        # Name of issue
-        self.issue_name = get_encoded_text(coredata, 'prism:IssueName')
+    Unlike collect_entries, entries are yielded in the order in which the downloads complete, and dois can be
+    any iterable (e.g. a ScopusSearch); it is only consumed as fast as the downloads progress.
 
-        # Raw copy of abstract as returned by scopus
-        self.raw_abstract = get_encoded_text(coredata, 'dc:description')
+    Args:
+        dois (iterable(str)): DOIs
+        user: (dict): Credentials of user
+        num_workers (int): Number of concurrent downloads. Default is 1 (sequential).
+        refresh (bool): Whether to download articles even if they are cached. Default is False.
 
-        # Cleaned abstract text
-        self.abstract = clean_text(get_encoded_text(coredata, 'dc:description'))
+    Yields:
+        entry (dict): Entry to be inserted into database
 
+    """
+    if num_workers <= 1:
+        for doi in dois:
+            yield collect_entry(doi, user, refresh=refresh)
+        return
+
+    session = make_session(pool_size=num_workers)
+    executor = ThreadPoolExecutor(max_workers=num_workers)
+    dois = iter(dois)
+    futures = set()
+    try:
+        while True:
+            # Pull DOIs lazily, so that a paginated search is consumed as downloads progress.
+            for doi in itertools.islice(dois, 2 * num_workers - len(futures)):
+                futures.add(executor.submit(collect_entry, doi, user, session=session, refresh=refresh))
+            if not futures:
+                break
+            finished, futures = wait(futures, return_when=FIRST_COMPLETED)
+            for future in finished:
+                yield future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+        session.close()
+
+
+def insert_entries(collection, entries, batch_size=500, ordered=False):
+    """ Upserts entries into collection keyed on their DOI, using one bulk_write per batch.
+
+    A unique index on "doi" is created if it does not exist yet. With ordered=False a failing document does not
+    stop the rest of its batch; the failures are reported in the returned batch statistics.
 
-def verify_access():
-    """ Confirms that the user is connected to a network with full access to Elsevier.
-    i.e. the LBNL Employee Network
+    Args:
+        collection: (pymongo.collection.Collection) target collection, e.g. db.elsevier
+        entries (list(dict)): entries returned by collect_entries
+        batch_size (int): number of entries per bulk_write. Default is 500.
+        ordered (bool): whether each batch should stop at the first failure. Default is False.
 
-    Raises:
-        HTTPError: If user is not connected to network with full-text subscriber access to Elsevier content.
+    Returns:
+        (list(dict)) statistics of each batch: size, upserted, modified, errors and seconds
 
     """
-    try:
-        download("https://api.elsevier.com/content/article/doi/10.1016/j.actamat.2018.01.057?view=FULL")
-    except HTTPError:
-        raise HTTPError(" Cannot retreive full document from Elsevier API. \n \n"
-                        "Please confrim that you're connected to the LBNL employee network or "
-                        "the LBNL VPN.")
+    collection.create_index("doi", unique=True)
+    stats = []
+    for start in range(0, len(entries), batch_size):
+        batch = entries[start:start + batch_size]
+        operations = [ReplaceOne({"doi": entry["doi"]}, entry, upsert=True) for entry in batch]
+        t0 = time.perf_counter()
+        try:
+            result = collection.bulk_write(operations, ordered=ordered).bulk_api_result
+        except BulkWriteError as e:
+            result = e.details
+        stats.append({"size": len(batch),
+                      "upserted": result.get("nUpserted", 0),
+                      "modified": result.get("nModified", 0),
+                      "errors": [{"doi": batch[err["index"]]["doi"], "error": err.get("errmsg")}
+                                 for err in result.get("writeErrors", [])],
+                      "seconds": time.perf_counter() - t0})
+    return stats
 
 
-def collect_entries(dois, user):
-    """ Collects the scopus entry for each DOI in dois and processes them for insertion into the Matstract database.
+def collect_block(dois, user, collection, num_workers=1, refresh=False, checkpoint_every=50, on_checkpoint=None):
+    """ Collects the entries of a block of DOIs into collection, streaming them in as they complete.
+
+    DOIs that already have a completed entry in collection are skipped, and collected entries are written every
+    checkpoint_every entries, so a restarted collection repeats at most checkpoint_every downloads.
+
+    dois may be a ScopusSearch, in which case downloads start with the first page of results, and the progress
+    includes the search's resume_token as "cursor".
 
     Args:
-        dois (list(str)): List of DOIs
+        dois (iterable(str)): DOIs, e.g. a list or a ScopusSearch
         user: (dict): Credentials of user
+        collection: (pymongo.collection.Collection) target collection, e.g. db.elsevier
+        num_workers (int): Number of concurrent downloads. Default is 1 (sequential).
+        refresh (bool): Whether to download articles even if they are cached. Default is False.
+        checkpoint_every (int): Number of entries written per checkpoint. Default is 50.
+        on_checkpoint (callable, optional): called with the progress dict after each checkpoint.
 
     Returns:
-        entries (list(dict)): List of entries to be inserted into database
+        progress (dict): total, skipped, collected and completed counts, the search cursor (None for plain
+            iterables) and the statistics of each batch (see insert_entries)
 
     """
-
-    entries = []
-    for doi in tqdm(dois):
-        date = datetime.datetime.now().isoformat()
-        try:
-            article = ScopusArticle(input_doi=doi)
-            abstract = article.abstract
-            raw_abstract = article.raw_abstract
-
-            if abstract is None or raw_abstract is None:
-                entries.append({"doi": doi, "completed": False, "error": "No Abstract!",
-                                "pulled_on": date, "pulled_by": user})
-            else:
-                if not isinstance(raw_abstract, str):
-                    raw_abstract = raw_abstract.text
-                entries.append({"doi": doi, "title": article.title, "abstract": abstract,
-                                "raw_abstract": raw_abstract, "authors": article.authors, "url": article.url,
-                                "subjects": article.subjects, "journal": article.journal,
-                                "date": article.cover_date,
-                                "completed": True, "pulled_on": date, "pulled_by": user})
-        except HTTPError as e:
-            entries.append({"doi": doi, "completed": False, "error": str(e),
-                            "pulled_on": date, "pulled_by": user})
-    return entries
-
-
-def contribute(user_creds="matstract/atlas_creds.json", max_block_size=100, num_blocks=1):
+    progress = {"total": 0, "skipped": 0, "collected": 0, "completed": 0, "cursor": None, "batches": []}
+    mark_done = getattr(dois, "done", lambda doi: None)
+
+    def todo():
+        it = iter(dois)
+        chunk = list(itertools.islice(it, checkpoint_every))
+        while chunk:
+            done = set(e["doi"] for e in collection.find({"doi": {"$in": chunk}, "completed": True}, ["doi"]))
+            progress["total"] += len(chunk)
+            progress["skipped"] += len(done)
+            for doi in chunk:
+                if doi in done:
+                    mark_done(doi)
+                else:
+                    yield doi
+            chunk = list(itertools.islice(it, checkpoint_every))
+
+    def checkpoint(entries):
+        progress["batches"] += insert_entries(collection, entries, batch_size=checkpoint_every)
+        progress["collected"] += len(entries)
+        progress["completed"] += sum(1 for e in entries if e["completed"])
+        for entry in entries:
+            mark_done(entry["doi"])
+        progress["cursor"] = getattr(dois, "resume_token", None)
+        if on_checkpoint is not None:
+            on_checkpoint(progress)
+
+    pending = []
+    total = len(dois) if hasattr(dois, "__len__") else None
+    for entry in tqdm(iter_entries(todo(), user, num_workers=num_workers, refresh=refresh), total=total):
+        pending.append(entry)
+        if len(pending) >= checkpoint_every:
+            checkpoint(pending)
+            pending = []
+    if pending:
+        checkpoint(pending)
+    if progress["skipped"]:
+        print("Skipped {} DOIs collected earlier.".format(progress["skipped"]))
+    return progress
+
+
+def contribute(user_creds="matstract/atlas_creds.json", max_block_size=100, num_blocks=1, num_workers=1,
+               checkpoint_every=50, db=None, lease_seconds=600):
     """
-    Gets a incomplete year/journal combination from elsevier_log, queries for the corresponding
+    Claims an incomplete year/journal combination from elsevier_log, queries for the corresponding
     dois, and downloads the corresponding xmls for each to the elsevier collection.
 
+    Blocks are claimed with a lease (see BlockScheduler), so several contributors can run at once.
+
     Args:
         user_creds ((:obj:`str`, optional)): path to contributing user's write-permitted credential file.
         max_block_size ((:obj:`int`, optional)): maximum number of articles in block (~1s/article). Defaults to 100.
         num_blocks ((:obj:`int`, optional)): maximum number of blocks to run in session. Defaults to 1.
+        num_workers ((:obj:`int`, optional)): number of concurrent article downloads. Defaults to 1.
+        checkpoint_every ((:obj:`int`, optional)): number of entries per bulk write and checkpoint. DOIs that were
+            collected before a restart are skipped, so at most this many downloads are repeated. Defaults to 50.
+        db ((:obj:`pymongo.database.Database`, optional)): database to write to. Defaults to the admin
+            connection to the test database.
+        lease_seconds ((:obj:`int`, optional)): duration of the lease on a claimed block. The lease is renewed
+            while the block is collected, and the block is requeued if it expires. Defaults to 600.
 
     """
     user = json.load(open(user_creds, 'r'))["name"]
-    db = open_db_connection(user_creds=user_creds)
+    db = AtlasConnection(access="admin", db="test").db if db is None else db
     log = db.elsevier_log
     elsevier = db.elsevier
 
+    scheduler = BlockScheduler(log, worker_id(user), lease_seconds=lease_seconds)
+
     for i in range(num_blocks):
         # Verify access at start of each block to detect dropped VPN sessions.
         verify_access()
 
-        # Get list of all available blocks sorted from largest to smallest.
-        available_blocks = log.find({"status": "incomplete",
-                                     "num_articles": {"$lt": max_block_size}},
-                                    ["year", "issn"]).limit(1).sort("num_articles", -1)
+        # Atomically claim the largest available block (or one whose lease has expired).
+        target = scheduler.claim(max_block_size)
 
         # Break if no remaining blocks smaller than max_block_size
-        if available_blocks.count() == 0:
+        if target is None:
             print("No remaining blocks with size <= {}.".format(max_block_size))
             break
         else:
-            print("Blocks remaining = {}".format(min(num_blocks - i, available_blocks.count())))
-
-        target = available_blocks[0]
-        date = datetime.datetime.now().isoformat()
-        log.update_one({"year": target["year"], "issn": target["issn"], "status": "incomplete"},
-                       {"$set": {"status": "in progress", "updated_by": user, "updated_on": date}})
-
-        # Collect scopus for block
-        print("Collecting entries for Block {}...".format(target["_id"]))
-        dois = find_articles(year=target["year"], issn=target["issn"], get_all=True)
-        new_entries = collect_entries(dois, user)
-
-        # Insert entries into Matstract database
-        print("Inserting entries into Matstract database...")
-        for entry in tqdm(new_entries):
-            if elsevier.find({"doi": entry["doi"]}).count():
-                elsevier.update_one({"doi": entry["doi"]}, {"$set": entry})
-            else:
-                elsevier.insert_one(entry)
+            print("Blocks remaining = {}".format(min(num_blocks - i, scheduler.remaining(max_block_size) + 1)))
+
+        # Collect scopus for block, renewing the lease and checkpointing as entries are inserted
+        with scheduler.lease(target):
+            print("Collecting entries for Block {}...".format(target["_id"]))
+            # Resume the search from the last checkpoint of an interrupted collection of this block
+            cursor = target.get("checkpoint", {}).get("cursor") or "*"
+            search = ScopusSearch(build_scopus_query(year=target["year"], issn=target["issn"]), cursor=cursor)
+            progress = collect_block(search, user, elsevier, num_workers=num_workers,
+                                     checkpoint_every=checkpoint_every,
+                                     on_checkpoint=lambda p: scheduler.checkpoint(target, p))
+            print("Collected {collected} of {total} entries ({completed} complete, {skipped} skipped).".format(
+                **progress))
+            print("API calls: {calls}, throttled: {throttled}, retried: {retried}, failed: {failed}".format(
+                **LIMITER.stats()))
 
         # Mark block as completed in log
-        date = datetime.datetime.now().isoformat()
-        log.update_one({"year": target["year"], "issn": target["issn"], "status": "in progress"},
-                       {"$set": {"status": "complete", "completed_by": user, "completed_on": date,
-                                 "updated_by": user, "updated_on": date}})
+        if not scheduler.complete(target):
+            print("Lease on Block {} expired before completion; it will be collected again.".format(target["_id"]))
@@ -0,0 +1,50 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+from matstract.collect.cache import XMLCache
+
+
+class TestXMLCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_roundtrip(self):
+        cache = XMLCache(self.tmp.name, compression="gzip")
+        self.assertIsNone(cache.get("10.1016/j.actamat.2018.01.057"))
+        cache.put("10.1016/j.actamat.2018.01.057", "<coredata>LiFePO₄</coredata>")
+        self.assertIn("10.1016/J.ACTAMAT.2018.01.057", cache)
+        self.assertEqual(cache.get("10.1016/j.actamat.2018.01.057"), "<coredata>LiFePO₄</coredata>")
+        self.assertEqual(cache.counters["hits"], 1)
+        self.assertEqual(cache.counters["misses"], 1)
+        self.assertEqual(XMLCache(self.tmp.name).size(), cache.size())
+
+    def test_evicts_least_recently_used(self):
+        content = os.urandom(2000).hex()
+        cache = XMLCache(self.tmp.name, compression="gzip")
+        for doi in ["10.1/a", "10.1/b", "10.1/c"]:
+            cache.put(doi, content)
+            time.sleep(0.01)
+        cache.get("10.1/a")
+        cache.max_bytes = cache.size() - 1
+        cache.evict()
+        self.assertIn("10.1/a", cache)
+        self.assertNotIn("10.1/b", cache)
+        self.assertIn("10.1/c", cache)
+        self.assertEqual(cache.counters["evictions"], 1)
+
+
+    def test_evicted_between_read_and_touch(self):
+        cache = XMLCache(self.tmp.name, compression="gzip")
+        cache.put("10.1/a", "<coredata/>")
+        with mock.patch.object(os, "utime", side_effect=FileNotFoundError):
+            self.assertEqual(cache.get("10.1/a"), "<coredata/>")
+        self.assertEqual(cache.counters["hits"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
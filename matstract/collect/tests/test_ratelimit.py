@@ -0,0 +1,77 @@
+import unittest
+from unittest.mock import Mock
+from requests.exceptions import HTTPError
+from matstract.collect.ratelimit import TokenBucket, RateLimiter, status_code
+
+
+class FakeClock(object):
+    """A clock that only advances when sleep is called"""
+
+    def __init__(self):
+        self.now = 0.
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def http_error(status, headers=None):
+    return HTTPError("{} Error".format(status), response=Mock(status_code=status, headers=headers or {}))
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_throttle(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=3, clock=clock, sleep=clock.sleep)
+        waits = [bucket.acquire() for _ in range(5)]
+        self.assertEqual(waits[:3], [0, 0, 0])
+        self.assertAlmostEqual(waits[3], 0.5)
+        self.assertAlmostEqual(waits[4], 0.5)
+        self.assertAlmostEqual(clock.now, 1.)
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = RateLimiter(rate=100, max_retries=3, clock=self.clock, sleep=self.clock.sleep)
+
+    def test_retries_transient_errors(self):
+        func = Mock(side_effect=[http_error(503), http_error(429, {"Retry-After": "7"}), "content"])
+        self.assertEqual(self.limiter.call(func, "key"), "content")
+        self.assertEqual(func.call_count, 3)
+        self.assertGreaterEqual(self.clock.sleeps[-1], 7)
+        stats = self.limiter.stats()
+        self.assertEqual(stats["calls"], 3)
+        self.assertEqual(stats["retried"], 2)
+        self.assertEqual(stats["failed"], 0)
+
+    def test_does_not_retry_client_errors(self):
+        func = Mock(side_effect=http_error(404))
+        self.assertRaises(HTTPError, self.limiter.call, func, "key")
+        self.assertEqual(func.call_count, 1)
+        self.assertEqual(self.limiter.stats()["failed"], 1)
+
+    def test_gives_up_after_max_retries(self):
+        func = Mock(side_effect=http_error(500))
+        self.assertRaises(HTTPError, self.limiter.call, func, "key")
+        self.assertEqual(func.call_count, 4)
+        self.assertEqual(self.limiter.stats()["retried"], 3)
+
+    def test_buckets_per_key(self):
+        limiter = RateLimiter(rate=1, clock=self.clock, sleep=self.clock.sleep)
+        limiter.call(lambda: None, "key1")
+        limiter.call(lambda: None, "key2")
+        self.assertEqual(limiter.stats()["throttled"], 0)
+        limiter.call(lambda: None, "key1")
+        self.assertEqual(limiter.stats()["throttled"], 1)
+
+    def test_status_code_from_elsapy_message(self):
+        self.assertEqual(status_code(HTTPError("HTTP 429 Error from https://api.elsevier.com")), 429)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import datetime
+import time
+import unittest
+import mongomock
+from matstract.collect.scheduler import BlockScheduler
+
+
+class TestBlockScheduler(unittest.TestCase):
+    def setUp(self):
+        self.log = mongomock.MongoClient().db.elsevier_log
+        self.log.insert_many([{"year": "2017", "issn": "1", "num_articles": 50, "status": "incomplete"},
+                              {"year": "2017", "issn": "2", "num_articles": 80, "status": "incomplete"},
+                              {"year": "2017", "issn": "3", "num_articles": 500, "status": "incomplete"},
+                              {"year": "2016", "issn": "1", "num_articles": 60, "status": "complete"}])
+
+    def test_workers_claim_distinct_blocks(self):
+        a = BlockScheduler(self.log, "a")
+        b = BlockScheduler(self.log, "b")
+        first, second = a.claim(100), b.claim(100)
+        self.assertEqual((first["issn"], second["issn"]), ("2", "1"))
+        self.assertEqual(first["lease_owner"], "a")
+        self.assertIsNone(a.claim(100))
+        self.assertEqual(a.remaining(100), 0)
+
+    def test_expired_lease_is_reclaimed(self):
+        crashed = BlockScheduler(self.log, "crashed", lease_seconds=-1)
+        block = crashed.claim(100)
+        other = BlockScheduler(self.log, "other").claim(100)
+        self.assertEqual(other["_id"], block["_id"])
+        self.assertEqual(other["attempts"], 2)
+        self.assertFalse(crashed.heartbeat(block))
+        self.assertFalse(crashed.complete(block))
+
+    def test_requeue_expired(self):
+        BlockScheduler(self.log, "alive").claim(100)
+        BlockScheduler(self.log, "crashed", lease_seconds=-1).claim(100)
+        self.assertEqual(BlockScheduler(self.log, "janitor").requeue_expired(), 1)
+        self.assertEqual(self.log.count_documents({"status": "incomplete"}), 2)
+
+    def test_blocks_claimed_before_leases_are_reclaimed(self):
+        self.log.update_one({"issn": "2"}, {"$set": {"status": "in progress", "updated_by": "old worker"}})
+        self.assertEqual(BlockScheduler(self.log, "a").claim(100)["issn"], "2")
+        self.log.update_one({"issn": "1", "year": "2017"}, {"$set": {"status": "in progress"}})
+        self.assertEqual(BlockScheduler(self.log, "janitor").requeue_expired(), 1)
+        self.assertEqual(self.log.find_one({"issn": "1", "year": "2017"})["status"], "incomplete")
+
+    def test_lease_heartbeat_and_complete(self):
+        scheduler = BlockScheduler(self.log, "a", lease_seconds=60)
+        block = scheduler.claim(100)
+        with scheduler.lease(block, interval=0.01):
+            time.sleep(0.05)
+            expires = self.log.find_one({"_id": block["_id"]})["lease_expires"]
+            self.assertGreater(expires, block["lease_expires"])
+        self.assertTrue(scheduler.complete(block))
+        entry = self.log.find_one({"_id": block["_id"]})
+        self.assertEqual(entry["status"], "complete")
+        self.assertNotIn("lease_owner", entry)
+
+    def test_lease_released_on_error(self):
+        scheduler = BlockScheduler(self.log, "a")
+        block = scheduler.claim(100)
+        with self.assertRaises(RuntimeError):
+            with scheduler.lease(block):
+                raise RuntimeError("VPN dropped")
+        self.assertEqual(self.log.find_one({"_id": block["_id"]})["status"], "incomplete")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,251 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import mongomock
+import requests
+from matstract.collect import scopus
+from matstract.collect.cache import XMLCache
+
+ARTICLE_XML = open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'article.xml'), 'rb').read()
+SERVICE_ERROR_XML = (b"<service-error><status><statusCode>RESOURCE_NOT_FOUND</statusCode>"
+                     b"<statusText>The resource specified cannot be found.</statusText></status></service-error>")
+
+
+class StubElsevierHandler(BaseHTTPRequestHandler):
+    """Serves the canned article for every DOI except those starting with 'missing' (404), 'truncated' or 'denied'
+    (service-error), and searches over the server's search_dois with offsets as cursors, rejecting the cursor
+    'expired' (400)"""
+
+    def do_GET(self):
+        server = self.server
+        if self.path.startswith("/content/search/scopus"):
+            return self.search()
+        with server.lock:
+            server.in_flight += 1
+            server.requests_served += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        time.sleep(server.latency)
+        try:
+            doi = self.path.split("/content/article/doi/")[-1].split("?")[0]
+            if doi.startswith("missing"):
+                self.send_response(404)
+                self.end_headers()
+                return
+            if doi.startswith("denied"):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/xml")
+                self.send_header("Content-Length", str(len(SERVICE_ERROR_XML)))
+                self.end_headers()
+                self.wfile.write(SERVICE_ERROR_XML)
+                return
+            if doi.startswith("truncated"):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/xml")
+                self.send_header("Content-Length", "100")
+                self.end_headers()
+                self.wfile.write(ARTICLE_XML[:100])
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/xml")
+            self.send_header("Content-Length", str(len(ARTICLE_XML)))
+            self.end_headers()
+            self.wfile.write(ARTICLE_XML)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def search(self):
+        params = parse_qs(urlparse(self.path).query)
+        with self.server.lock:
+            self.server.search_requests.append(params["cursor"][0])
+        if params["cursor"][0] == "expired":
+            self.send_response(400)
+            self.end_headers()
+            return
+        start, count = (0 if params["cursor"][0] == "*" else int(params["cursor"][0])), int(params["count"][0])
+        dois = self.server.search_dois[start:start + count]
+        entries = [{"prism:doi": doi} for doi in dois] or [{"error": "Result set was empty"}]
+        body = json.dumps({"search-results": {"opensearch:totalResults": str(len(self.server.search_dois)),
+                                              "cursor": {"@current": params["cursor"][0],
+                                                         "@next": str(start + count)},
+                                              "entry": entries}}).encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestCollectEntries(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubElsevierHandler)
+        self.server.lock = threading.Lock()
+        self.server.in_flight = 0
+        self.server.max_in_flight = 0
+        self.server.requests_served = 0
+        self.server.search_requests = []
+        self.server.search_dois = ["10.1016/j.test.{}".format(i) for i in range(25)]
+        self.server.latency = 0.05
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self._urls = scopus.ARTICLE_URL, scopus.SEARCH_URL
+        scopus.ARTICLE_URL = "http://127.0.0.1:{}/content/article/doi/{{}}".format(self.server.server_port)
+        scopus.SEARCH_URL = "http://127.0.0.1:{}/content/search/scopus".format(self.server.server_port)
+
+    def tearDown(self):
+        scopus.ARTICLE_URL, scopus.SEARCH_URL = self._urls
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_concurrent_matches_sequential(self):
+        dois = ["10.1016/j.test.{}".format(i) for i in range(8)] + ["missing/1"]
+        sequential = scopus.collect_entries(dois, "tester")
+        concurrent = scopus.collect_entries(dois, "tester", num_workers=4)
+
+        self.assertEqual([e["doi"] for e in concurrent], dois)
+        for seq, con in zip(sequential, concurrent):
+            del seq["pulled_on"], con["pulled_on"]
+            self.assertDictEqual(seq, con)
+
+        entry = concurrent[0]
+        self.assertTrue(entry["completed"])
+        self.assertEqual(entry["title"], "Phase stability of LiFePO4 cathodes under high pressure")
+        self.assertEqual(entry["authors"], ["Smith, Jane", "Doe, John"])
+        self.assertEqual(entry["url"], "https://www.sciencedirect.com/science/article/pii/S1359645418300879")
+        self.assertTrue(entry["abstract"].startswith("The olivine LiFePO4"))
+        self.assertFalse(concurrent[-1]["completed"])
+        self.assertIn("404", concurrent[-1]["error"])
+
+    def test_failed_requests_do_not_abort_the_block(self):
+        dois = ["10.1016/j.test.0", "truncated/1", "unreachable/1", "denied/1", "10.1016/j.test.1"]
+        article = scopus.ScopusArticle
+
+        def unreachable(input_doi, **kwargs):
+            if input_doi.startswith("unreachable"):
+                raise requests.ConnectionError("Max retries exceeded")
+            return article(input_doi=input_doi, **kwargs)
+
+        with mock.patch.object(scopus, "ScopusArticle", side_effect=unreachable):
+            entries = scopus.collect_entries(dois, "tester", num_workers=2)
+        self.assertEqual([e["completed"] for e in entries], [True, False, False, False, True])
+        self.assertIn("Max retries exceeded", entries[2]["error"])
+        self.assertIn("RESOURCE_NOT_FOUND", entries[3]["error"])
+
+    def test_requests_in_flight(self):
+        dois = ["10.1016/j.test.{}".format(i) for i in range(12)]
+        scopus.collect_entries(dois, "tester", num_workers=4)
+        self.assertGreater(self.server.max_in_flight, 1)
+        self.assertLessEqual(self.server.max_in_flight, 4)
+
+    def test_offline_replay(self):
+        dois = ["10.1016/j.test.{}".format(i) for i in range(3)]
+        with tempfile.TemporaryDirectory() as directory:
+            scopus.CACHE = XMLCache(directory)
+            try:
+                online = scopus.collect_entries(dois, "tester", num_workers=2)
+                requests_served = self.server.requests_served
+                scopus.CACHE.offline = True
+                offline = scopus.collect_entries(dois + ["10.1016/j.uncached"], "tester")
+            finally:
+                scopus.CACHE = None
+        self.assertEqual(self.server.requests_served, requests_served)
+        self.assertEqual([e["title"] for e in online], [e["title"] for e in offline[:3]])
+        self.assertFalse(offline[-1]["completed"])
+
+    def test_collect_block_resumes(self):
+        collection = mongomock.MongoClient().db.elsevier
+        dois = ["10.1016/j.test.{}".format(i) for i in range(7)] + ["missing/1"]
+        collection.insert_many([{"doi": dois[0], "completed": True},
+                                {"doi": dois[1], "completed": False, "error": "503"}])
+        checkpoints = []
+
+        progress = scopus.collect_block(dois, "tester", collection, num_workers=3, checkpoint_every=3,
+                                        on_checkpoint=lambda p: checkpoints.append(p["collected"]))
+
+        self.assertEqual(self.server.requests_served, 7)
+        self.assertEqual(checkpoints, [3, 6, 7])
+        self.assertEqual((progress["skipped"], progress["collected"], progress["completed"]), (1, 7, 6))
+        self.assertEqual(collection.count_documents({"completed": True}), 7)
+
+        scopus.collect_block(dois, "tester", collection)
+        self.assertEqual(self.server.requests_served, 8)
+
+    def test_search_pages_lazily(self):
+        search = scopus.ScopusSearch("PUBYEAR = 2018", count=10)
+        dois = iter(search)
+        self.assertEqual(next(dois), "10.1016/j.test.0")
+        self.assertEqual(self.server.search_requests, ["*"])
+        self.assertEqual(list(dois), self.server.search_dois[1:])
+        self.assertEqual(self.server.search_requests, ["*", "10", "20"])
+        self.assertEqual(scopus.find_articles(year="2018"), self.server.search_dois)
+
+    def test_search_resume_token(self):
+        search = scopus.ScopusSearch("PUBYEAR = 2018", count=10)
+        pages = search.pages()
+        first, second = next(pages), next(pages)
+        for doi in first + second[:5]:
+            search.done(doi)
+        self.assertEqual(search.resume_token, "10")
+        resumed = list(scopus.ScopusSearch("PUBYEAR = 2018", cursor=search.resume_token, count=10))
+        self.assertEqual(resumed, self.server.search_dois[10:])
+
+    def test_search_restarts_from_an_expired_cursor(self):
+        search = scopus.ScopusSearch("PUBYEAR = 2018", cursor="expired", count=10)
+        self.assertEqual(list(search), self.server.search_dois)
+        self.assertEqual(self.server.search_requests, ["expired", "*", "10", "20"])
+
+    def test_collect_block_from_search(self):
+        collection = mongomock.MongoClient().db.elsevier
+        search = scopus.ScopusSearch("PUBYEAR = 2018", count=10)
+        progress = scopus.collect_block(search, "tester", collection, num_workers=4, checkpoint_every=5)
+        self.assertEqual((progress["total"], progress["completed"]), (25, 25))
+        self.assertIsNone(progress["cursor"])
+        self.assertEqual(collection.count_documents({"completed": True}), 25)
+
+
+class TestParseArticle(unittest.TestCase):
+    def test_streaming_matches_tree(self):
+        tree = scopus.ScopusArticle("10.1016/j.actamat.2018.01.057", content=ARTICLE_XML)
+        stream = scopus.ScopusArticle("10.1016/j.actamat.2018.01.057", content=ARTICLE_XML, streaming=True)
+        for attr, _ in scopus.COREDATA_FIELDS + [("url", None), ("abstract", None)]:
+            self.assertEqual(getattr(tree, attr), getattr(stream, attr), attr)
+        self.assertEqual(stream.body, "The body text of the article, which is only returned for the FULL view.")
+
+    def test_skip_body(self):
+        record = scopus.parse_article(ARTICLE_XML, body=False)
+        self.assertNotIn("body", record)
+        self.assertEqual(record["issn"], "13596454")
+        self.assertIsNone(record["issue_name"])
+
+    def test_service_error(self):
+        for streaming, body in [(False, True), (True, True), (True, False)]:
+            with self.assertRaises(scopus.ScopusServiceError):
+                scopus.ScopusArticle("denied/1", content=SERVICE_ERROR_XML, streaming=streaming, body=body)
+
+
+class TestInsertEntries(unittest.TestCase):
+    def test_batched_upsert(self):
+        collection = mongomock.MongoClient().db.elsevier
+        collection.insert_one({"doi": "10.1/0", "completed": False, "error": "No Abstract!"})
+        entries = [{"doi": "10.1/{}".format(i), "completed": True} for i in range(5)]
+
+        stats = scopus.insert_entries(collection, entries, batch_size=2)
+
+        self.assertEqual([batch["size"] for batch in stats], [2, 2, 1])
+        self.assertEqual(sum(batch["upserted"] for batch in stats), 4)
+        self.assertEqual(sum(batch["modified"] for batch in stats), 1)
+        self.assertEqual(collection.count_documents({}), 5)
+        self.assertNotIn("error", collection.find_one({"doi": "10.1/0"}))
+        self.assertTrue(all(batch["seconds"] >= 0 and not batch["errors"] for batch in stats))
+
+
+if __name__ == '__main__':
+    unittest.main()
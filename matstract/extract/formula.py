@@ -0,0 +1,194 @@
+"""
+Pure-Python chemical formula scanner used in place of pymatgen's Composition on the tokenization hot paths.
+
+parse_formula reads formulas with pymatgen's grammar (brackets, fractional and exponent amounts, "@" of
+endohedral compounds, D and T read as H) and normalize_formula returns the same canonical form as
+SimpleParser's original Composition pipeline: integer formula, reduced formula with pymatgen's polyanion grouping
+and special formulas, alphabetized. Element lookups are set and dict lookups in the tables below instead of
+Element() construction.
+
+Unlike pymatgen, hydrates and adducts written with a middle dot or an asterisk, e.g. CuSO4·5H2O, are expanded to
+CuSO4(H2O)5. A "." keeps its decimal meaning.
+"""
+import math
+import re
+
+# Pauling electronegativities of the elements known to pymatgen, None where undefined. Used to order reduced
+# formulas and to detect polyanions.
+ELECTRONEGATIVITY = {
+    "H": 2.2, "He": None, "Li": 0.98, "Be": 1.57, "B": 2.04, "C": 2.55, "N": 3.04, "O": 3.44, "F": 3.98,
+    "Ne": None, "Na": 0.93, "Mg": 1.31, "Al": 1.61, "Si": 1.9, "P": 2.19, "S": 2.58, "Cl": 3.16, "Ar": None,
+    "K": 0.82, "Ca": 1, "Sc": 1.36, "Ti": 1.54, "V": 1.63, "Cr": 1.66, "Mn": 1.55, "Fe": 1.83, "Co": 1.88,
+    "Ni": 1.91, "Cu": 1.9, "Zn": 1.65, "Ga": 1.81, "Ge": 2.01, "As": 2.18, "Se": 2.55, "Br": 2.96, "Kr": 3,
+    "Rb": 0.82, "Sr": 0.95, "Y": 1.22, "Zr": 1.33, "Nb": 1.6, "Mo": 2.16, "Tc": 1.9, "Ru": 2.2, "Rh": 2.28,
+    "Pd": 2.2, "Ag": 1.93, "Cd": 1.69, "In": 1.78, "Sn": 1.96, "Sb": 2.05, "Te": 2.1, "I": 2.66, "Xe": 2.6,
+    "Cs": 0.79, "Ba": 0.89, "La": 1.1, "Ce": 1.12, "Pr": 1.13, "Nd": 1.14, "Pm": 1.13, "Sm": 1.17, "Eu": 1.2,
+    "Gd": 1.2, "Tb": 1.1, "Dy": 1.22, "Ho": 1.23, "Er": 1.24, "Tm": 1.25, "Yb": 1.1, "Lu": 1.27, "Hf": 1.3,
+    "Ta": 1.5, "W": 2.36, "Re": 1.9, "Os": 2.2, "Ir": 2.2, "Pt": 2.28, "Au": 2.54, "Hg": 2, "Tl": 1.62, "Pb": 2.33,
+    "Bi": 2.02, "Po": 2, "At": 2.2, "Rn": 2.2, "Fr": 0.7, "Ra": 0.9, "Ac": 1.1, "Th": 1.3, "Pa": 1.5, "U": 1.38,
+    "Np": 1.36, "Pu": 1.28, "Am": 1.3, "Cm": 1.3, "Bk": 1.3, "Cf": 1.3, "Es": 1.3, "Fm": 1.3, "Md": 1.3, "No": 1.3,
+    "Lr": 1.3, "Rf": None, "Db": None, "Sg": None, "Bh": None, "Hs": None, "Mt": None, "Ds": None, "Rg": None,
+    "Cn": None, "Nh": None, "Fl": None, "Mc": None, "Lv": None, "Ts": None, "Og": None}
+
+ELEMENTS = frozenset(ELECTRONEGATIVITY)
+
+# isotopes read as hydrogen
+ALIASES = {"D": "H", "T": "H"}
+
+# reduced formulas written as molecules, as in pymatgen's Composition.special_formulas
+SPECIAL_FORMULAS = {"LiO": "Li2O2", "NaO": "Na2O2", "KO": "K2O2", "HO": "H2O2", "CsO": "Cs2O2", "RbO": "Rb2O2",
+                    "O": "O2", "N": "N2", "F": "F2", "Cl": "Cl2", "H": "H2"}
+
+# amounts smaller than this are dropped
+AMOUNT_TOLERANCE = 1e-8
+
+# largest denominator of the fractional amounts converted to an integer formula
+MAX_DENOMINATOR = 10000
+
+_INVALID = re.compile(r"[\s\d.*/]*$")
+_GROUP = re.compile(r"([A-Z][a-z]*)\s*([-*\.e\d]*)")
+_PAREN = re.compile(r"\(([^\(\)]+)\)\s*([\.e\d]*)")
+_HYDRATE_SEPARATOR = re.compile(r"[\u00b7\u2022\u2219\u22c5*]")
+_HYDRATE_PART = re.compile(r"\s*(\d+(?:\.\d+)?)?\s*([A-Z(].*)$")
+_BRACKETS = str.maketrans("[]{}", "()()")
+_SYMBOL_AMOUNT = re.compile(r"[A-Z][a-z]?\d*")
+
+
+def _symbol_amounts(formula, factor):
+    amounts = {}
+    for match in _GROUP.finditer(formula):
+        amount = float(match.group(2)) if match.group(2).strip() != "" else 1.0
+        amounts[match.group(1)] = amounts.get(match.group(1), 0.) + amount * factor
+        if not math.isfinite(amounts[match.group(1)]):
+            raise ValueError("Non-finite amount in {!r}".format(formula))
+        formula = formula.replace(match.group(), "", 1)
+    if formula.strip():
+        raise ValueError("{} is an invalid formula".format(formula))
+    return amounts
+
+
+def _expand_hydrates(formula):
+    parts = _HYDRATE_SEPARATOR.split(formula)
+    if len(parts) == 1 or not parts[0].strip():
+        return formula
+    expanded = [parts[0]]
+    for part in parts[1:]:
+        match = _HYDRATE_PART.match(part)
+        if match is None:
+            return formula
+        expanded.append("({}){}".format(match.group(2), match.group(1) or ""))
+    return "".join(expanded)
+
+
+def parse_formula(formula):
+    """
+    Reads the amount of every symbol of a formula.
+
+    Args:
+        formula: (str) chemical formula, e.g. "Li0.5Fe(PO4)0.5" or "CuSO4·5H2O".
+
+    Returns:
+        (dict) symbol -> amount (float). Symbols are not checked against ELEMENTS.
+
+    Raises:
+        ValueError: if the formula can't be parsed or has a negative or non-finite amount.
+
+    """
+    if _INVALID.match(formula):
+        raise ValueError("Invalid formula {!r}".format(formula))
+    formula = _expand_hydrates(formula.replace("@", "").translate(_BRACKETS))
+    match = _PAREN.search(formula)
+    while match:
+        factor = float(match.group(2)) if match.group(2) != "" else 1.0
+        unit = _symbol_amounts(match.group(1), factor)
+        formula = formula.replace(match.group(), "".join("{}{}".format(s, a) for s, a in unit.items()), 1)
+        match = _PAREN.search(formula)
+    amounts = {}
+    for symbol, amount in _symbol_amounts(formula, 1).items():
+        if amount < -AMOUNT_TOLERANCE:
+            raise ValueError("Negative amount in {!r}".format(formula))
+        if abs(amount) >= AMOUNT_TOLERANCE:
+            symbol = ALIASES.get(symbol, symbol)
+            amounts[symbol] = amounts.get(symbol, 0.) + amount
+            if not math.isfinite(amounts[symbol]):
+                raise ValueError("Non-finite amount in {!r}".format(formula))
+    return amounts
+
+
+def gcd_float(numbers, tol=1e-8):
+    """ Greatest common divisor of floats within tol, as monty.fractions.gcd_float. """
+    n = numbers[0]
+    for b in numbers[1:]:
+        while b > tol:
+            n, b = b, n % b
+    return n
+
+
+def _electronegativity(symbol):
+    x = ELECTRONEGATIVITY[symbol]
+    return math.inf if x is None else x
+
+
+def _format_amount(amount):
+    if abs(amount - 1) < AMOUNT_TOLERANCE:
+        return ""
+    if abs(amount - round(amount)) < AMOUNT_TOLERANCE:
+        return str(int(round(amount)))
+    return str(round(amount, 8))
+
+
+def reduce_formula(amounts):
+    """
+    Reduced formula of element amounts, as pymatgen's reduce_formula.
+
+    Elements are sorted by electronegativity and the two most electronegative elements of formulas of three or more
+    elements are grouped in parentheses when their electronegativities differ by less than 1.65, e.g. Ca(NO3)2.
+
+    Args:
+        amounts: (dict) element -> amount.
+
+    Returns:
+        (tuple) reduced formula (str) and the integer factor it was divided by.
+
+    """
+    symbols = sorted(amounts, key=lambda s: (_electronegativity(s), s))
+    symbols = [s for s in symbols if abs(amounts[s]) > AMOUNT_TOLERANCE]
+    factor = 1
+    if all(int(a) == a for a in amounts.values()):
+        factor = abs(math.gcd(*(int(a) for a in amounts.values())))
+    polyanion = []
+    if len(symbols) >= 3 and _electronegativity(symbols[-1]) - _electronegativity(symbols[-2]) < 1.65:
+        poly_form, poly_factor = reduce_formula({s: amounts[s] / factor for s in symbols[-2:]})
+        if poly_factor != 1:
+            polyanion.append("({}){}".format(poly_form, poly_factor))
+            symbols = symbols[:-2]
+    reduced = []
+    for symbol in symbols:
+        reduced.extend((symbol, _format_amount(amounts[symbol] * 1.0 / factor)))
+    return "".join(reduced + polyanion), factor
+
+
+def normalize_formula(formula):
+    """
+    Canonical form of a formula: reduced integer formula with alphabetically sorted elements, e.g. "O3SrZr" for
+    "SrZrO3" or "Sr0.5Zr0.5O1.5".
+
+    Returns:
+        (str) the canonical form, or None if the formula can't be parsed or contains a symbol that is not an
+        element.
+
+    """
+    try:
+        amounts = parse_formula(formula)
+    except ValueError:
+        return None
+    if not amounts or not ELEMENTS.issuperset(amounts):
+        return None
+    divisor = gcd_float(list(amounts.values()), 1 / MAX_DENOMINATOR)
+    integer = {s: round(a / divisor) for s, a in amounts.items()}
+    integer = {s: a for s, a in integer.items() if a}
+    if not integer:
+        return None
+    reduced = reduce_formula(integer)[0]
+    reduced = SPECIAL_FORMULAS.get(reduced, reduced)
+    return "".join(sorted(_SYMBOL_AMOUNT.findall(reduced)))
@@ -0,0 +1,181 @@
+"""
+Corpus-level extraction of the chemical mentions of abstracts into the mats_ collection.
+
+Abstracts are streamed from Mongo in _id order and sent in chunks to a pool of worker processes. Each worker loads
+ChemDataExtractor once, extracts the chemical mentions of the title and abstract of every document of a chunk and
+normalizes them with SimpleParser. Results are written back with one bulk write per chunk, as mats_ documents
+holding the mention names and the distinct normalized formulas (unique_mats) used by material search.
+
+Chunks are written in order and the _id of the last abstract of every written chunk is checkpointed in CHECKPOINTS,
+so an interrupted run resumes after the last written chunk:
+
+    python -m matstract.extract.mentions [--full] [--workers 8] [--chunk-size 200]
+
+Abstracts extracted again, e.g. with --full, keep the _id of their mats_ document, which the incremental build of
+the search collection doesn't revisit: their search documents are rebuilt with
+search_collection.build_search_collection(dois=...) after every chunk.
+"""
+import argparse
+import collections
+import datetime
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pymongo import ReplaceOne, ASCENDING
+from matstract.models.search_collection import build_search_collection
+
+MENTIONS_COLLECTION = "mats_"
+
+# collection holding the state of the extraction runs
+CHECKPOINTS = "extraction_checkpoints"
+
+# abstract fields read by the workers
+TEXT_FIELDS = ["doi", "title", "abstract"]
+
+_worker = {}
+
+
+def now():
+    return datetime.datetime.utcnow().isoformat()
+
+
+def init_worker():
+    """ Loads ChemDataExtractor and its models in a worker process. """
+    from matstract.extract.parsing import TextParser, SimpleParser
+    _worker["text_parser"] = TextParser()
+    _worker["simple_parser"] = SimpleParser()
+    # the taggers are loaded on first use
+    _worker["text_parser"].extract_chemdata("LiFePO4")
+
+
+def extract_mentions(text, text_parser, simple_parser):
+    """
+    Extracts the chemical mentions of a text.
+
+    Returns:
+        (tuple) list of the mention names, sorted list of their distinct normalized formulas.
+
+    """
+    names = [name for record in text_parser.extract_chemdata(text) for name in record]
+    unique_mats = {simple_parser.parse(name) for name in names}
+    unique_mats.discard(False)
+    return names, sorted(unique_mats)
+
+
+def extract_chunk(documents):
+    """
+    Extracts the mentions of a chunk of abstracts, in a worker process.
+
+    Args:
+        documents: (list) abstracts with TEXT_FIELDS.
+
+    Returns:
+        (list) mats_ documents, one per abstract with a DOI.
+
+    """
+    if not _worker:
+        init_worker()
+    results = []
+    for doc in documents:
+        if not doc.get("doi"):
+            continue
+        text = ". ".join(t for t in (doc.get("title"), doc.get("abstract")) if t)
+        names, unique_mats = extract_mentions(text, _worker["text_parser"], _worker["simple_parser"])
+        results.append({"doi": doc["doi"], "names": names, "unique_mats": unique_mats})
+    return results
+
+
+def _chunks(cursor, chunk_size):
+    chunk = []
+    for doc in cursor:
+        chunk.append(doc)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def extract_corpus(db, full=False, workers=None, chunk_size=200, limit=None, verbose=False):
+    """
+    Extracts the chemical mentions of the abstracts added since the previous run into mats_.
+
+    Args:
+        db: (pymongo.database.Database) database holding the abstracts and mats_ collections.
+        full: (bool) extract from the first abstract. Default is False.
+        workers: (int, optional) number of worker processes. Defaults to the number of CPUs, 0 extracts in this
+            process.
+        chunk_size: (int) number of abstracts per chunk. Default is 200.
+        limit: (int, optional) maximum number of abstracts to process.
+        verbose: (bool) print progress after every chunk. Default is False.
+
+    Returns:
+        (dict) statistics of the run: documents processed, mats_ documents written, mats_ documents replaced,
+        mentions, seconds and documents per second.
+
+    """
+    workers = os.cpu_count() if workers is None else workers
+    db[MENTIONS_COLLECTION].create_index("doi", unique=True)
+    checkpoints = db[CHECKPOINTS]
+    state = checkpoints.find_one({"_id": MENTIONS_COLLECTION}) or {}
+    query = {}
+    if not full and state.get("last_id") is not None:
+        query["_id"] = {"$gt": state["last_id"]}
+    cursor = db.abstracts.find(query, {field: 1 for field in TEXT_FIELDS}).sort("_id", ASCENDING)
+    if limit is not None:
+        cursor = cursor.limit(limit)
+    cursor = cursor.batch_size(chunk_size)
+
+    stats = {"documents": 0, "written": 0, "replaced": 0, "mentions": 0, "seconds": 0., "docs_per_second": 0.}
+    started = time.perf_counter()
+
+    def write(chunk, results):
+        replaced = []
+        if results:
+            dois = [r["doi"] for r in results]
+            replaced = [m["doi"] for m in db[MENTIONS_COLLECTION].find({"doi": {"$in": dois}}, {"doi": 1})]
+            db[MENTIONS_COLLECTION].bulk_write([ReplaceOne({"doi": r["doi"]}, dict(r, extracted_on=now()), upsert=True)
+                                                for r in results], ordered=False)
+        if replaced:
+            build_search_collection(db, dois=replaced)
+        checkpoints.update_one({"_id": MENTIONS_COLLECTION},
+                               {"$set": {"last_id": chunk[-1]["_id"], "updated_on": now()}}, upsert=True)
+        stats["documents"] += len(chunk)
+        stats["written"] += len(results)
+        stats["replaced"] += len(replaced)
+        stats["mentions"] += sum(len(r["names"]) for r in results)
+        stats["seconds"] = time.perf_counter() - started
+        stats["docs_per_second"] = stats["documents"] / stats["seconds"]
+        if verbose:
+            print("{documents} documents, {mentions} mentions, {docs_per_second:.1f} docs/s".format(**stats))
+
+    if workers == 0:
+        for chunk in _chunks(cursor, chunk_size):
+            write(chunk, extract_chunk(chunk))
+        return stats
+
+    # chunks are written in the order they were read, with at most 2 chunks per worker in flight
+    pending = collections.deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+        for chunk in _chunks(cursor, chunk_size):
+            pending.append((chunk, executor.submit(extract_chunk, chunk)))
+            if len(pending) >= 2 * workers:
+                chunk, future = pending.popleft()
+                write(chunk, future.result())
+        while pending:
+            chunk, future = pending.popleft()
+            write(chunk, future.result())
+    return stats
+
+
+if __name__ == '__main__':
+    from matstract.models.database import AtlasConnection
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--full", action="store_true", help="extract from the first abstract")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--db", default="production")
+    args = parser.parse_args()
+    print(extract_corpus(AtlasConnection(access="admin", db=args.db).db, full=args.full, workers=args.workers,
+                         chunk_size=args.chunk_size, limit=args.limit, verbose=True))
@@ -1,26 +1,48 @@
 import re
 import collections
-import sympy
-from sympy.abc import _clash
+import threading
 from chemdataextractor.doc import Document
-from pymatgen.core.periodic_table import Element
-from pymatgen.core.composition import Composition, CompositionError
-import pubchempy as pcp
+from matstract.extract import pubchem, stoichiometry
+from matstract.extract.formula import ELEMENTS, ALIASES, parse_formula, normalize_formula
+
+# chemical symbols, including deuterium and tritium
+SYMBOLS = ELEMENTS | frozenset(ALIASES)
 
 
 class MaterialParser:
-    def __init__(self):
-        self.__list_of_elements_1 = ['H', 'B', 'C', 'N', 'O', 'F', 'P', 'S', 'K', 'V', 'Y', 'I', 'W', 'U']
-        self.__list_of_elements_2 = ['He', 'Li', 'Be', 'Ne', 'Na', 'Mg', 'Al', 'Si', 'Cl', 'Ar', 'Ca', 'Sc', 'Ti', 'Cr',
-                                     'Mn', 'Fe', 'Co', 'Ni', 'Cu', 'Zn', 'Ga', 'Ge', 'As', 'Se', 'Br', 'Kr', 'Rb', 'Sr',
-                                     'Zr', 'Nb', 'Mo', 'Tc', 'Ru', 'Rh', 'Pd', 'Ag', 'Cd', 'In', 'Sn', 'Sb', 'Te', 'Xe',
-                                     'Cs', 'Ba', 'La', 'Ce', 'Pr', 'Nd', 'Pm', 'Sm', 'Eu', 'Gd', 'Tb', 'Dy', 'Ho', 'Er',
-                                     'Tm', 'Yb', 'Lu', 'Hf', 'Ta', 'Re', 'Os', 'Ir', 'Pt', 'Au', 'Hg', 'Tl', 'Pb', 'Bi',
-                                     'Po', 'At', 'Rn', 'Fr', 'Ra', 'Ac', 'Th', 'Pa', 'Np', 'Pu', 'Am', 'Cm', 'Bk', 'Cf',
-                                     'Es', 'Fm', 'Md', 'No', 'Lr', 'Rf', 'Db', 'Sg', 'Bh', 'Hs', 'Mt', 'Ds', 'Rg', 'Cn',
-                                     'Fl', 'Lv']
-        self.__list_of_trash_words = ['bulk', 'coated', 'rare', 'earth', 'ceramics', 'undoped']
-        self.__greek_letters = ['α', 'δ', 'χ']
+    # element tables and regular expressions are built once for all parsers
+    __list_of_elements_1 = ['H', 'B', 'C', 'N', 'O', 'F', 'P', 'S', 'K', 'V', 'Y', 'I', 'W', 'U']
+    __list_of_elements_2 = ['He', 'Li', 'Be', 'Ne', 'Na', 'Mg', 'Al', 'Si', 'Cl', 'Ar', 'Ca', 'Sc', 'Ti', 'Cr',
+                            'Mn', 'Fe', 'Co', 'Ni', 'Cu', 'Zn', 'Ga', 'Ge', 'As', 'Se', 'Br', 'Kr', 'Rb', 'Sr',
+                            'Zr', 'Nb', 'Mo', 'Tc', 'Ru', 'Rh', 'Pd', 'Ag', 'Cd', 'In', 'Sn', 'Sb', 'Te', 'Xe',
+                            'Cs', 'Ba', 'La', 'Ce', 'Pr', 'Nd', 'Pm', 'Sm', 'Eu', 'Gd', 'Tb', 'Dy', 'Ho', 'Er',
+                            'Tm', 'Yb', 'Lu', 'Hf', 'Ta', 'Re', 'Os', 'Ir', 'Pt', 'Au', 'Hg', 'Tl', 'Pb', 'Bi',
+                            'Po', 'At', 'Rn', 'Fr', 'Ra', 'Ac', 'Th', 'Pa', 'Np', 'Pu', 'Am', 'Cm', 'Bk', 'Cf',
+                            'Es', 'Fm', 'Md', 'No', 'Lr', 'Rf', 'Db', 'Sg', 'Bh', 'Hs', 'Mt', 'Ds', 'Rg', 'Cn',
+                            'Fl', 'Lv']
+    __list_of_trash_words = ['bulk', 'coated', 'rare', 'earth', 'ceramics', 'undoped']
+    __greek_letters = ['α', 'δ', 'χ']
+
+    __elements = frozenset(__list_of_elements_1 + __list_of_elements_2)
+    __one_letter_symbols = frozenset(__list_of_elements_1 + ['M'])
+    __symbols = __elements | {'Ln', 'M'}
+
+    __re_variable_amount = re.compile('(?<=[0-9])([a-z' + ''.join(__greek_letters) + '])')
+    __re_variable = re.compile('[a-z' + ''.join(__greek_letters) + ']')
+    __re_word = re.compile('[A-Za-z]+')
+    __re_symbol = re.compile(r"([A-Z]{1}[a-z]{0,1})\s*([-*\.\da-z" + ''.join(__greek_letters) + r"\+/]*)")
+    __re_group = re.compile(r"\(([^\(\)]+)\)\s*([-*\.\da-z" + ''.join(__greek_letters) + r"\+/]*)")
+    __re_group_latin = re.compile(r"\(([^\(\)]+)\)\s*([-*\.\da-z\+/]*)")
+    __re_binary_mixture = re.compile(r'\(1-x\)(.*)-\({0,1}x\){0,1}(.*)')
+    __re_mixture_part = re.compile(r'[-+]{1}([\d\.]*[A-Z][^-+]*)')
+    __re_fraction = re.compile(r'([\d\.]*)([A-Z].*)')
+    __re_hydrate = re.compile('[∙⋅](.*)')
+
+    def __init__(self, pubchem_cache=None):
+        """
+        :param pubchem_cache: pubchem.NameCache used to resolve material names, defaults to that of the process
+        """
+        self.pubchem_cache = pubchem_cache if pubchem_cache is not None else pubchem.default_cache()
 
     ###################################################################################################################
     ### Methods to build chemical structure
@@ -34,28 +56,22 @@ class MaterialParser:
         :return: string
         """
 
-        for l in self.__greek_letters:
-            _clash[l] = sympy.Symbol(l)
-
         new_value = value
-        for i, m in enumerate(re.finditer('(?<=[0-9])([a-z'+''.join(self.__greek_letters)+'])', new_value)):
+        for i, m in enumerate(self.__re_variable_amount.finditer(new_value)):
             new_value = new_value[0:m.start(1) + i] + '*' + new_value[m.start(1) + i:]
-        new_value = sympy.simplify(sympy.sympify(new_value, _clash))
-        if new_value.is_Float:
-            new_value = round(float(new_value), 3)
 
-        return str(new_value)
+        # linear expressions are evaluated directly, others with sympy
+        return stoichiometry.simplify(new_value)
 
     def __get_sym_dict(self, f, factor):
         sym_dict = collections.defaultdict(str)
-        r = "([A-Z]{1}[a-z]{0,1})\s*([-*\.\da-z"+''.join(self.__greek_letters)+"\+/]*)"
 
-        for m in re.finditer(r, f):
+        for m in self.__re_symbol.finditer(f):
             """
             checking for correct elements names
             """
-            el_bin = "{0}{1}".format(str(int(m.group(1)[0] in self.__list_of_elements_1 + ['M'])), str(
-                int(m.group(1) in self.__list_of_elements_1 + self.__list_of_elements_2 + ['Ln', 'M'])))
+            el_bin = "{0}{1}".format(str(int(m.group(1)[0] in self.__one_letter_symbols)),
+                                     str(int(m.group(1) in self.__symbols)))
             if el_bin in ['01', '11']:
                 el = m.group(1)
                 amt = m.group(2)
@@ -89,10 +105,9 @@ class MaterialParser:
             Composition with that formula.
         """
         formula_dict = collections.defaultdict(str)
-        r = "\(([^\(\)]+)\)\s*([-*\.\da-z"+''.join(self.__greek_letters)+"\+/]*)"
 
-        while len(re.findall(r, formula)) > 0:
-            for m in re.finditer(r, formula):
+        while self.__re_group.search(formula):
+            for m in self.__re_group.finditer(formula):
                 factor = "1"
                 if m.group(2) != "":
                     factor = m.group(2)
@@ -120,7 +135,7 @@ class MaterialParser:
         incorrect = []
         for el, amt in formula_dict.items():
             formula_dict[el] = self.__simplify(amt)
-            if any(len(c) > 1 for c in re.findall('[A-Za-z]+', formula_dict[el])):
+            if any(len(c) > 1 for c in self.__re_word.findall(formula_dict[el])):
                 incorrect.append(el)
 
         for el in incorrect:
@@ -140,8 +155,7 @@ class MaterialParser:
         stoichiometry_variables = collections.defaultdict(str)
 
         # check for any weird syntax
-        r = "\(([^\(\)]+)\)\s*([-*\.\da-z\+/]*)"
-        for m in re.finditer(r, formula):
+        for m in self.__re_group_latin.finditer(formula):
             if not m.group(1).isupper() and m.group(2) == '':
                 formula = formula.replace('(' + m.group(1) + ')', m.group(1), 1)
             if ',' in m.group(1):
@@ -152,9 +166,9 @@ class MaterialParser:
 
         # looking for variables in elements and stoichiometry
         for el, amt in composition.items():
-            if el not in self.__list_of_elements_1 + self.__list_of_elements_2 + list(elements_variables.keys()):
+            if el not in self.__elements and el not in elements_variables:
                 elements_variables[el] = []
-            for var in re.findall('[a-z'+''.join(self.__greek_letters)+']', amt):
+            for var in self.__re_variable.findall(amt):
                 stoichiometry_variables[var] = []
 
         formula_structure = dict(
@@ -190,7 +204,7 @@ class MaterialParser:
 
         mixture = {}
 
-        for m in re.finditer('\(1-x\)(.*)-\({0,1}x\){0,1}(.*)', material_name.replace(' ', '')):
+        for m in self.__re_binary_mixture.finditer(material_name.replace(' ', '')):
             mixture[m.group(1)] = {}
             mixture[m.group(2)] = {}
             mixture[m.group(1)]['fraction'] = '1-x'
@@ -201,9 +215,9 @@ class MaterialParser:
             for i in [1, 2]:
                 if m.group(i)[0] == '(' and m.group(i)[-1] == ')':
                     line = m.group(i)[1:-1]
-                    parts = [s for s in re.split('[-+]{1}([\d\.]*[A-Z][^-+]*)', line) if s != '' and s != line]
+                    parts = [s for s in self.__re_mixture_part.split(line) if s != '' and s != line]
                     for s in parts:
-                        name = re.findall('([\d\.]*)([A-Z].*)', s.strip(' -+()'))[0]
+                        name = self.__re_fraction.findall(s.strip(' -+()'))[0]
                         mixture[name[1]] = {}
                         fraction = name[0]
                         if fraction == '': fraction = '1'
@@ -212,9 +226,9 @@ class MaterialParser:
                     del mixture[m.group(i)]
 
         if mixture == {}:
-            parts = [s for s in re.split('[-+]{1}([\d\.]*[A-Z][^-+]*)', material_name.replace(' ', '')) if s != '' and s != material_name.replace(' ', '')]
+            parts = [s for s in self.__re_mixture_part.split(material_name.replace(' ', '')) if s != '' and s != material_name.replace(' ', '')]
             for s in parts:
-                name = re.findall('([\d\.]*)([A-Z].*)', s.strip(' -+()'))[0]
+                name = self.__re_fraction.findall(s.strip(' -+()'))[0]
                 mixture[name[1]] = {}
                 fraction = name[0]
                 if fraction == '': fraction = '1'
@@ -232,33 +246,8 @@ class MaterialParser:
         :param material_name: string of material name
         :return: dictionary composition and stoichiometric variables
         """
-        chemical_structure = dict(
-            composition={},
-            mixture={},
-            fraction_vars={},
-            elements_vars={},
-            formula='',
-            chemical_name=''
-        )
-
-        material_name = re.sub('[∙⋅](.*)', '', material_name)
-
-        chemical_structure['mixture'] = self.get_mixture(material_name)
-
-        chemical_structure['formula'] = ''.join(chemical_structure['mixture'].keys())
-        if chemical_structure['formula'] == '':
-            chemical_structure['formula'] = material_name
-
-        # trying to extract chemical structure
-        try:
-            t_struct = self.get_structure_by_formula(chemical_structure['formula'])
-        except:
-            t_struct = self.__empty_structure()
-            #print('Something went wrong!' + material_name)
-            # return self.__empty_structure()
-
-        chemical_structure['composition'] = t_struct['composition']
-        # TODO: merge fraction variables
+        material_name = self.__re_hydrate.sub('', material_name)
+        chemical_structure = self.__formula_structure(material_name)
 
         # if material name is not proper formula look for it in DB (pubchem, ICSD)
         if not self.__is_correct_composition(chemical_structure['formula'], chemical_structure['composition']):
@@ -267,11 +256,10 @@ class MaterialParser:
             # chemical_structure['stoichiometry_vars'] = collections.defaultdict(str)
             chemical_structure['elements_vars'] = collections.defaultdict(str)
 
-            pcp_compounds = pcp.get_compounds(material_name, 'name')
-            if len(pcp_compounds) > 0:
+            pcp_formula = self.pubchem_cache.resolve(material_name)
+            if pcp_formula is not None:
                 try:
-                    chemical_structure['composition'] = self.get_structure_by_formula(pcp_compounds[0].molecular_formula)[
-                        'composition']
+                    chemical_structure['composition'] = self.get_structure_by_formula(pcp_formula)['composition']
                 except:
                     chemical_structure['composition'] = collections.defaultdict(str)
 
@@ -292,27 +280,86 @@ class MaterialParser:
 
         return chemical_structure
 
+    def resolve_names(self, material_names, workers=4):
+        """
+        Resolves with PubChem, in one batch, the distinct material names that get_chemical_structure would look up,
+        so that parsing them afterwards only reads the PubChem cache
+        :param material_names: iterable of material names, e.g. all the mentions of a corpus
+        :param workers: number of concurrent PubChem lookups
+        :return: dictionary name: formula (None if unresolved) of the names that are not formulas
+        """
+        names = set()
+        for material_name in set(material_names):
+            material_name = self.__re_hydrate.sub('', material_name)
+            chemical_structure = self.__formula_structure(material_name)
+            if not self.__is_correct_composition(chemical_structure['formula'], chemical_structure['composition']):
+                names.add(material_name)
+        return self.pubchem_cache.resolve_many(names, workers=workers)
+
+    def parse_many(self, material_names, resolve=True, workers=4):
+        """
+        Batch version of get_chemical_structure for the mentions of a corpus: every distinct name is parsed once and
+        the names that are not formulas are resolved with PubChem in one batch (see resolve_names)
+        :param material_names: iterable of material names, possibly repeated
+        :param resolve: whether to resolve the names missing from the PubChem cache first, otherwise they are looked
+        up one by one unless the cache is offline
+        :param workers: number of concurrent PubChem lookups
+        :return: dictionary name: chemical structure of the distinct names
+        """
+        names = set(material_names)
+        if resolve:
+            self.resolve_names(names, workers=workers)
+        return {name: self.get_chemical_structure(name) for name in names}
+
+    def __formula_structure(self, material_name):
+        """
+        Chemical structure of a material name read as a formula (or mixture of formulas)
+        """
+        chemical_structure = dict(
+            composition={},
+            mixture={},
+            fraction_vars={},
+            elements_vars={},
+            formula='',
+            chemical_name=''
+        )
+
+        chemical_structure['mixture'] = self.get_mixture(material_name)
+
+        chemical_structure['formula'] = ''.join(chemical_structure['mixture'].keys())
+        if chemical_structure['formula'] == '':
+            chemical_structure['formula'] = material_name
+
+        # trying to extract chemical structure
+        try:
+            t_struct = self.get_structure_by_formula(chemical_structure['formula'])
+        except:
+            t_struct = self.__empty_structure()
+            #print('Something went wrong!' + material_name)
+            # return self.__empty_structure()
+
+        chemical_structure['composition'] = t_struct['composition']
+        # TODO: merge fraction variables
+
+        return chemical_structure
+
 
 class SimplifiedMaterialParser:
     def __init__(self):
         self.name = "ImprovedMaterialParser"
 
     def is_element(self, element):
-        try:
-            Element(element)
-            return True
-        except:
-            return False
+        return element in SYMBOLS
 
     def parse_formula(self, formula):
 
         try:
-            composition = Composition(formula)
-
-        except CompositionError:
+            composition = parse_formula(formula)
+        except ValueError:
             print("need a better parser!")
+            return
 
-        if any([not self.is_element(key) for key in composition.keys()]):
+        if any(not self.is_element(key) for key in composition):
             print("need to handle substitution")
 
         # if "(" and ")" in formula:
@@ -407,6 +454,60 @@ def test_text_parsing():
 #if __name__ == "__main__":
 #    test_text_parsing()
 
+class NormalizationCache:
+    '''
+    Bounded, thread-safe LRU cache mapping chemical mentions to their normalized form (or False if they are not
+    formulae), with hit, miss and eviction counters.
+    '''
+
+    MISSING = object()
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, mention):
+        return mention in self._data
+
+    def get(self, mention):
+        '''
+        Returns the cached normalization of mention, or NormalizationCache.MISSING.
+        '''
+        with self._lock:
+            try:
+                normalized = self._data[mention]
+            except KeyError:
+                self.counters["misses"] += 1
+                return self.MISSING
+            self._data.move_to_end(mention)
+            self.counters["hits"] += 1
+            return normalized
+
+    def put(self, mention, normalized):
+        with self._lock:
+            self._data[mention] = normalized
+            self._data.move_to_end(mention)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        '''
+        Returns a snapshot of the counters and the size of the cache.
+        '''
+        with self._lock:
+            return dict(self.counters, size=len(self._data))
+
+
 class SimpleParser:
     '''
     A parser class to identify chemical mentions, and related them
@@ -426,8 +527,12 @@ class SimpleParser:
     'FeLiO4P'
     >>> parser.parse(Sr(Zr0.5Ti0.5)O3)
     'O6Sr2TiZr'
+
+    Normalizations are memoized in SimpleParser.cache, which is shared by all parsers of the process.
     '''
 
+    cache = NormalizationCache()
+
     def __init__(self):
         self.name = "ImprovedMaterialParser"
 
@@ -435,11 +540,7 @@ class SimpleParser:
         '''
         Checks if element is a chemical symbol.
         '''
-        try:
-            Element(element)
-            return True
-        except:
-            return False
+        return element in SYMBOLS
 
     def alphabetize(self, formula):
         '''
@@ -451,18 +552,23 @@ class SimpleParser:
         '''
         Converts formula string to canonical (normalized, alphabetized) form.
         Returns defaultdict() object containing formula if successful. Returns false
-        if an exception is raised.
+        if an exception is raised. Results are cached in SimpleParser.cache.
         '''
+        if not isinstance(formula, str):
+            return self._matgen_parser(formula)
+        normalized = self.cache.get(formula)
+        if normalized is NormalizationCache.MISSING:
+            normalized = self._matgen_parser(formula)
+            self.cache.put(formula, normalized)
+        return normalized
+
+    def _matgen_parser(self, formula):
+        # same result as pymatgen's Composition(formula) integer and reduced formulas, see extract.formula
+        if not isinstance(formula, str):
+            return False
         try:
-            integer_formula, factor = Composition(formula).get_integer_formula_and_factor()
-            composition = Composition(integer_formula)
-            if any([not self.is_element(key) for key in composition.keys()]):
-                return False
-            else:
-                reduced = composition.get_reduced_formula_and_factor()[0]
-                ordered = self.alphabetize(reduced)
-                return ordered
-        except:
+            return normalize_formula(formula) or False
+        except (ValueError, OverflowError):
             return False
 
     def regexp_parser(self, formula):
@@ -474,15 +580,29 @@ class SimpleParser:
         Parses and returns formula.
         '''
         parsers = [self.matgen_parser]  # , regexp_parser]
-        parsed = False
         for parser in parsers:
-            if parser(cem):
-                parsed = parser(cem)
-                break
-        if parsed:
-            return parser(cem)
-        else:
-            return False
+            parsed = parser(cem)
+            if parsed:
+                return parsed
+        return False
+
+    def warm_start(self, formulas, limit=10000):
+        '''
+        Fills the cache with the most frequent writings of a formulas vocabulary, e.g. EmbeddingEngine.formulas.
+
+        :param formulas: dict of normalized formula -> dict of writing -> count
+        :param limit: maximum number of writings to normalize
+        :return: number of writings added to the cache
+        '''
+        writings = collections.Counter()
+        for counts in formulas.values():
+            writings.update(counts)
+        added = 0
+        for writing, _ in writings.most_common(limit):
+            if writing not in self.cache:
+                self.cache.put(writing, self._matgen_parser(writing))
+                added += 1
+        return added
 
 
 def materials_extract(text):
@@ -0,0 +1,190 @@
+"""
+Persistent cache of the PubChem name -> molecular formula lookups of MaterialParser.
+
+Lookups are stored in a SQLite database (MATSTRACT_PUBCHEM_CACHE, ~/.matstract/pubchem_names.sqlite by default) that
+can be shared by several processes. Names without a PubChem match are cached too, and looked up again after
+NEGATIVE_TTL. Names are compared case and whitespace insensitively.
+
+With MATSTRACT_PUBCHEM_OFFLINE=1 (or offline=True) only the cache is read, so that parsing a corpus is fast and
+gives the same results on every run. resolve_many dedupes the names of a whole corpus and reads the cache in bulk
+before looking up the missing names, see MaterialParser.resolve_names.
+"""
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os import environ as env
+from urllib.error import URLError
+import pubchempy as pcp
+from matstract.collect.ratelimit import RateLimiter
+
+CACHE_PATH = env.get("MATSTRACT_PUBCHEM_CACHE",
+                     os.path.join(os.path.expanduser("~"), ".matstract", "pubchem_names.sqlite"))
+
+# whether names missing from the cache are left unresolved instead of being looked up
+OFFLINE = env.get("MATSTRACT_PUBCHEM_OFFLINE", "").lower() in ("1", "true", "yes")
+
+# seconds after which names without a match are looked up again
+NEGATIVE_TTL = 30 * 24 * 3600
+
+# PubChem allows up to 5 requests per second
+RATE = 5
+
+# names per query when reading the cache in bulk
+_BATCH = 500
+
+
+def name_key(name):
+    return " ".join(name.split()).lower()
+
+
+def lookup(name):
+    """ Returns the molecular formula of the first PubChem compound named name, or None. """
+    results = pcp.get_properties("MolecularFormula", name, "name")
+    return results[0].get("MolecularFormula") if results else None
+
+
+class PubChemRateLimiter(RateLimiter):
+    """ RateLimiter retrying the transient failures of PubChem. """
+
+    def is_retryable(self, error):
+        if isinstance(error, (pcp.ServerBusyError, pcp.ServerError, pcp.TimeoutError, URLError)):
+            return True
+        return super(PubChemRateLimiter, self).is_retryable(error)
+
+
+class NameCache(object):
+    """ SQLite cache of name -> formula lookups, with negative caching and an offline mode. """
+
+    def __init__(self, path=CACHE_PATH, offline=OFFLINE, negative_ttl=NEGATIVE_TTL, lookup=lookup, limiter=None,
+                 clock=time.time):
+        """
+        Args:
+            path: (str) SQLite database of the cache. Its directory is created if it does not exist.
+            offline: (bool) whether names missing from the cache are left unresolved. Default is OFFLINE.
+            negative_ttl: (float) seconds after which names without a match are looked up again.
+            lookup: (callable) returns the formula of a name or None, see lookup.
+            limiter: (RateLimiter, optional) throttle of the lookups. Defaults to RATE requests per second.
+            clock: (callable) returns the current time in seconds.
+        """
+        self.path = path
+        self.offline = offline
+        self.negative_ttl = negative_ttl
+        self.lookup = lookup
+        self.limiter = limiter if limiter is not None else PubChemRateLimiter(rate=RATE)
+        self._clock = clock
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "negative_hits": 0, "misses": 0, "lookups": 0, "errors": 0}
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def _connection(self):
+        # one connection per thread and process
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS names "
+                               "(key TEXT PRIMARY KEY, name TEXT, formula TEXT, resolved_on REAL)")
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def stats(self):
+        """ Returns a snapshot of the counters. """
+        with self._lock:
+            return dict(self.counters)
+
+    def cached(self, names):
+        """
+        Reads names from the cache.
+
+        Returns:
+            (dict) name key -> formula, or None for the names without a match. Names that are not cached, or whose
+            negative entry expired (unless offline), are left out.
+
+        """
+        keys = list({name_key(name) for name in names})
+        found = {}
+        connection = self._connection()
+        expired = self._clock() - self.negative_ttl
+        for i in range(0, len(keys), _BATCH):
+            batch = keys[i:i + _BATCH]
+            rows = connection.execute("SELECT key, formula, resolved_on FROM names WHERE key IN ({})".format(
+                ",".join("?" * len(batch))), batch)
+            for key, formula, resolved_on in rows:
+                if formula is not None or self.offline or resolved_on > expired:
+                    found[key] = formula
+        return found
+
+    def put(self, name, formula):
+        """ Stores the formula of name, None if PubChem has no match. """
+        with self._connection() as connection:
+            connection.execute("INSERT OR REPLACE INTO names VALUES (?, ?, ?, ?)",
+                               (name_key(name), name, formula, self._clock()))
+
+    def _lookup(self, name):
+        self._count("lookups")
+        try:
+            formula = self.limiter.call(lambda: self.lookup(name))
+        except Exception:
+            # not cached, so that the name is looked up again on the next run
+            self._count("errors")
+            return None
+        self.put(name, formula)
+        return formula
+
+    def resolve(self, name):
+        """ Returns the formula of name from the cache or, unless offline, from PubChem. None if unresolved. """
+        cached = self.cached([name])
+        if cached:
+            formula, = cached.values()
+            self._count("hits" if formula is not None else "negative_hits")
+            return formula
+        self._count("misses")
+        return None if self.offline else self._lookup(name)
+
+    def resolve_many(self, names, workers=4):
+        """
+        Resolves the distinct names of names, reading the cache once and looking up the missing names concurrently
+        (within the rate limit) unless offline.
+
+        Args:
+            names: (iterable) material names, possibly repeated.
+            workers: (int) number of concurrent lookups. Default is 4.
+
+        Returns:
+            (dict) name -> formula, or None if unresolved.
+
+        """
+        names = set(names)
+        cached = self.cached(names)
+        hits = list(cached.values())
+        self._count("hits", sum(formula is not None for formula in hits))
+        self._count("negative_hits", sum(formula is None for formula in hits))
+        missing = {}
+        for name in names:
+            if name_key(name) not in cached:
+                missing.setdefault(name_key(name), name)
+        self._count("misses", len(missing))
+        resolved = dict(cached)
+        if missing and not self.offline:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                resolved.update(zip(missing, executor.map(self._lookup, missing.values())))
+        return {name: resolved.get(name_key(name)) for name in names}
+
+
+_default = None
+
+
+def default_cache():
+    """ Returns the NameCache of the process, configured from the environment. """
+    global _default
+    if _default is None:
+        _default = NameCache()
+    return _default
@@ -0,0 +1,250 @@
+"""
+Evaluator of the stoichiometric expressions of MaterialParser, e.g. "(0)+(1-x)*(1)", in place of sympy.
+
+Amounts in formulas such as Li1-xFexPO4 or Sr(Zr0.5Ti0.5)O3 are linear in their variables, so simplify evaluates them
+as rational (or float) coefficients of single letter variables and prints the result exactly as
+str(sympy.simplify(sympy.sympify(expression))) does, rounding float constants to 3 decimals as MaterialParser always
+did. Expressions outside of this subset (products of variables, powers, multi-letter names, long decimals,
+division by zero...) are handed to sympy.
+"""
+import operator
+import re
+from fractions import Fraction
+import sympy
+from mpmath.libmp import from_float, to_str
+from sympy.abc import _clash
+
+# variable names besides the latin lowercase letters
+GREEK_LETTERS = ['α', 'δ', 'χ']
+
+# names of the variables of linear expressions
+VARIABLES = frozenset("abcdefghijklmnopqrstuvwxyz") | frozenset(GREEK_LETTERS)
+
+# sympy namespace of sympify: single letters that clash with sympy objects (E, I, N, S...) and the greek letters are
+# symbols
+SYMPY_NAMESPACE = dict(_clash, **{letter: sympy.Symbol(letter) for letter in GREEK_LETTERS})
+
+_TOKEN = re.compile(r"\s*(?:(\d+\.?\d*|\.\d+)|(\w+)|(\*\*|[-+*/()]))")
+
+# significant digits of sympy Floats parsed from short decimals
+_FLOAT_DIGITS = 15
+
+
+class UnsupportedExpression(ValueError):
+    pass
+
+
+def _tokens(expression, variables):
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = _TOKEN.match(expression, position)
+        if match is None:
+            raise UnsupportedExpression(expression)
+        number, name, operator = match.groups()
+        if number is not None:
+            if len(number.replace(".", "").lstrip("0")) > _FLOAT_DIGITS or \
+                    ("." not in number and number.startswith("0") and len(number) > 1):
+                raise UnsupportedExpression(number)
+            tokens.append(("number", float(number) if "." in number else Fraction(int(number))))
+        elif name is not None:
+            if name not in variables:
+                raise UnsupportedExpression(name)
+            tokens.append(("name", name))
+        else:
+            if operator == "**":
+                raise UnsupportedExpression(operator)
+            tokens.append((operator, None))
+        position = match.end()
+    tokens.append(("end", None))
+    return tokens
+
+
+class _Parser(object):
+    """ Recursive descent parser of linear expressions into ({variable: Fraction}, constant). """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position][0]
+
+    def take(self):
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def parse(self):
+        value = self.expression()
+        if self.peek() != "end":
+            raise UnsupportedExpression(self.peek())
+        return value
+
+    def expression(self):
+        value = self.term()
+        while self.peek() in ("+", "-"):
+            operator, _ = self.take()
+            other = self.term()
+            value = _add(value, other if operator == "+" else _scale(other, Fraction(-1)))
+        return value
+
+    def term(self):
+        value = self.factor()
+        while self.peek() in ("*", "/"):
+            operator, _ = self.take()
+            other = self.factor()
+            value = _multiply(value, other) if operator == "*" else _divide(value, other)
+        return value
+
+    def factor(self):
+        kind, value = self.take()
+        if kind == "+":
+            return self.factor()
+        if kind == "-":
+            return _scale(self.factor(), Fraction(-1))
+        if kind == "number":
+            return {}, value
+        if kind == "name":
+            return {value: Fraction(1)}, Fraction(0)
+        if kind == "(":
+            value = self.expression()
+            if self.take()[0] != ")":
+                raise UnsupportedExpression("(")
+            return value
+        raise UnsupportedExpression(kind)
+
+
+def _number(a, b, operation):
+    # numbers are exact (Fraction) unless a float is involved. As in sympy, float results equal to zero are exact
+    if isinstance(a, float) or isinstance(b, float):
+        result = operation(float(a), float(b))
+        return Fraction(0) if result == 0 else result
+    return operation(a, b)
+
+
+def _add(a, b):
+    terms = dict(a[0])
+    for name, coefficient in b[0].items():
+        terms[name] = _number(terms.get(name, Fraction(0)), coefficient, operator.add)
+    return {name: c for name, c in terms.items() if c != 0}, _number(a[1], b[1], operator.add)
+
+
+def _scale(value, factor):
+    terms = {name: _number(c, factor, operator.mul) for name, c in value[0].items()}
+    return {name: c for name, c in terms.items() if c != 0}, _number(value[1], factor, operator.mul)
+
+
+def _is_zero(value):
+    return not value[0] and not isinstance(value[1], float) and value[1] == 0
+
+
+def _multiply(a, b):
+    if a[0] and b[0]:
+        raise UnsupportedExpression("non-linear")
+    # as in sympy, an exact zero times a float is an exact zero
+    if _is_zero(a) or _is_zero(b):
+        return {}, Fraction(0)
+    return _scale(b, a[1]) if not a[0] else _scale(a, b[1])
+
+
+def _divide(a, b):
+    if b[0] or b[1] == 0:
+        raise UnsupportedExpression("division")
+    if _is_zero(a):
+        return a
+    return _scale(a, 1 / b[1])
+
+
+def _format_constant(constant):
+    if isinstance(constant, float):
+        text = to_str(from_float(constant), _FLOAT_DIGITS, strip_zeros=True)
+        if text.startswith('-.0'):
+            text = '-0.' + text[3:]
+        elif text.startswith('.0'):
+            text = '0.' + text[2:]
+        return text
+    return str(constant)
+
+
+def _format_term(name, coefficient):
+    if isinstance(coefficient, float):
+        return "{}*{}".format(_format_constant(coefficient), name)
+    numerator, denominator = coefficient.numerator, coefficient.denominator
+    if abs(numerator) == 1:
+        text = ("-" if numerator < 0 else "") + name
+    else:
+        text = "{}*{}".format(numerator, name)
+    return text if denominator == 1 else "{}/{}".format(text, denominator)
+
+
+def linear_simplify(expression, variables=VARIABLES):
+    """
+    Evaluates a linear stoichiometric expression.
+
+    Args:
+        expression: (str) expression with explicit products, e.g. "(0)+(1-2*x)*(1)".
+        variables: (set) allowed variable names. Default: VARIABLES
+
+    Returns:
+        (str) the expression as printed by sympy after simplification.
+
+    Raises:
+        UnsupportedExpression: if the expression is not in the supported subset.
+
+    """
+    terms, constant = _Parser(_tokens(expression, variables)).parse()
+    if not terms:
+        if isinstance(constant, float):
+            if abs(constant * 1000 % 1 - 0.5) < 1e-6:
+                # the rounding depends on the order of the float operations
+                raise UnsupportedExpression("rounding")
+            return str(round(constant, 3))
+        return str(constant)
+    floats = [isinstance(c, float) for c in terms.values()]
+    if any(floats) and not (all(floats) and (isinstance(constant, float) or constant.denominator == 1)):
+        # sympy.simplify turns the exact numbers of these expressions into floats
+        raise UnsupportedExpression("float and exact coefficients")
+    # sympy prints the terms in alphabetical order of their variable, followed by the constant, except for
+    # "constant - coefficient*variable"
+    if isinstance(constant, float) and any(not isinstance(c, float) and abs(c.numerator) != 1 and
+                                           (c.denominator != 1 or len(terms) > 1) for c in terms.values()):
+        # depending on its other terms, sympy.simplify may turn these coefficients into floats
+        raise UnsupportedExpression("coefficient with a float constant")
+    ordered = [_format_term(name, terms[name]) for name in sorted(terms)]
+    if constant != 0:
+        if len(ordered) == 1 and constant > 0 and ordered[0].startswith("-"):
+            ordered.insert(0, _format_constant(constant))
+        else:
+            ordered.append(_format_constant(constant))
+    text = ordered[0]
+    for term in ordered[1:]:
+        text += " - " + term[1:] if term.startswith("-") else " + " + term
+    return text
+
+
+def sympy_simplify(expression):
+    """ str(sympy.simplify(sympy.sympify(expression))), floats rounded to 3 decimals. """
+    value = sympy.simplify(sympy.sympify(expression, SYMPY_NAMESPACE))
+    if value.is_Float:
+        value = round(float(value), 3)
+    return str(value)
+
+
+def simplify(expression):
+    """
+    Simplifies a stoichiometric expression, with linear_simplify or, for the expressions it doesn't support,
+    with sympy.
+
+    Args:
+        expression: (str) expression with explicit products, e.g. "(0)+(1-2*x)*(1)".
+
+    Returns:
+        (str) simplified expression, e.g. "1 - 2*x".
+
+    """
+    try:
+        return linear_simplify(expression)
+    except UnsupportedExpression:
+        return sympy_simplify(expression)
@@ -0,0 +1,80 @@
+import random
+import re
+import unittest
+from pymatgen.core.composition import Composition
+from pymatgen.core.periodic_table import Element
+from matstract.extract.formula import ELEMENTS, parse_formula, normalize_formula
+
+MENTIONS = [
+    "LiFePO4", "SrZrO3", "Sr0.5Zr0.5O1.5", "Ca(NO3)2", "Li2(FePO4)2", "Sr(Zr0.5Ti0.5)O3", "Ba[Fe(CN)6]", "K{Al2}O3",
+    "Bi2Te3", "CH3NH3PbI3", "(CH3NH3)PbI3", "La0.7Sr0.3MnO3", "LiNi1/3Mn1/3Co1/3O2", "Li7La3Zr2O12", "Y3N@C80",
+    "Fe2O3", "TiO2", "ZnO", "H2O", "D2O", "HDO", "O2", "O", "N2", "H", "LiO", "Na2O2", "KO2", "Cl", "NaCl",
+    "Al2(SO4)3", "Cu(OH)2", "Mg((OH)2)3", "Li1e-2O", "Li2 O", "Fe3O4", "Ag", "Hg2Cl2", "CuSO4", "C60", "graphene",
+    "battery", "XRD", "SEM", "TEM", "X", "Xx2O", "Hh2O", "II", "IV", "CO", "Co", "NO", "No", "Pb(Zr0.52Ti0.48)O3",
+    "Li0.33La0.557TiO3", "Ni0.8Co0.15Al0.05", "GaN", "InGaN", "AlGaAs", "Cd1-xZnxTe", "Li2-O", "Fe-O", "2H2O",
+    "", " ", "12", "1.5", "*", "O-2", "Li2O(", "Fe)", "Og", "Uue", "NaK", "Ts2O", "He", "CaCO3", "K4[Fe(CN)6]",
+    "Li3PS4", "Li10GeP2S12", "Sn0.999Sb0.001O2", "Mo0.5W0.5S2", "Nd2Fe14B", "SmCo5", "YBa2Cu3O7", "YBa2Cu3O6.5",
+]
+
+
+def pymatgen_normalize(formula):
+    """ SimpleParser's original Composition pipeline. """
+    try:
+        integer_formula, factor = Composition(formula).get_integer_formula_and_factor()
+        composition = Composition(integer_formula)
+        if any(not Element.is_valid_symbol(str(key)) for key in composition.keys()):
+            return False
+        return ''.join(sorted(re.findall(r'[A-Z][a-z]?\d*', composition.get_reduced_formula_and_factor()[0])))
+    except Exception:
+        return False
+
+
+def random_formula(rng):
+    symbols = sorted(ELEMENTS)
+
+    def amount():
+        return rng.choice(["", "", "2", "3", "4", "12", "0.5", "0.25", "1.5", "0.333", "0.01", "1e-3"])
+
+    def group(depth):
+        parts = []
+        for _ in range(rng.randint(1, 3)):
+            if depth < 2 and rng.random() < 0.2:
+                parts.append("(" + group(depth + 1) + ")" + amount())
+            else:
+                parts.append(rng.choice(symbols) + amount())
+        return "".join(parts)
+    return group(0)
+
+
+class TestFormula(unittest.TestCase):
+    def assertSameAsPymatgen(self, mentions):
+        for mention in mentions:
+            self.assertEqual(normalize_formula(mention) or False, pymatgen_normalize(mention), mention)
+
+    def test_mentions_match_pymatgen(self):
+        self.assertSameAsPymatgen(MENTIONS)
+
+    def test_random_formulas_match_pymatgen(self):
+        rng = random.Random(0)
+        self.assertSameAsPymatgen([random_formula(rng) for _ in range(3000)])
+
+    def test_parse_formula(self):
+        self.assertEqual(parse_formula("Li0.5Fe(PO4)0.5"), {"Li": 0.5, "Fe": 1., "P": 0.5, "O": 2.})
+        self.assertEqual(parse_formula("HD"), {"H": 2.})
+        self.assertRaises(ValueError, parse_formula, "Li2O(")
+
+    def test_non_finite_amounts(self):
+        for mention in ["Fe1e999", "Fe1e400O2", "(FeO)1e999", "(Fe0)1e999O", "Fe1e308Fe1e308", "H1e308D1e308"]:
+            self.assertRaises(ValueError, parse_formula, mention)
+            self.assertIsNone(normalize_formula(mention))
+
+    def test_hydrates(self):
+        # rejected by pymatgen
+        self.assertEqual(normalize_formula("CuSO4·5H2O"), normalize_formula("CuSO4(H2O)5"))
+        self.assertEqual(normalize_formula("MgSO4 * 7 H2O"), "H14MgO11S")
+        self.assertEqual(normalize_formula("Na2CO3•H2O"), "CH2Na2O4")
+        self.assertIsNone(normalize_formula("Li*"))
+
+
+if __name__ == '__main__':
+    unittest.main()
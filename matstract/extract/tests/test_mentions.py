@@ -0,0 +1,62 @@
+import unittest
+from unittest import mock
+import mongomock
+from matstract.extract import mentions
+from matstract.extract.parsing import TextParser
+from matstract.models.search_collection import SEARCH_COLLECTION, build_search_collection
+
+
+def extract_chemdata(self, text):
+    return [[word] for word in text.replace(".", " ").split() if word[0].isupper()]
+
+
+class TestExtractCorpus(unittest.TestCase):
+    def setUp(self):
+        self.db = mongomock.MongoClient().db
+        self.db.abstracts.insert_many([
+            {"doi": "10.1/0", "title": "LiFePO4 cathodes", "abstract": "Olivine Li2(FePO4)2 and ZnO."},
+            {"title": "No DOI", "abstract": "TiO2"},
+            {"doi": "10.1/2", "title": "Thermoelectrics", "abstract": "Bi2Te3 is Bi2Te3."},
+        ])
+        patcher = mock.patch.object(TextParser, "extract_chemdata", extract_chemdata)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        mentions._worker.clear()
+        self.addCleanup(mentions._worker.clear)
+
+    def test_extract_and_resume(self):
+        stats = mentions.extract_corpus(self.db, workers=0, chunk_size=2)
+        self.assertEqual((stats["documents"], stats["written"], stats["mentions"]), (3, 2, 7))
+        mats = self.db[mentions.MENTIONS_COLLECTION].find_one({"doi": "10.1/0"})
+        self.assertEqual(mats["names"], ["LiFePO4", "Olivine", "Li2(FePO4)2", "ZnO"])
+        self.assertEqual(mats["unique_mats"], ["FeLiO4P", "OZn"])
+
+        self.assertEqual(mentions.extract_corpus(self.db, workers=0)["documents"], 0)
+        self.db.abstracts.insert_one({"doi": "10.1/3", "title": "Oxides", "abstract": "SrZrO3"})
+        stats = mentions.extract_corpus(self.db, workers=0)
+        self.assertEqual(stats["documents"], 1)
+        self.assertEqual(self.db[mentions.MENTIONS_COLLECTION].find_one({"doi": "10.1/3"})["unique_mats"],
+                         ["O3SrZr"])
+        self.assertEqual(mentions.extract_corpus(self.db, workers=0, full=True)["documents"], 4)
+        self.assertEqual(self.db[mentions.MENTIONS_COLLECTION].count_documents({}), 3)
+
+    def test_doi_index(self):
+        mentions.extract_corpus(self.db, workers=0)
+        index = self.db[mentions.MENTIONS_COLLECTION].index_information()["doi_1"]
+        self.assertTrue(index["unique"])
+
+    def test_full_extraction_refreshes_search_documents(self):
+        mentions.extract_corpus(self.db, workers=0)
+        build_search_collection(self.db)
+        self.db.abstracts.update_one({"doi": "10.1/2"}, {"$set": {"abstract": "Bi2Te3 and PbTe."}})
+        stats = mentions.extract_corpus(self.db, workers=0, full=True)
+        self.assertEqual(stats["replaced"], 2)
+        self.assertEqual(self.db[SEARCH_COLLECTION].find_one({"doi": "10.1/2"})["unique_mats"], ["Bi2Te3", "PbTe"])
+        # new abstracts are left to the incremental build
+        self.db.abstracts.insert_one({"doi": "10.1/3", "title": "Oxides", "abstract": "SrZrO3"})
+        self.assertEqual(mentions.extract_corpus(self.db, workers=0)["replaced"], 0)
+        self.assertIsNone(self.db[SEARCH_COLLECTION].find_one({"doi": "10.1/3"}))
+
+
+if __name__ == '__main__':
+    unittest.main()
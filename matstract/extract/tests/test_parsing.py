@@ -0,0 +1,97 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from matstract.extract import stoichiometry
+from matstract.extract.pubchem import NameCache
+from matstract.extract.parsing import MaterialParser, SimpleParser, SimplifiedMaterialParser, NormalizationCache
+
+FORMULAS = ["LiFePO4", "Li1-xFexPO4", "Li3Fe2(PO4)3", "Sr(Zr0.5Ti0.5)O3", "La0.7Sr0.3MnO3", "Ba1-xSrxTiO3",
+            "YBa2Cu3O7-δ", "Li(Ni1/3Mn1/3Co1/3)O2", "(Bi0.5Na0.5)1-xBaxTiO3", "Cu2-xSe", "Pb(Zr0.52Ti0.48)O3",
+            "Li4+xTi5O12", "Na2(SO4)2", "Ca(NO3)2", "Zn1-xMgxO", "Mg2Si1-xSnx", "Ce1-xGdxO2-x/2"]
+
+
+class TestSimpleParser(unittest.TestCase):
+    def setUp(self):
+        SimpleParser.cache = NormalizationCache(max_size=3)
+        self.parser = SimpleParser()
+
+    def tearDown(self):
+        SimpleParser.cache = NormalizationCache()
+
+    def test_parse(self):
+        self.assertEqual(self.parser.parse("Li2(FePO4)2"), "FeLiO4P")
+        self.assertEqual(self.parser.parse("Sr(Zr0.5Ti0.5)O3"), "O6Sr2TiZr")
+        self.assertFalse(self.parser.parse("battery"))
+        self.assertFalse(self.parser.parse("Fe1e999"))
+        self.assertFalse(self.parser.parse("Fe1e400O2"))
+
+    def test_cache_is_shared_and_bounded(self):
+        self.parser.parse("LiFePO4")
+        self.assertEqual(SimpleParser().parse("LiFePO4"), "FeLiO4P")
+        self.assertEqual(SimpleParser.cache.stats(), {"hits": 1, "misses": 1, "evictions": 0, "size": 1})
+        for mention in ["ZnO", "battery", "TiO2"]:
+            self.parser.parse(mention)
+        self.assertNotIn("LiFePO4", SimpleParser.cache)
+        self.assertEqual(SimpleParser.cache.counters["evictions"], 1)
+
+    def test_warm_start(self):
+        formulas = {"FeLiO4P": {"LiFePO4": 10, "LiPO4Fe": 1}, "O2Ti": {"TiO2": 5}}
+        self.assertEqual(self.parser.warm_start(formulas, limit=2), 2)
+        self.assertIn("TiO2", SimpleParser.cache)
+        self.assertNotIn("LiPO4Fe", SimpleParser.cache)
+        self.assertEqual(self.parser.parse("TiO2"), "O2Ti")
+        self.assertEqual(SimpleParser.cache.counters["hits"], 1)
+
+    def test_is_element(self):
+        self.assertTrue(all(self.parser.is_element(el) for el in ["H", "Fe", "Og", "D"]))
+        self.assertFalse(any(self.parser.is_element(el) for el in ["Fe2", "fe", "Xx", "M", ""]))
+
+
+class TestSimplifiedMaterialParser(unittest.TestCase):
+    def test_isotopes(self):
+        parser = SimplifiedMaterialParser()
+        self.assertIsNone(parser.parse_formula("D2O"))
+        self.assertIsNone(parser.parse_formula("T2O"))
+        self.assertRaises(ValueError, parser.parse_formula, "Xx2O")
+
+
+class TestMaterialParser(unittest.TestCase):
+    def test_parse_formula_matches_sympy(self):
+        parser = MaterialParser()
+        parsed = [dict(parser.parse_formula(f)) for f in FORMULAS]
+        with mock.patch.object(stoichiometry, "simplify", stoichiometry.sympy_simplify):
+            self.assertEqual(parsed, [dict(parser.parse_formula(f)) for f in FORMULAS])
+        self.assertEqual(parsed[1], {"Li": "1 - x", "Fe": "x", "P": "1", "O": "4"})
+
+    def test_names_are_resolved_from_the_pubchem_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            lookups = []
+            cache = NameCache(os.path.join(directory, "names.sqlite"), offline=False,
+                              lookup=lambda name: lookups.append(name) or "CoLiO2")
+            parser = MaterialParser(pubchem_cache=cache)
+            self.assertEqual(parser.resolve_names(["lithium cobalt oxide", "LiFePO4", "lithium cobalt oxide"]),
+                             {"lithium cobalt oxide": "CoLiO2"})
+            cache.offline = True
+            composition = parser.get_chemical_structure("lithium cobalt oxide")["composition"]
+            self.assertEqual(dict(composition), {"Co": "1", "Li": "1", "O": "2"})
+            self.assertEqual(lookups, ["lithium cobalt oxide"])
+
+    def test_parse_many(self):
+        with tempfile.TemporaryDirectory() as directory:
+            lookups = []
+            cache = NameCache(os.path.join(directory, "names.sqlite"), offline=False,
+                              lookup=lambda name: lookups.append(name) or "CoLiO2")
+            parser = MaterialParser(pubchem_cache=cache)
+            mentions = FORMULAS + ["lithium cobalt oxide", "(1-x)BaTiO3-xSrTiO3"] + FORMULAS
+            structures = parser.parse_many(mentions)
+            self.assertEqual(set(structures), set(mentions))
+            self.assertEqual(lookups, ["lithium cobalt oxide"])
+            for name in mentions:
+                self.assertEqual(structures[name], parser.get_chemical_structure(name))
+            self.assertEqual(dict(structures["lithium cobalt oxide"]["composition"]),
+                             {"Co": "1", "Li": "1", "O": "2"})
+
+
+if __name__ == '__main__':
+    unittest.main()
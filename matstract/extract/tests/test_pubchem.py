@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+from matstract.extract.pubchem import NameCache, PubChemRateLimiter
+
+FORMULAS = {"water": "H2O", "lithium cobalt oxide": "CoLiO2"}
+
+
+class TestNameCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "names.sqlite")
+        self.lookups = []
+        self.now = 1000.
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def lookup(self, name):
+        self.lookups.append(name)
+        if name == "timeout":
+            raise IOError("PubChem is unreachable")
+        return FORMULAS.get(name.lower())
+
+    def cache(self, offline=False):
+        return NameCache(self.path, offline=offline, negative_ttl=100, lookup=self.lookup,
+                         limiter=PubChemRateLimiter(rate=1000, max_retries=0), clock=lambda: self.now)
+
+    def test_resolve_and_negative_cache(self):
+        cache = self.cache()
+        self.assertEqual(cache.resolve("Water"), "H2O")
+        self.assertIsNone(cache.resolve("unobtainium"))
+        self.assertEqual(self.cache().resolve(" water "), "H2O")
+        self.assertIsNone(self.cache().resolve("Unobtainium"))
+        self.assertEqual(self.lookups, ["Water", "unobtainium"])
+        self.now += 101
+        self.assertIsNone(cache.resolve("unobtainium"))
+        self.assertEqual(len(self.lookups), 3)
+        self.assertEqual(cache.stats(), {"hits": 0, "negative_hits": 0, "misses": 3, "lookups": 3, "errors": 0})
+
+    def test_errors_are_not_cached(self):
+        cache = self.cache()
+        self.assertIsNone(cache.resolve("timeout"))
+        self.assertIsNone(cache.resolve("timeout"))
+        self.assertEqual(cache.stats()["errors"], 2)
+
+    def test_resolve_many_dedupes(self):
+        self.cache().resolve("water")
+        resolved = self.cache().resolve_many(["water", "Water", "lithium cobalt oxide", "LITHIUM COBALT OXIDE",
+                                              "unobtainium"])
+        self.assertEqual(resolved["Water"], "H2O")
+        self.assertEqual(resolved["LITHIUM COBALT OXIDE"], "CoLiO2")
+        self.assertIsNone(resolved["unobtainium"])
+        self.assertEqual(sorted(name.lower() for name in self.lookups),
+                         ["lithium cobalt oxide", "unobtainium", "water"])
+
+    def test_offline(self):
+        self.cache().resolve_many(["water", "unobtainium"])
+        self.now += 101
+        offline = self.cache(offline=True)
+        self.assertEqual(offline.resolve_many(["water", "unobtainium", "lithium cobalt oxide"]),
+                         {"water": "H2O", "unobtainium": None, "lithium cobalt oxide": None})
+        self.assertEqual(len(self.lookups), 2)
+        self.assertEqual(offline.stats(), {"hits": 1, "negative_hits": 1, "misses": 1, "lookups": 0, "errors": 0})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import random
+import unittest
+from sympy.abc import _clash
+from matstract.extract.stoichiometry import linear_simplify, sympy_simplify, simplify, UnsupportedExpression
+
+EXPRESSIONS = [
+    "(0)+(1)*(1)", "(0)+(2)*(1)", "(0)+(0.5)*(1)", "(0)+(1-x)*(1)", "(0)+(x)*(1)", "(0)+(1-x)*(2)",
+    "((0)+(4)*(1))*3", "((0)+(1)*(1))*2+(0)+(3)*(1)", "(0)+(0.52)*(1)", "(0)+(2-2*x)*(1)",
+    "(0)+(1-δ)*(1)", "(0)+(3-δ)*(1)", "(0)+(1+α)*(1)", "(0)+(0.33)*(1)", "(0)+(1/3)*(1)", "(0)+(x/2)*(1)",
+    "(0)+(1-x-y)*(1)", "(0)+(y-x)*(1)", "(0)+(0.7+x)*(1)", "(0)+(6.5)*(1)", "(0)+(7-δ)*(1)", "(0)+(1.5)*(2)",
+    "(0)+(2*x)*(1)", "(0)+(0.1)*(1)+(0.2)", "(0)+(x-x)*(1)", "(0)+(x+1/3)*(1)", "0.0",
+    "(0)+(0.25-0.25)*(1)", "(0)+(1)*(1)+(0.0)", "2*(x+0.5)", "-(x+0.5)", "(x+0.5)/2", "x+y+0.5", "3*x+0.5",
+    "(0)+(x)*(1.0)", "(0)+(1-0.5*x)*(1)", "(0)+(1-x)*(0.5)", "(0.5)*(1-x)+(0.5)*(1-y)", "(0)+(x-0.5*x)*(2)",
+]
+
+UNSUPPORTED = ["x*y", "x**2", "xy", "1/0", "1.0000000000000001", "x/3*2+0.4", "3*x+3*y+3.0", "1.5*a+y+0.3",
+               "0.2+0.1665+1.2", "01", "2(x)", "(1"]
+
+
+def random_expression(rng, depth=0):
+    r = rng.random()
+    if depth < 2 and r < 0.25:
+        return "{}{}{}".format(random_expression(rng, depth + 1), rng.choice("+-*/"),
+                               random_expression(rng, depth + 1))
+    if depth < 2 and r < 0.35:
+        return "(" + random_expression(rng, depth + 1) + ")"
+    if r < 0.5:
+        return rng.choice("xyzδa")
+    if r < 0.6:
+        return "-" + random_expression(rng, depth + 1)
+    return rng.choice(["1", "2", "3", "0", "0.5", "0.25", "0.1", "0.333", "1.5", "4", "0.05", "2.0"])
+
+
+class TestStoichiometry(unittest.TestCase):
+    def assertSameAsSympy(self, expression):
+        try:
+            expected = sympy_simplify(expression)
+        except Exception:
+            expected = None
+        try:
+            self.assertEqual(linear_simplify(expression), expected, expression)
+            return True
+        except UnsupportedExpression:
+            return False
+
+    def test_expressions_match_sympy(self):
+        for expression in EXPRESSIONS:
+            self.assertTrue(self.assertSameAsSympy(expression), expression)
+
+    def test_random_expressions_match_sympy(self):
+        rng = random.Random(0)
+        for _ in range(300):
+            expression = "(0)"
+            for _ in range(rng.randint(1, 3)):
+                expression = "({})+({})*({})".format(expression, random_expression(rng), rng.choice("12x"))
+            self.assertSameAsSympy(expression)
+
+    def test_unsupported_expressions_use_sympy(self):
+        for expression in UNSUPPORTED:
+            self.assertRaises(UnsupportedExpression, linear_simplify, expression)
+        self.assertEqual(simplify("x*y"), "x*y")
+        self.assertEqual(simplify("3*x+3*y+3.0"), "3.0*x + 3.0*y + 3.0")
+
+    def test_sympy_namespace_is_not_modified(self):
+        simplify("(0)+(1-δ)*(1)*x")
+        self.assertNotIn("δ", _clash)
+
+
+if __name__ == '__main__':
+    unittest.main()
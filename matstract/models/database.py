@@ -1,33 +1,206 @@
 import os
 from os import environ as env
 import json
-from pymongo import MongoClient
+import itertools
+import threading
+import time
+from pymongo import MongoClient, monitoring
 from elasticsearch import Elasticsearch
 import certifi
 from bson import ObjectId
+from matstract.models.memory import get_store
+from matstract.models.metrics import CommandMetrics, timed_search
 
 #Change this variable to True for easy offline testing.
 local = False
 
+# Storage backend of AtlasConnection and ElasticConnection: "atlas" for the clusters, or "memory" for the
+# in-process store of matstract.models.memory loaded from the JSONL fixtures in MATSTRACT_FIXTURES.
+BACKEND = env.get("MATSTRACT_BACKEND", "atlas")
 
-def sort_results(results, ids):
-    results_sorted = sorted(results, key=lambda k: ids.index(k['_id']))
-    return results_sorted
+
+# Maximum result window (index.max_result_window) of the Elasticsearch index, i.e. the last result reachable by
+# from/size paging.
+ES_WINDOW = 10000
+
+# Connection pool settings of the shared MongoClients, see get_client.
+POOL_OPTIONS = {"maxPoolSize": int(env.get("MATSTRACT_MAX_POOL_SIZE", 50)),
+                "minPoolSize": 0,
+                "maxIdleTimeMS": 5 * 60 * 1000,
+                "waitQueueTimeoutMS": 30 * 1000}
+
+
+def sort_results(results, ids, key="_id"):
+    """
+    Sorts documents in the order of their key in ids, e.g. Elasticsearch rank.
+
+    Args:
+        results (iterable(dict)): documents
+        ids (list): values of key in the desired order
+        key (str): field of the documents holding the ids. Default: "_id"
+
+    Returns: list of documents
+
+    """
+    positions = {}
+    for i, id in enumerate(ids):
+        positions.setdefault(id, i)
+    return sorted(results, key=lambda k: positions[k[key]])
+
+
+def iter_ordered(collection, ids, key="_id", projection=None, chunk_size=1000):
+    """
+    Yields the documents of collection whose key is in ids, in the order of ids.
+
+    Documents are fetched with one $in query per chunk_size ids, so at most one chunk is held in memory and the
+    first documents are available before the later chunks are queried. Ids without a document are skipped.
+
+    Args:
+        collection (pymongo.collection.Collection): collection to query
+        ids (iterable): values of key in the desired order, e.g. ObjectIds in Elasticsearch rank order. May be a
+            generator such as ElasticConnection.iter_ids, which is consumed one chunk at a time.
+        key (str): field to match ids against. Default: "_id"
+        projection (list or dict, optional): fields to return, as for find. key is always included.
+        chunk_size (int): number of ids per query. Default: 1000
+
+    """
+    if isinstance(projection, dict) and any(projection.values()):
+        projection = dict(projection, **{key: 1})
+    elif isinstance(projection, (list, tuple)):
+        projection = list(projection) + [key]
+    seen = set()
+    ids = iter(ids)
+    while True:
+        chunk = list(itertools.islice(ids, chunk_size))
+        if not chunk:
+            break
+        chunk = [id for id in chunk if id not in seen]
+        seen.update(chunk)
+        found = {doc[key]: doc for doc in collection.find({key: {"$in": chunk}}, projection)}
+        for id in chunk:
+            doc = found.pop(id, None)
+            if doc is not None:
+                yield doc
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """ Records connection checkouts of a MongoClient and the time spent waiting for a free connection. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.counters = {"checkouts": 0, "checkout_failures": 0, "checked_out": 0,
+                         "connections": 0, "wait_seconds": 0., "max_wait_seconds": 0.}
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def _waited(self):
+        started = getattr(self._local, "started", None)
+        return 0. if started is None else time.perf_counter() - started
+
+    def connection_checked_out(self, event):
+        waited = self._waited()
+        with self._lock:
+            self.counters["checkouts"] += 1
+            self.counters["checked_out"] += 1
+            self.counters["wait_seconds"] += waited
+            self.counters["max_wait_seconds"] = max(self.counters["max_wait_seconds"], waited)
+
+    def connection_check_out_failed(self, event):
+        self._count("checkout_failures")
+        self._count("wait_seconds", self._waited())
+
+    def connection_checked_in(self, event):
+        self._count("checked_out", -1)
+
+    def connection_created(self, event):
+        self._count("connections")
+
+    def connection_closed(self, event):
+        self._count("connections", -1)
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(uri, db, options=None):
+    """
+    Returns the MongoClient shared by all connections of this process to db at uri with the same options.
+
+    Clients are created on first use with connect=False, so no connection is opened (and no monitoring thread
+    started) until the first query.
+
+    Args:
+        uri (str): MongoDB connection string
+        db (str): database name
+        options (dict, optional): MongoClient pool options. Default: POOL_OPTIONS
+
+    Returns: (pymongo.MongoClient, PoolMetrics)
+
+    """
+    options = POOL_OPTIONS if options is None else options
+    key = (uri, db, tuple(sorted(options.items())))
+    with _clients_lock:
+        if key not in _clients:
+            metrics = PoolMetrics()
+            client = MongoClient(uri, connect=False, event_listeners=[metrics, CommandMetrics()], **options)
+            _clients[key] = (client, metrics)
+        return _clients[key]
+
+
+def pool_stats():
+    """
+    Returns the connection pool metrics of all shared clients.
+
+    Returns: list of dicts with the database name and the counters of its PoolMetrics (credentials are omitted).
+
+    """
+    with _clients_lock:
+        return [dict(db=db, **metrics.stats()) for (uri, db, options), (client, metrics) in _clients.items()]
 
 
 class AtlasConnection():
     """ Class representing a connection to the Atlas cluster (MongoDB)"""
 
-    def __init__(self, local=local, access="read_only", db="production"):
+    def __init__(self, local=local, access="read_only", db="production", backend=None):
         """
         Args:
             local (bool): True to use local config file, False for environment variables. Default: False
             access (str): Level of access. e.g. "admin", "read_only", or "annotator"
             db (str): Desired database. e.g. "test" or "production"
+            backend (str, optional): "atlas" or "memory". Default: BACKEND
 
         Returns: pymongo Client.
 
         """
+        if (backend or BACKEND) == "memory":
+            self.db = get_store(env.get("MATSTRACT_FIXTURES")).database(db)
+            return
         if 'MATSTRACT_HOST' in env and local:
             uri = "mongodb://%s:%s/%s" % (
                 env['MATSTRACT_HOST'], env['MATSTRACT_PORT'], db)
@@ -57,7 +230,7 @@ class AtlasConnection():
                                 "db": db}
                 uri = "mongodb://{user}:{pass}@{rest}".format(**user_creds)
 
-        client = MongoClient(uri, connect=False)
+        client, _ = get_client(uri, user_creds["db"])
         self.db = client[user_creds["db"]]
 
 
@@ -73,26 +246,41 @@ class AtlasConnection():
         """
         return self.db.abstracts.query(mongo_query)
 
-    def get_documents_by_id(self, ids):
-        return sort_results(self.db.abstracts.find({"_id": {"$in":ids}}), ids)
+    def get_documents_by_id(self, ids, projection=None):
+        return list(self.iter_documents_by_id(ids, projection=projection))
+
+    def get_documents_by_doi(self, dois, projection=None):
+        return list(self.iter_documents_by_doi(dois, projection=projection))
 
-    def get_documents_by_doi(self, dois):
-        return sort_results(self.db.abstracts.find({"doi": {"$in":dois}}), dois)
+    def iter_documents_by_id(self, ids, projection=None):
+        """ Yields abstracts in the order of ids (see iter_ordered). """
+        return iter_ordered(self.db.abstracts, ids, key="_id", projection=projection)
+
+    def iter_documents_by_doi(self, dois, projection=None):
+        """ Yields abstracts in the order of dois (see iter_ordered). """
+        return iter_ordered(self.db.abstracts, dois, key="doi", projection=projection)
 
 
 class ElasticConnection(Elasticsearch):
     """ Class representing a connection to the Elastic Cloud cluster (ElasticSearch)"""
 
-    def __init__(self, local=local, access="read_only"):
+    # MemoryElastic answering search, scroll and clear_scroll when the memory backend is used
+    _memory = None
+
+    def __init__(self, local=local, access="read_only", backend=None):
         """
         Args:
             local (bool): True to use local config file, False for environment variables. Default: False
             access (str): Level of access. e.g. "admin", "read_only", or "annotator"
             db (str): Desired database. e.g. "test" or "production"
+            backend (str, optional): "atlas" or "memory". Default: BACKEND
 
         Returns: pymongo Client.
 
         """
+        if (backend or BACKEND) == "memory":
+            self._memory = get_store(env.get("MATSTRACT_FIXTURES")).elastic()
+            return
 
         try:
             db_creds = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../config/db_creds.json')
@@ -113,12 +301,26 @@ class ElasticConnection(Elasticsearch):
         super(ElasticConnection, self).__init__(hosts=hosts, http_auth=http_auth,
                                                 use_ssl=True, ca_certs=certifi.where())
 
+    def search(self, *args, **kwargs):
+        search = self._memory.search if self._memory is not None else super(ElasticConnection, self).search
+        return timed_search(search, "search")(*args, **kwargs)
+
+    def scroll(self, *args, **kwargs):
+        scroll = self._memory.scroll if self._memory is not None else super(ElasticConnection, self).scroll
+        return timed_search(scroll, "scroll")(*args, **kwargs)
+
+    def clear_scroll(self, *args, **kwargs):
+        if self._memory is not None:
+            return self._memory.clear_scroll(*args, **kwargs)
+        return super(ElasticConnection, self).clear_scroll(*args, **kwargs)
+
     def query(self, text=None, max_results=10000):
         """
         Wrapper for ElasticSearch search that enforces correct db.
 
         Args:
             text (str): text to be searched on
+            max_results (int): maximum number of results
 
         Returns:
             list of ObjectIDs of the seach results
@@ -126,7 +328,67 @@ class ElasticConnection(Elasticsearch):
         """
         if text is None:
             return None
-        query = {"query": {"simple_query_string": {"query": text}}}
-        hits = self.search(index="tri_abstracts", body=query, size=max_results, request_timeout=30)["hits"]["hits"]
-        ids = [ObjectId(h["_id"]) for h in hits]
-        return ids
+        return list(self.iter_ids(text, max_results=max_results))
+
+    def ids_page(self, text, offset=0, size=100):
+        """
+        Returns one page of the ObjectIds of the documents matching text, in rank order.
+
+        Args:
+            text (str): text to be searched on
+            offset (int): rank of the first result
+            size (int): number of results. Default: 100. The page is cut short at ES_WINDOW, the last result
+                reachable by from/size paging.
+
+        Returns:
+            (list of ObjectIds, total): total is {"value": int, "relation": "eq" or "gte"}
+
+        """
+        query = {"query": {"simple_query_string": {"query": text}}, "_source": False}
+        size = max(0, min(size, ES_WINDOW - offset))
+        resp = self.search(index="tri_abstracts", body=query, from_=min(offset, ES_WINDOW), size=size,
+                           request_timeout=30)
+        total = resp["hits"]["total"]
+        if not isinstance(total, dict):
+            total = {"value": total, "relation": "eq"}
+        return [ObjectId(h["_id"]) for h in resp["hits"]["hits"]], dict(total)
+
+    def iter_ids(self, text, max_results=None, page_size=1000, keep_alive="1m"):
+        """
+        Yields the ObjectIds of the documents matching text, in rank order, one page at a time.
+
+        Only ids are requested (_source is disabled). Queries with more than page_size results are paged with the
+        scroll API, which is not limited by the index's max result window, so callers can consume the ids as they
+        arrive and stop early; the scroll context is cleared when the generator is closed.
+
+        Args:
+            text (str): text to be searched on
+            max_results (int, optional): maximum number of results. Default: all results.
+            page_size (int): number of ids per request. Default: 1000
+            keep_alive (str): how long the scroll context is kept between pages. Default: "1m"
+
+        """
+        query = {"query": {"simple_query_string": {"query": text}}, "_source": False}
+        if max_results is not None and max_results <= page_size:
+            hits = self.search(index="tri_abstracts", body=query, size=max_results,
+                               request_timeout=30)["hits"]["hits"]
+            for h in hits:
+                yield ObjectId(h["_id"])
+            return
+
+        remaining = max_results
+        resp = self.search(index="tri_abstracts", body=query, size=page_size, scroll=keep_alive, request_timeout=30)
+        scroll_id = resp.get("_scroll_id")
+        try:
+            while resp["hits"]["hits"]:
+                for h in resp["hits"]["hits"][:remaining]:
+                    yield ObjectId(h["_id"])
+                if remaining is not None:
+                    remaining -= len(resp["hits"]["hits"])
+                    if remaining <= 0:
+                        break
+                resp = self.scroll(scroll_id=scroll_id, scroll=keep_alive, request_timeout=30)
+                scroll_id = resp.get("_scroll_id", scroll_id)
+        finally:
+            if scroll_id is not None:
+                self.clear_scroll(scroll_id=scroll_id)
@@ -0,0 +1,433 @@
+"""
+In-process storage backend for offline development, benchmarks and load tests.
+
+The MongoDB side is a mongomock database loaded from JSONL fixtures (one file per collection, documents in
+MongoDB extended JSON so that ObjectIds and dates survive the round trip). The Elasticsearch side is an
+in-memory BM25 index over the same fixtures implementing the parts of the search API matstract uses:
+simple_query_string, match and more_like_this queries, _source filtering and scrolling. The same index also
+answers $text queries on the Mongo collections, which mongomock does not implement.
+
+Select it with the environment variables MATSTRACT_BACKEND=memory and MATSTRACT_FIXTURES=<directory>, see
+AtlasConnection and ElasticConnection.
+"""
+import itertools
+import math
+import os
+import re
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from bson import json_util
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+# fields covered by the text index of each collection
+TEXT_FIELDS = {"abstracts": ["title", "abstract"]}
+
+# Elasticsearch indices and the collection they are built from
+ELASTIC_INDICES = {"tri_abstracts": "abstracts"}
+
+WORD = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """ Lowercases and splits text into word tokens. """
+    return WORD.findall(text.lower())
+
+
+def parse_query(text):
+    """
+    Splits a search string in the syntax shared by simple_query_string and $text.
+
+    Args:
+        text (str): search string, e.g. 'lithium "solid electrolyte" -sulfide'
+
+    Returns: (terms, phrases, excluded): lists of tokens, of token lists (one per quoted phrase) and of
+        tokens prefixed with "-"
+
+    """
+    phrases = [tokenize(phrase) for phrase in re.findall(r'"([^"]*)"', text)]
+    terms, excluded = [], []
+    for word in re.sub(r'"[^"]*"', " ", text).split():
+        (excluded if word.startswith("-") else terms).extend(tokenize(word))
+    return terms, [phrase for phrase in phrases if phrase], excluded
+
+
+def load_jsonl(path):
+    """ Yields the documents of a JSONL file in MongoDB extended JSON. """
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json_util.loads(line)
+
+
+def dump_jsonl(documents, path):
+    """ Writes documents to a JSONL fixture file, e.g. a sample of a production collection. """
+    with open(path, "w", encoding="utf-8") as f:
+        for doc in documents:
+            f.write(json_util.dumps(doc) + "\n")
+
+
+class BM25Index(object):
+    """ Inverted index over the text fields of a set of documents, scored with Okapi BM25 as in Lucene. """
+
+    def __init__(self, fields, k1=1.2, b=0.75):
+        """
+        Args:
+            fields (list): document fields to index. They are scored as a single concatenated field.
+            k1 (float): term frequency saturation. Default: 1.2
+            b (float): length normalization. Default: 0.75
+        """
+        self.fields = fields
+        self.k1 = k1
+        self.b = b
+        self.documents = {}
+        self._postings = defaultdict(dict)
+        self._tokens = {}
+        self._positions = {}
+        self._added = itertools.count()
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, id, document):
+        """ Indexes document under id, replacing any document previously indexed under it. """
+        if id in self.documents:
+            self.remove(id)
+        tokens = tokenize(" ".join(str(document.get(field) or "") for field in self.fields))
+        self.documents[id] = document
+        self._tokens[id] = tokens
+        self._positions[id] = next(self._added)
+        self._total_length += len(tokens)
+        for term, tf in Counter(tokens).items():
+            self._postings[term][id] = tf
+
+    def remove(self, id):
+        tokens = self._tokens.pop(id)
+        del self.documents[id], self._positions[id]
+        self._total_length -= len(tokens)
+        for term in set(tokens):
+            del self._postings[term][id]
+            if not self._postings[term]:
+                del self._postings[term]
+
+    def doc_freq(self, term):
+        return len(self._postings.get(term, ()))
+
+    def idf(self, term):
+        df = self.doc_freq(term)
+        return math.log(1 + (len(self.documents) - df + 0.5) / (df + 0.5))
+
+    def _has_phrase(self, id, phrase):
+        tokens, n = self._tokens[id], len(phrase)
+        return any(tokens[i:i + n] == phrase for i in range(len(tokens) - n + 1))
+
+    def _phrase_matches(self, phrase):
+        candidates = set(self._postings.get(phrase[0], ()))
+        for term in phrase[1:]:
+            candidates.intersection_update(self._postings.get(term, ()))
+        return {id for id in candidates if self._has_phrase(id, phrase)}
+
+    def search(self, terms=(), phrases=(), excluded=(), require_phrases=False, minimum_should_match=1):
+        """
+        Scores the documents matching a query.
+
+        Args:
+            terms (list): tokens of which a document must contain at least minimum_should_match
+            phrases (list): token lists that must appear contiguously. A document matching a phrase matches the
+                query if require_phrases is False, and must match all of them otherwise ($text semantics).
+            excluded (list): tokens a document must not contain
+            require_phrases (bool): whether all phrases are required. Default: False
+            minimum_should_match (int): number of distinct terms a document must contain. Default: 1
+
+        Returns: list of (id, score) tuples, best first
+
+        """
+        matched_phrases = [self._phrase_matches(phrase) for phrase in phrases]
+        counts = Counter(id for term in set(terms) for id in self._postings.get(term, ()))
+        if require_phrases and matched_phrases:
+            candidates = set.intersection(*matched_phrases)
+        else:
+            candidates = {id for id, count in counts.items() if count >= minimum_should_match}
+            candidates.update(*matched_phrases)
+        for term in excluded:
+            candidates.difference_update(self._postings.get(term, ()))
+        if not candidates:
+            return []
+
+        average_length = self._total_length / len(self.documents)
+        scores = dict.fromkeys(candidates, 0.)
+        for term in itertools.chain(terms, *phrases):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for id in candidates:
+                tf = postings.get(id)
+                if tf:
+                    norm = self.k1 * (1 - self.b + self.b * len(self._tokens[id]) / average_length)
+                    scores[id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: (-item[1], self._positions[item[0]]))
+
+    def more_like_this(self, like, max_query_terms=25, min_term_freq=2, min_doc_freq=5, max_doc_freq=None,
+                       minimum_should_match="30%"):
+        """
+        Scores the documents similar to a text, selecting query terms as Elasticsearch's more_like_this does.
+
+        Args:
+            like (str): text to find similar documents to
+            max_query_terms (int): maximum number of selected terms. Default: 25
+            min_term_freq (int): minimum frequency of a term in like. Default: 2
+            min_doc_freq (int): minimum number of documents containing a term. Default: 5
+            max_doc_freq (int, optional): maximum number of documents containing a term
+            minimum_should_match (str or int): number (or percentage, rounded down) of selected terms a document
+                must contain. Default: "30%"
+
+        Returns: list of (id, score) tuples, best first
+
+        """
+        weights = {}
+        for term, tf in Counter(tokenize(like)).items():
+            df = self.doc_freq(term)
+            if tf >= min_term_freq and df >= min_doc_freq and (max_doc_freq is None or df <= max_doc_freq):
+                weights[term] = tf * self.idf(term)
+        terms = sorted(weights, key=lambda term: -weights[term])[:max_query_terms]
+        if not terms:
+            return []
+        if isinstance(minimum_should_match, str) and minimum_should_match.endswith("%"):
+            minimum_should_match = int(len(terms) * float(minimum_should_match[:-1]) / 100)
+        return self.search(terms, minimum_should_match=max(1, int(minimum_should_match)))
+
+
+class MemoryElastic(object):
+    """ Stand-in for the Elasticsearch client answering search, scroll and clear_scroll from BM25Indexes. """
+
+    def __init__(self, indices, max_result_window=10000):
+        """
+        Args:
+            indices (dict): BM25Index by index name
+            max_result_window (int): bound of from + size of searches that are not scrolled, as in Elasticsearch
+        """
+        self.indices = indices
+        self.max_result_window = max_result_window
+        self._scrolls = {}
+        self._lock = threading.Lock()
+
+    def _execute(self, index, query):
+        if not query or "match_all" in query:
+            return [(id, 1.) for id in index.documents]
+        if "simple_query_string" in query or "query_string" in query:
+            clause = query.get("simple_query_string") or query.get("query_string")
+            return index.search(*parse_query(clause["query"]))
+        if "multi_match" in query:
+            return index.search(*parse_query(query["multi_match"]["query"]))
+        if "match" in query:
+            text = list(query["match"].values())[0]
+            return index.search(*parse_query(text["query"] if isinstance(text, dict) else text))
+        if "more_like_this" in query:
+            clause = dict(query["more_like_this"])
+            like = clause.pop("like")
+            like = " ".join(like) if isinstance(like, list) else like
+            options = {k: v for k, v in clause.items() if k in ("max_query_terms", "min_term_freq", "min_doc_freq",
+                                                                 "max_doc_freq", "minimum_should_match")}
+            return index.more_like_this(like, **options)
+        raise NotImplementedError("Query {} is not supported by the memory backend.".format(list(query)))
+
+    def _response(self, index_name, hits, total, source, took, scroll_id=None):
+        max_score = hits[0][1] if hits else None
+        response = {"took": int(took * 1000), "timed_out": False,
+                    "hits": {"total": total, "max_score": max_score, "hits": []}}
+        index = self.indices[index_name]
+        for id, score in hits:
+            hit = {"_index": index_name, "_id": id, "_score": score}
+            if source is not False:
+                document = index.documents[id]
+                if isinstance(source, (list, tuple)):
+                    document = {k: v for k, v in document.items() if k in source}
+                hit["_source"] = document
+            response["hits"]["hits"].append(hit)
+        if scroll_id is not None:
+            response["_scroll_id"] = scroll_id
+        return response
+
+    def search(self, index=None, body=None, size=10, scroll=None, from_=0, _source=None, **kwargs):
+        """ Runs body["query"] against index. Accepts the arguments of Elasticsearch.search used by matstract. """
+        started = time.perf_counter()
+        body = body or {}
+        size, from_ = body.get("size", size), body.get("from", from_)
+        if scroll is None and from_ + size > self.max_result_window:
+            raise ValueError("Result window is too large, from + size must be less than or equal to: [{}] but was "
+                             "[{}].".format(self.max_result_window, from_ + size))
+        source = body.get("_source", True if _source is None else _source)
+        hits = self._execute(self.indices[index], body.get("query"))
+        page = hits[from_:from_ + size]
+        scroll_id = None
+        if scroll is not None:
+            scroll_id = uuid.uuid4().hex
+            with self._lock:
+                self._scrolls[scroll_id] = (index, hits[from_ + size:], size, source)
+        return self._response(index, page, len(hits), source, time.perf_counter() - started, scroll_id)
+
+    def scroll(self, scroll_id=None, scroll=None, **kwargs):
+        """ Returns the next page of a scrolled search. """
+        started = time.perf_counter()
+        with self._lock:
+            index, hits, size, source = self._scrolls[scroll_id]
+            self._scrolls[scroll_id] = (index, hits[size:], size, source)
+        return self._response(index, hits[:size], len(hits), source, time.perf_counter() - started, scroll_id)
+
+    def clear_scroll(self, scroll_id=None, **kwargs):
+        with self._lock:
+            self._scrolls.pop(scroll_id, None)
+        return {"succeeded": True}
+
+
+class MemoryCollection(object):
+    """ mongomock collection that also answers $text queries from a BM25Index of its text fields. """
+
+    WRITES = ("insert_one", "insert_many", "replace_one", "update_one", "update_many", "delete_one",
+              "delete_many", "bulk_write", "find_one_and_update", "find_one_and_replace", "find_one_and_delete",
+              "drop")
+
+    def __init__(self, collection, text_fields=None):
+        self._collection = collection
+        self._text_fields = text_fields
+        self._index = None
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name in self.WRITES:
+            def write(*args, **kwargs):
+                self._index = None
+                return attr(*args, **kwargs)
+            return write
+        return attr
+
+    def text_index(self):
+        """ Returns the BM25Index of the collection, rebuilding it if the collection has been written to. """
+        if self._text_fields is None:
+            raise NotImplementedError("Collection {} has no text index.".format(self._collection.name))
+        if self._index is None:
+            index = BM25Index(self._text_fields)
+            for doc in self._collection.find({}, self._text_fields):
+                index.add(doc["_id"], doc)
+            self._index = index
+        return self._index
+
+    def _resolve_text(self, filter):
+        if not filter or "$text" not in filter:
+            return filter
+        filter = dict(filter)
+        terms, phrases, excluded = parse_query(filter.pop("$text")["$search"])
+        ids = [id for id, _ in self.text_index().search(terms, phrases, excluded, require_phrases=True)]
+        return {"$and": [filter, {"_id": {"$in": ids}}]}
+
+    def find(self, filter=None, *args, **kwargs):
+        return self._collection.find(self._resolve_text(filter), *args, **kwargs)
+
+    def find_one(self, filter=None, *args, **kwargs):
+        return self._collection.find_one(self._resolve_text(filter), *args, **kwargs)
+
+    def count_documents(self, filter, *args, **kwargs):
+        return self._collection.count_documents(self._resolve_text(filter), *args, **kwargs)
+
+    def aggregate(self, pipeline, *args, **kwargs):
+        if pipeline and "$match" in pipeline[0]:
+            pipeline = [{"$match": self._resolve_text(pipeline[0]["$match"])}] + list(pipeline[1:])
+        kwargs.pop("allowDiskUse", None)
+        return self._collection.aggregate(pipeline, *args, **kwargs)
+
+
+class MemoryDatabase(object):
+    """ mongomock database handing out MemoryCollections. """
+
+    def __init__(self, database):
+        self._database = database
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = MemoryCollection(self._database[name], TEXT_FIELDS.get(name))
+            return self._collections[name]
+
+    def get_collection(self, name, *args, **kwargs):
+        return self[name]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        attr = getattr(self._database, name)
+        return self[name] if isinstance(attr, mongomock.Collection) else attr
+
+
+class MemoryStore(object):
+    """ Databases and search indices of the memory backend, loaded from a directory of JSONL fixtures.
+
+    Every <collection>.jsonl file in the directory is loaded into each database on first use, so "production"
+    and "test" start from the same fixtures but are written to independently.
+    """
+
+    def __init__(self, fixtures=None):
+        """
+        Args:
+            fixtures (str, optional): directory of <collection>.jsonl files. Default: start empty.
+        """
+        if mongomock is None:
+            raise ImportError("The memory backend requires the mongomock package.")
+        self.fixtures = fixtures
+        self._client = mongomock.MongoClient()
+        self._databases = {}
+        self._elastic = None
+        self._lock = threading.Lock()
+
+    def _fixture_files(self):
+        if not self.fixtures:
+            return {}
+        return {name[:-len(".jsonl")]: os.path.join(self.fixtures, name)
+                for name in sorted(os.listdir(self.fixtures)) if name.endswith(".jsonl")}
+
+    def database(self, name):
+        """ Returns the MemoryDatabase called name, loading the fixtures on first use. """
+        with self._lock:
+            if name not in self._databases:
+                database = MemoryDatabase(self._client[name])
+                for collection, path in self._fixture_files().items():
+                    documents = list(load_jsonl(path))
+                    if documents:
+                        database[collection].insert_many(documents)
+                self._databases[name] = database
+            return self._databases[name]
+
+    def elastic(self):
+        """ Returns the MemoryElastic serving ELASTIC_INDICES, built from the fixtures on first use. """
+        with self._lock:
+            if self._elastic is None:
+                files = self._fixture_files()
+                indices = {}
+                for index_name, collection in ELASTIC_INDICES.items():
+                    index = BM25Index(TEXT_FIELDS[collection])
+                    for doc in (load_jsonl(files[collection]) if collection in files else ()):
+                        id = str(doc.pop("_id"))
+                        index.add(id, doc)
+                    indices[index_name] = index
+                self._elastic = MemoryElastic(indices)
+            return self._elastic
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(fixtures=None):
+    """ Returns the MemoryStore of this process for a fixtures directory, creating it on first use. """
+    with _stores_lock:
+        if fixtures not in _stores:
+            _stores[fixtures] = MemoryStore(fixtures)
+        return _stores[fixtures]
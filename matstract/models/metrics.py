@@ -0,0 +1,274 @@
+"""
+Latency, document and byte counters for the queries sent to MongoDB and Elasticsearch.
+
+Every call is recorded under (backend, operation, target, site), where target is the collection or index and site
+is the matstract function that issued the call (the first caller outside the database drivers and
+matstract.models.database), or the name set with query_site. Calls slower than SLOW_QUERY_SECONDS are logged to the
+"matstract.queries" logger. QUERY_METRICS.prometheus() renders the counters in the Prometheus text format, see the
+/metrics route of the web app.
+
+Response sizes are only counted with MATSTRACT_QUERY_BYTES=1 (or measure_bytes=True), since MongoDB replies and
+Elasticsearch responses without a Content-Length have to be serialized again to be measured.
+"""
+import json
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from os import environ as env
+from bson import BSON, json_util
+from pymongo import monitoring
+
+logger = logging.getLogger("matstract.queries")
+
+# whether the size of MongoDB replies and Elasticsearch responses without a Content-Length is measured
+MEASURE_BYTES = env.get("MATSTRACT_QUERY_BYTES", "").lower() in ("1", "true", "yes")
+
+# calls slower than this are logged
+SLOW_QUERY_SECONDS = float(env.get("MATSTRACT_SLOW_QUERY_MS", 500)) / 1000
+
+# upper bounds of the latency histogram buckets in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30.)
+
+# modules whose frames are skipped when looking for the call site
+INTERNAL_MODULES = ("pymongo", "bson", "elasticsearch", "elastic_transport", "urllib3", "mongomock", "threading",
+                    "concurrent", "contextlib", "matstract.models.database", "matstract.models.metrics",
+                    "matstract.models.memory")
+
+# driver commands that are not queries
+IGNORED_COMMANDS = {"ismaster", "isMaster", "hello", "ping", "buildinfo", "buildInfo", "saslStart",
+                    "saslContinue", "authenticate", "getnonce", "endSessions", "killCursors"}
+
+_local = threading.local()
+
+
+@contextmanager
+def query_site(name):
+    """ Records the calls made in the body of the with statement under site name instead of their caller. """
+    stack = getattr(_local, "sites", None)
+    if stack is None:
+        stack = _local.sites = []
+    stack.append(name)
+    try:
+        yield
+    finally:
+        stack.pop()
+
+
+def call_site():
+    """ Returns the query_site in effect, or "module:function" of the first caller outside INTERNAL_MODULES. """
+    stack = getattr(_local, "sites", None)
+    if stack:
+        return stack[-1]
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if not module.startswith(INTERNAL_MODULES):
+            return "{}:{}".format(module, frame.f_code.co_name)
+        frame = frame.f_back
+    return "unknown"
+
+
+class QueryMetrics(object):
+    """ Thread-safe registry of per-call latency histograms, document counts and bytes. """
+
+    def __init__(self, buckets=BUCKETS, slow_seconds=None):
+        """
+        Args:
+            buckets (tuple): upper bounds of the latency buckets in seconds. Default: BUCKETS
+            slow_seconds (float, optional): threshold of the slow query log. Default: SLOW_QUERY_SECONDS
+        """
+        self.buckets = buckets
+        self.slow_seconds = slow_seconds
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def record(self, backend, operation, target, site, seconds, documents=0, bytes=0, query=None):
+        """
+        Records one call.
+
+        Args:
+            backend (str): "mongo" or "elastic"
+            operation (str): e.g. "find", "aggregate", "search"
+            target (str): collection or index
+            site (str): call site, see call_site
+            seconds (float): latency
+            documents (int): number of documents returned
+            bytes (int): size of the response, 0 if not measured
+            query (callable, optional): returns a description of the query for the slow query log
+
+        """
+        key = (backend, operation, target, site)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"count": 0, "seconds": 0., "max_seconds": 0., "documents": 0,
+                                              "bytes": 0, "slow": 0, "buckets": [0] * len(self.buckets)}
+            series["count"] += 1
+            series["seconds"] += seconds
+            series["max_seconds"] = max(series["max_seconds"], seconds)
+            series["documents"] += documents
+            series["bytes"] += bytes
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series["buckets"][i] += 1
+                    break
+            slow = seconds > (SLOW_QUERY_SECONDS if self.slow_seconds is None else self.slow_seconds)
+            if slow:
+                series["slow"] += 1
+        if slow:
+            logger.warning("Slow %s %s on %s from %s: %.3f s, %d documents, %d bytes. %s", backend, operation,
+                           target, site, seconds, documents, bytes, query() if query is not None else "")
+
+    def snapshot(self):
+        """ Returns a list of dicts with the labels and counters of every series. """
+        with self._lock:
+            return [dict(backend=backend, operation=operation, target=target, site=site, **dict(series,
+                         buckets=list(series["buckets"])))
+                    for (backend, operation, target, site), series in sorted(self._series.items())]
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def prometheus(self, pools=None):
+        """
+        Renders the counters in the Prometheus text exposition format.
+
+        Args:
+            pools (list, optional): connection pool counters to include as gauges, see database.pool_stats
+
+        Returns: str
+
+        """
+        lines = ["# HELP matstract_query_seconds Latency of database calls.",
+                 "# TYPE matstract_query_seconds histogram"]
+        totals = []
+        for series in self.snapshot():
+            labels = _labels(backend=series["backend"], operation=series["operation"], target=series["target"],
+                             site=series["site"])
+            cumulative = 0
+            for bound, count in zip(self.buckets, series["buckets"]):
+                cumulative += count
+                lines.append('matstract_query_seconds_bucket{{{},le="{}"}} {}'.format(labels, bound, cumulative))
+            lines.append('matstract_query_seconds_bucket{{{},le="+Inf"}} {}'.format(labels, series["count"]))
+            lines.append("matstract_query_seconds_sum{{{}}} {}".format(labels, series["seconds"]))
+            lines.append("matstract_query_seconds_count{{{}}} {}".format(labels, series["count"]))
+            totals.append((labels, series))
+        for name, field, help in (("documents", "documents", "Documents returned by database calls."),
+                                  ("bytes", "bytes", "Bytes returned by database calls."),
+                                  ("slow", "slow", "Database calls slower than the slow query threshold.")):
+            lines.append("# HELP matstract_query_{}_total {}".format(name, help))
+            lines.append("# TYPE matstract_query_{}_total counter".format(name))
+            lines.extend("matstract_query_{}_total{{{}}} {}".format(name, labels, series[field])
+                         for labels, series in totals)
+        for pool in pools or []:
+            labels = _labels(db=pool["db"])
+            for name, value in sorted(pool.items()):
+                if name != "db":
+                    lines.append("matstract_mongo_pool_{}{{{}}} {}".format(name, labels, value))
+        return "\n".join(lines) + "\n"
+
+
+def _labels(**labels):
+    return ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+                    for k, v in labels.items())
+
+
+QUERY_METRICS = QueryMetrics()
+
+
+def reply_documents(command_name, reply):
+    """ Returns the number of documents in a MongoDB command reply. """
+    cursor = reply.get("cursor")
+    if cursor is not None:
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", ())))
+    if command_name == "count":
+        return reply.get("n", 0)
+    if command_name == "findAndModify":
+        return int(reply.get("value") is not None)
+    if command_name == "distinct":
+        return len(reply.get("values", ()))
+    return 0
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """ Records the MongoDB commands of a MongoClient in a QueryMetrics.
+
+    Command events are published on the thread that runs the command, so the call site is found when the command
+    starts. Replies are BSON encoded again to be measured, so their size is only recorded if measure_bytes.
+    """
+
+    def __init__(self, metrics=QUERY_METRICS, measure_bytes=None):
+        self.metrics = metrics
+        self.measure_bytes = MEASURE_BYTES if measure_bytes is None else measure_bytes
+        self._started = {}
+        self._lock = threading.Lock()
+
+    def _key(self, event):
+        return event.connection_id, event.request_id
+
+    def started(self, event):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        target = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            target = event.command.get("collection")
+        with self._lock:
+            self._started[self._key(event)] = (call_site(), "{}.{}".format(event.database_name, target),
+                                               event.command)
+
+    def _finished(self, event):
+        with self._lock:
+            return self._started.pop(self._key(event), None)
+
+    def succeeded(self, event):
+        started = self._finished(event)
+        if started is None:
+            return
+        site, target, command = started
+        self.metrics.record("mongo", event.command_name, target, site, event.duration_micros / 1e6,
+                            documents=reply_documents(event.command_name, event.reply),
+                            bytes=len(BSON.encode(event.reply)) if self.measure_bytes else 0,
+                            query=lambda: json_util.dumps(command)[:1000])
+
+    def failed(self, event):
+        started = self._finished(event)
+        if started is not None:
+            site, target, command = started
+            self.metrics.record("mongo", event.command_name + ".failed", target, site, event.duration_micros / 1e6,
+                                query=lambda: json_util.dumps(command)[:1000])
+
+
+def response_bytes(resp, measure_bytes=None):
+    """
+    Returns the size of an Elasticsearch response: its Content-Length if the client exposes it, otherwise the size
+    of its JSON serialization if measure_bytes (default: MEASURE_BYTES), otherwise 0.
+    """
+    headers = getattr(getattr(resp, "meta", None), "headers", None) or {}
+    length = headers.get("content-length")
+    if length is not None:
+        return int(length)
+    if MEASURE_BYTES if measure_bytes is None else measure_bytes:
+        return len(json.dumps(getattr(resp, "body", resp), default=str))
+    return 0
+
+
+def timed_search(method, operation, metrics=QUERY_METRICS, measure_bytes=None):
+    """
+    Wraps an Elasticsearch method (search or scroll) to record its calls in metrics.
+
+    The size of a response is counted as described in response_bytes.
+    """
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        resp = method(*args, **kwargs)
+        seconds = time.perf_counter() - started
+        body = getattr(resp, "body", resp)
+        metrics.record("elastic", operation, kwargs.get("index", "scroll"), call_site(), seconds,
+                       documents=len(body.get("hits", {}).get("hits", ())),
+                       bytes=response_bytes(resp, measure_bytes),
+                       query=lambda: json.dumps(kwargs.get("body"), default=str)[:1000])
+        return resp
+    return wrapper
@@ -1,7 +1,83 @@
-from matstract.models.database import AtlasConnection, ElasticConnection
+import base64
+import hashlib
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from matstract.models.database import AtlasConnection, ElasticConnection, iter_ordered, ES_WINDOW
+from matstract.models.metrics import QUERY_METRICS, query_site
+from matstract.models.search_collection import SEARCH_COLLECTION, SEARCH_FIELDS
 from matstract.extract import parsing
 from bson import ObjectId
-from collections import Iterable
+from collections.abc import Iterable
+
+logger = logging.getLogger(__name__)
+
+# Fields displayed in the search results tables.
+TABLE_FIELDS = ["title", "authors", "year", "journal", "abstract", "link"]
+
+# Threads running the Elasticsearch and material queries of combined searches concurrently.
+EXECUTOR = ThreadPoolExecutor(max_workers=8)
+
+# Number of Elasticsearch results intersected with the material query in combined searches.
+MAX_CANDIDATES = 10000
+
+# Number of Elasticsearch results requested at a time when paging forward through a combined search.
+PAGE_CANDIDATES = 1000
+
+# Totals above this are reported as approximate ("gte") instead of being counted exactly.
+COUNT_LIMIT = 10000
+
+
+def _timed(site, func, *args):
+    with query_site(site):
+        started = time.perf_counter()
+        result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def _search_fields(projection):
+    """ Fields of the search collection to fetch for projection; chem_mentions is stored as unique_mats. """
+    if projection is None:
+        return SEARCH_FIELDS + ["unique_mats"]
+    fields = [f for f in SEARCH_FIELDS if f in projection]
+    if "chem_mentions" in projection:
+        fields.append("unique_mats")
+    return fields
+
+
+def _query_key(text, materials):
+    return hashlib.sha1(json.dumps([text or "", materials or ""]).encode("utf-8")).hexdigest()[:12]
+
+
+def encode_token(state):
+    """ Encodes the state of a paginated search into an opaque continuation token. """
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(",", ":")).encode("utf-8")).decode("ascii")
+
+
+def decode_token(token, key):
+    """
+    Decodes a continuation token returned by MatstractSearch.search_page.
+
+    Raises:
+        ValueError: if the token is malformed or belongs to another query.
+
+    """
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token.encode("ascii")).decode("utf-8"))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError("Invalid continuation token.") from e
+    if not isinstance(state, dict) or state.get("q") != key:
+        raise ValueError("The continuation token belongs to another query.")
+    return state
+
+
+def _rename_mentions(docs):
+    for doc in docs:
+        if "unique_mats" in doc:
+            doc["chem_mentions"] = doc.pop("unique_mats")
+        yield doc
+
 
 class MatstractSearch:
     """The class running all search queries"""
@@ -10,45 +86,193 @@ class MatstractSearch:
         self._ac = AtlasConnection(db="production")
         self._ec = ElasticConnection()
         self.filters = []
+        self.timings = {}
 
-    def search(self, text='', materials=(), max_results=1000):
-        if materials is not None:
-            max_results = 10000
-        print("searching for {} and {}".format(text, materials))
-        pipeline = list()
+    def search(self, text='', materials=(), max_results=1000, projection=None, concurrent=True):
+        """
+        Searches the abstracts by text (Elasticsearch) and/or materials (normalized mentions).
+
+        Args:
+            text (str): text query
+            materials (str): space separated materials, "-" in front of a material excludes it
+            max_results (int): maximum number of results
+            projection (list, optional): names of the fields to return, e.g. TABLE_FIELDS. Default: all fields.
+            concurrent (bool): for text and material searches, run the Elasticsearch query and the material
+                lookup concurrently and intersect their ids in Elasticsearch rank order (see intersect). If False,
+                the Elasticsearch ids are passed to the material query with $in. Default: True
+
+        Returns: iterator of result documents (a generator for text-only and concurrent searches, a cursor otherwise)
+
+        """
+        logger.debug("searching for %s and %s", text, materials)
+        match = {}
         if materials:
             self.material_filter = MaterialFilter(materials)
-            for cond in self.material_filter.conditions:
-                pipeline.append(cond)
-            pipeline.append({"$lookup": {
-                "from": "abstracts",
-                "localField": "doi",
-                "foreignField": "doi",
-                "as": "abstracts"}})
-            pipeline.append({"$match": {"abstracts": {"$ne": []}}})
-            pipeline.append({"$unwind": "$abstracts"})
-            pipeline.append({"$project": {
-                "_id": "$abstracts._id",
-                "doi": 1,
-                "abstract": "$abstracts.abstract",
-                "year": "$abstracts.year",
-                "authors": "$abstracts.authors",
-                "title": "$abstracts.title",
-                "journal": "$abstracts.journal",
-                "link": "$abstracts.link",
-                "chem_mentions": "$unique_mats"}})
-            pipeline.append({"$project": {"abstracts": 0}})
-            pipeline.append({ "$limit": max_results})
+            match.update(self.material_filter.match)
         if text:
-            ids = self._ec.query(text, max_results=max_results)
-            self.document_filter = DocumentFilter(ids)
             if not materials or not len(materials):
-                return self._ac.get_documents_by_id(ids)
-            for cond in self.document_filter.conditions:
-                pipeline.append(cond)
-        return self._ac.db.mats_.aggregate(pipeline)
+                # stream ids from Elasticsearch and fetch their documents chunk by chunk, in rank order
+                ids = self._ec.iter_ids(text, max_results=max_results)
+                return self._ac.iter_documents_by_id(ids, projection=projection)
+            if concurrent:
+                return self.intersect(text, match, max_results=max_results, projection=projection)
+            ids = self._ec.query(text, max_results=MAX_CANDIDATES)
+            self.document_filter = DocumentFilter(ids)
+            match.update(self.document_filter.match)
+        # the search collection carries the display fields, so this is a single indexed $match
+        fields = {field: 1 for field in SEARCH_FIELDS}
+        fields["chem_mentions"] = "$unique_mats"
+        if projection is not None:
+            fields = {k: v for k, v in fields.items() if k in projection}
+        fields["_id"] = 1
+        pipeline = [{"$match": match}, {"$project": fields}, {"$limit": max_results}]
+        return self._ac.db[SEARCH_COLLECTION].aggregate(pipeline)
+
+    def intersect(self, text, match, max_results=1000, projection=None):
+        """
+        Runs the Elasticsearch query for text and the material query match concurrently and returns the documents
+        found by both, in Elasticsearch rank order.
+
+        Only ids are fetched by the two queries (see intersect_ids); the documents of the intersection are then
+        fetched by id.
+
+        Args:
+            text (str): text query
+            match (dict): query on the search collection, e.g. MaterialFilter.match
+            max_results (int): maximum number of results
+            projection (list, optional): names of the fields to return. Default: all fields.
+
+        Returns: generator of result documents
+
+        """
+        ranked = self.intersect_ids(text, match)[:max_results]
+        return _rename_mentions(iter_ordered(self._ac.db[SEARCH_COLLECTION], ranked,
+                                             projection=_search_fields(projection)))
+
+    def intersect_ids(self, text, match):
+        """
+        Returns the ids of the top MAX_CANDIDATES Elasticsearch results for text that match the material query, in
+        rank order.
+
+        The Elasticsearch query and the material query (covered by the unique_mats index) run concurrently. The
+        durations of the two queries, the time they overlapped and the duration of the intersection are stored in
+        self.timings.
+
+        """
+        return [id for rank, id in self._ranked_intersection(text, match)]
 
-    def more_like_this(self, text='', materials=(), max_results=100):
+    def _ranked_intersection(self, text, match):
+        """ Returns the (Elasticsearch rank, id) of the results of intersect_ids. """
+        collection = self._ac.db[SEARCH_COLLECTION]
+        started = time.perf_counter()
+        text_query = EXECUTOR.submit(_timed, "matstract.models.search:intersect", self._ec.query, text,
+                                     MAX_CANDIDATES)
+        material_query = EXECUTOR.submit(_timed, "matstract.models.search:intersect",
+                                         lambda: {doc["_id"] for doc in collection.find(match, {"_id": 1})})
+        ids, text_seconds = text_query.result()
+        material_ids, material_seconds = material_query.result()
+        queried = time.perf_counter()
+
+        ranked = [(rank, id) for rank, id in enumerate(ids) if id in material_ids]
+        intersected = time.perf_counter()
+        QUERY_METRICS.record("matstract", "intersect", SEARCH_COLLECTION, "matstract.models.search:intersect",
+                             intersected - queried, documents=len(ranked))
+        self.timings = {"text": text_seconds, "materials": material_seconds, "queries": queried - started,
+                        "overlap": max(0., text_seconds + material_seconds - (queried - started)),
+                        "intersection": intersected - queried, "results": len(ranked),
+                        "truncated": len(ids) >= MAX_CANDIDATES}
+        logger.debug("text query %(text).3f s, material query %(materials).3f s, concurrently %(queries).3f s "
+                     "(overlap %(overlap).3f s), intersection of %(results)d ids %(intersection).4f s", self.timings)
+        return ranked
+
+    def search_page(self, text=None, materials=None, page_size=100, token=None, projection=None):
+        """
+        Returns one page of the results of a search, see search.
+
+        Text searches are paged by rank with Elasticsearch (up to ES_WINDOW results) and material searches by _id
+        on the search collection. The first page of a combined search is taken from the full intersection (see
+        intersect_ids); the following pages continue from the Elasticsearch rank of the last result, matching
+        PAGE_CANDIDATES Elasticsearch results at a time against the material query.
+        The total is computed for the first page only and carried in the continuation token. It is exact up to
+        COUNT_LIMIT (MAX_CANDIDATES for combined searches) and reported as a lower bound beyond.
+
+        Args:
+            text (str): text query
+            materials (str): space separated materials, "-" in front of a material excludes it
+            page_size (int): number of results per page. Default: 100
+            token (str, optional): continuation token of the previous page. Default: first page.
+            projection (list, optional): names of the fields to return, e.g. TABLE_FIELDS. Default: all fields.
+
+        Returns: dict with the "results" of the page (list), an approximate "total" ({"value": int,
+            "relation": "eq" or "gte"}, as in Elasticsearch) and the continuation token of the "next" page, or None
+            on the last page.
+
+        Raises:
+            ValueError: if token is invalid or belongs to another query.
+
+        """
+        key = _query_key(text, materials)
+        state = decode_token(token, key) if token else {"q": key, "o": 0}
+        total = state.get("t")
+        collection = self._ac.db[SEARCH_COLLECTION]
+        match = MaterialFilter(materials).match if materials else {}
+
+        if text and not materials:
+            ids, es_total = self._ec.ids_page(text, offset=state["o"], size=min(page_size, ES_WINDOW - state["o"]))
+            total = total or es_total
+            results = self._ac.get_documents_by_id(ids, projection=projection)
+            offset = state["o"] + len(ids)
+            more = len(ids) == page_size and offset < ES_WINDOW and \
+                (total["relation"] == "gte" or offset < total["value"])
+            state = dict(state, o=offset)
+        elif text:
+            if total is None:
+                ranked = self._ranked_intersection(text, match)
+                total = {"value": len(ranked), "relation": "gte" if self.timings["truncated"] else "eq"}
+            else:
+                ranked = self._ranked_page(text, match, state["o"], page_size + 1)
+            page = ranked[:page_size]
+            results = list(_rename_mentions(iter_ordered(collection, [id for rank, id in page],
+                                                         projection=_search_fields(projection))))
+            more = len(ranked) > page_size
+            if page:
+                state = dict(state, o=page[-1][0] + 1)
+        else:
+            if total is None:
+                count = collection.count_documents(match, limit=COUNT_LIMIT)
+                total = {"value": count, "relation": "gte" if count >= COUNT_LIMIT else "eq"}
+            query = match
+            if state.get("a"):
+                query = {"$and": [match, {"_id": {"$gt": ObjectId(state["a"])}}]} if match else \
+                    {"_id": {"$gt": ObjectId(state["a"])}}
+            fields = _search_fields(projection)
+            docs = list(collection.find(query, fields).sort("_id", 1).limit(page_size + 1))
+            more = len(docs) > page_size
+            results = list(_rename_mentions(docs[:page_size]))
+            if results:
+                state = dict(state, a=str(results[-1]["_id"]))
+
+        state["t"] = total
+        return {"results": results, "total": total, "next": encode_token(state) if more else None}
+
+    def _ranked_page(self, text, match, offset, size):
+        """
+        Returns the (Elasticsearch rank, id) of the next size results of a combined search, starting at rank offset
+        and up to rank MAX_CANDIDATES.
+        """
+        collection = self._ac.db[SEARCH_COLLECTION]
+        ranked = []
+        while len(ranked) < size and offset < MAX_CANDIDATES:
+            ids, _ = self._ec.ids_page(text, offset=offset, size=min(PAGE_CANDIDATES, MAX_CANDIDATES - offset))
+            if not ids:
+                break
+            query = {"_id": {"$in": ids}}
+            found = {doc["_id"] for doc in collection.find({"$and": [match, query]} if match else query, {"_id": 1})}
+            ranked.extend((offset + i, id) for i, id in enumerate(ids) if id in found)
+            offset += len(ids)
+        return ranked[:size]
+
+    def more_like_this(self, text='', materials=(), max_results=100, projection=None):
         if text is None or text == '':
             return None
 
@@ -57,11 +281,11 @@ class MatstractSearch:
                 "fields": ['title', 'abstract'],
                 "like": text
             }
-        }}
+        }, "_source": False}
         hits = self._ec.search(index="tri_abstracts", body=query, size=max_results, request_timeout=60)["hits"][
             "hits"]
         ids = [ObjectId(h["_id"]) for h in hits]
-        return self._ac.get_documents_by_id(ids)
+        return self._ac.get_documents_by_id(ids, projection=projection)
 
 
 class Filter():
@@ -73,6 +297,12 @@ class Filter():
     def __init__(self, conditions):
         self.conditions = conditions
 
+    @property
+    def match(self):
+        """ The conditions merged into the query of a single $match stage. """
+        queries = [cond["$match"] for cond in self.conditions]
+        return queries[0] if len(queries) == 1 else {"$and": queries} if queries else {}
+
 
 class MaterialFilter(Filter):
 
@@ -0,0 +1,136 @@
+"""
+Denormalized collection backing material searches.
+
+Each document of SEARCH_COLLECTION is an abstract (same _id and display fields) carrying the normalized materials
+of its mats_ entry in unique_mats, so that a material search is a single $match on the multikey unique_mats index
+instead of a $lookup from mats_ into abstracts per matched document.
+
+The collection is kept up to date by build_search_collection, which by default only processes the mats_ entries
+added since its previous run. Entries whose abstract was missing, and abstracts removed since, are only caught up
+with by a full rebuild, which builds a new collection and swaps it in:
+
+    python -m matstract.models.search_collection [--full] [--batch-size 500]
+"""
+import argparse
+import datetime
+import time
+from pymongo import ReplaceOne, ASCENDING
+
+SEARCH_COLLECTION = "abstracts_search"
+
+# abstract fields copied to the search collection
+SEARCH_FIELDS = ["doi", "title", "authors", "year", "journal", "abstract", "link"]
+
+# collection holding the state of the incremental builds
+BUILD_LOG = "search_builds"
+
+# collection a full rebuild is written to before replacing SEARCH_COLLECTION
+REBUILD_COLLECTION = SEARCH_COLLECTION + "_rebuild"
+
+
+def ensure_indexes(collection):
+    """ Creates the multikey (unique_mats, _id) index used by material searches and an index on doi. """
+    collection.create_index([("unique_mats", ASCENDING), ("_id", ASCENDING)])
+    collection.create_index([("doi", ASCENDING)])
+
+
+def search_documents(db, mats):
+    """
+    Joins mats_ entries with their abstracts.
+
+    Args:
+        db: (pymongo.database.Database) database holding the mats_ and abstracts collections.
+        mats: (list) mats_ documents.
+
+    Returns:
+        (list) search documents, one per abstract with an entry in mats. Entries without an abstract are skipped.
+
+    """
+    unique_mats = {m["doi"]: m.get("unique_mats", []) for m in mats if m.get("doi")}
+    projection = {field: 1 for field in SEARCH_FIELDS}
+    documents = []
+    for abstract in db.abstracts.find({"doi": {"$in": list(unique_mats)}}, projection):
+        abstract["unique_mats"] = unique_mats[abstract["doi"]]
+        documents.append(abstract)
+    return documents
+
+
+def build_search_collection(db, full=False, dois=None, batch_size=500, verbose=False):
+    """
+    Adds the mats_ entries created since the previous build to the search collection.
+
+    mats_ entries are processed in _id order and the last processed _id is recorded in BUILD_LOG after every batch,
+    so an interrupted build resumes where it stopped.
+
+    A full rebuild writes all entries to REBUILD_COLLECTION and then renames it over the search collection, so that
+    documents of removed abstracts disappear and searches are answered from the previous collection meanwhile. An
+    interrupted full rebuild starts over.
+
+    Args:
+        db: (pymongo.database.Database) database holding the mats_ and abstracts collections.
+        full: (bool) rebuild the search collection from all mats_ entries. Default is False.
+        dois: (list, optional) only (re)build the documents of these DOIs, e.g. after their materials were
+            re-extracted. The incremental state is left untouched.
+        batch_size: (int) number of mats_ entries per batch. Default is 500.
+        verbose: (bool) print progress after every batch. Default is False.
+
+    Returns:
+        (dict) statistics of the build: mats entries processed, documents written and seconds.
+
+    """
+    full = full and dois is None
+    collection = db[REBUILD_COLLECTION if full else SEARCH_COLLECTION]
+    if full:
+        collection.drop()
+    ensure_indexes(collection)
+    log = db[BUILD_LOG]
+    state = log.find_one({"_id": SEARCH_COLLECTION}) or {}
+    query = {}
+    if dois is not None:
+        query["doi"] = {"$in": list(dois)}
+    elif not full and state.get("last_mats_id") is not None:
+        query["_id"] = {"$gt": state["last_mats_id"]}
+
+    def save_state(last_id):
+        log.update_one({"_id": SEARCH_COLLECTION},
+                       {"$set": {"last_mats_id": last_id, "updated_on": datetime.datetime.utcnow().isoformat()}},
+                       upsert=True)
+
+    stats = {"mats": 0, "written": 0, "seconds": 0.}
+    started = time.perf_counter()
+    last_id = query.get("_id", {}).get("$gt")
+    while True:
+        batch_query = dict(query)
+        if last_id is not None:
+            batch_query["_id"] = {"$gt": last_id}
+        mats = list(db.mats_.find(batch_query, {"doi": 1, "unique_mats": 1}).sort("_id", ASCENDING)
+                    .limit(batch_size))
+        if not mats:
+            break
+        documents = search_documents(db, mats)
+        if documents:
+            collection.bulk_write([ReplaceOne({"_id": d["_id"]}, d, upsert=True) for d in documents],
+                                  ordered=False)
+        last_id = mats[-1]["_id"]
+        stats["mats"] += len(mats)
+        stats["written"] += len(documents)
+        if dois is None and not full:
+            save_state(last_id)
+        if verbose:
+            print("{mats} mats entries processed, {written} search documents written".format(**stats))
+    if full:
+        collection.rename(SEARCH_COLLECTION, dropTarget=True)
+        save_state(last_id)
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+
+if __name__ == '__main__':
+    from matstract.models.database import AtlasConnection
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--full", action="store_true", help="rebuild the collection from all mats_ entries")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--db", default="production")
+    args = parser.parse_args()
+    print(build_search_collection(AtlasConnection(access="admin", db=args.db).db, full=args.full,
+                                  batch_size=args.batch_size, verbose=True))
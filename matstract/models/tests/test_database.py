@@ -0,0 +1,131 @@
+import random
+import unittest
+from unittest import mock
+from types import SimpleNamespace
+import mongomock
+from bson import ObjectId
+from matstract.models import database
+from matstract.models.database import get_client, pool_stats, POOL_OPTIONS, PoolMetrics, sort_results, iter_ordered
+from matstract.models.database import ElasticConnection
+from matstract.models.memory import MemoryElastic, BM25Index
+
+
+class TestClients(unittest.TestCase):
+    def setUp(self):
+        self._clients = dict(database._clients)
+
+    def tearDown(self):
+        for key in set(database._clients) - set(self._clients):
+            database._clients.pop(key)[0].close()
+
+    def test_clients_are_shared(self):
+        client, metrics = get_client("mongodb://localhost:1", "test_db")
+        self.assertIs(get_client("mongodb://localhost:1", "test_db", dict(POOL_OPTIONS))[0], client)
+        self.assertIsNot(get_client("mongodb://localhost:1", "other_db")[0], client)
+        small, _ = get_client("mongodb://localhost:1", "test_db", dict(POOL_OPTIONS, maxPoolSize=2))
+        self.assertIsNot(small, client)
+        self.assertEqual(small.options.pool_options.max_pool_size, 2)
+        self.assertEqual(client.options.pool_options.max_pool_size, POOL_OPTIONS["maxPoolSize"])
+        self.assertEqual(sum(stats["db"] == "test_db" for stats in pool_stats()), 2)
+
+    def test_pool_metrics(self):
+        metrics = PoolMetrics()
+        event = SimpleNamespace(address=("localhost", 1), connection_id=1)
+        metrics.connection_created(event)
+        for _ in range(2):
+            metrics.connection_check_out_started(event)
+            metrics.connection_checked_out(event)
+        stats = metrics.stats()
+        self.assertEqual((stats["checkouts"], stats["checked_out"], stats["connections"]), (2, 2, 1))
+        self.assertGreaterEqual(stats["max_wait_seconds"], 0.)
+        metrics.connection_checked_in(event)
+        metrics.connection_check_out_started(event)
+        metrics.connection_check_out_failed(event)
+        stats = metrics.stats()
+        self.assertEqual((stats["checkouts"], stats["checked_out"], stats["checkout_failures"]), (2, 1, 1))
+
+
+class CountingCollection(object):
+    """ Collection recording the ids of its $in queries. """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.queries = []
+
+    def find(self, filter, projection=None):
+        (key, condition), = filter.items()
+        self.queries.append(condition["$in"])
+        return self.collection.find(filter, projection)
+
+
+class TestOrderedFetch(unittest.TestCase):
+    def setUp(self):
+        self.ids = [ObjectId() for _ in range(10)]
+        self.collection = mongomock.MongoClient().db.abstracts
+        self.collection.insert_many([{"_id": id, "doi": "10.1/{}".format(i), "title": str(i)}
+                                     for i, id in enumerate(self.ids)])
+
+    def test_sort_results(self):
+        results = list(self.collection.find({"_id": {"$in": self.ids}}))
+        random.Random(0).shuffle(results)
+        self.assertEqual([d["_id"] for d in sort_results(results, self.ids)], self.ids)
+        dois = ["10.1/3", "10.1/1", "10.1/2"]
+        by_doi = [r for r in results if r["doi"] in dois]
+        self.assertEqual([d["doi"] for d in sort_results(by_doi, dois, key="doi")], dois)
+
+    def test_iter_ordered_skips_missing_ids(self):
+        ranked = [self.ids[7], ObjectId(), self.ids[2], self.ids[7], self.ids[0]]
+        docs = list(iter_ordered(self.collection, ranked, projection=["title"]))
+        self.assertEqual([d["_id"] for d in docs], [self.ids[7], self.ids[2], self.ids[0]])
+        self.assertEqual(set(docs[0]), {"_id", "title"})
+
+    def test_iter_ordered_by_doi(self):
+        dois = ["10.1/5", "10.1/missing", "10.1/1"]
+        docs = list(iter_ordered(self.collection, dois, key="doi", projection={"title": 1, "_id": 0}))
+        self.assertEqual([(d["doi"], d["title"]) for d in docs], [("10.1/5", "5"), ("10.1/1", "1")])
+        self.assertNotIn("_id", docs[0])
+
+    def test_iter_ordered_chunks(self):
+        collection = CountingCollection(self.collection)
+        ranked = list(reversed(self.ids))
+        # the repeated id is in the second chunk
+        docs = iter_ordered(collection, iter(ranked[:5] + [ranked[0]] + ranked[5:]), chunk_size=4)
+        self.assertEqual(next(docs)["_id"], ranked[0])
+        self.assertEqual(len(collection.queries), 1)
+        self.assertEqual([d["_id"] for d in docs], ranked[1:])
+        self.assertEqual([len(ids) for ids in collection.queries], [4, 3, 3])
+
+
+class TestElasticIds(unittest.TestCase):
+    def setUp(self):
+        self.ids = [ObjectId() for _ in range(7)]
+        index = BM25Index(["abstract"])
+        for i, id in enumerate(self.ids):
+            # earlier documents mention lithium more often, so that they rank higher
+            index.add(str(id), {"abstract": "lithium " * (10 - i)})
+        self.es = ElasticConnection(backend="memory")
+        self.es._memory = MemoryElastic({"tri_abstracts": index})
+
+    def test_iter_ids_max_results(self):
+        self.assertEqual(list(self.es.iter_ids("lithium")), self.ids)
+        self.assertEqual(list(self.es.iter_ids("lithium", max_results=3, page_size=5)), self.ids[:3])
+        self.assertEqual(list(self.es.iter_ids("lithium", max_results=5, page_size=2)), self.ids[:5])
+        self.assertEqual(list(self.es.iter_ids("lithium", max_results=100, page_size=2)), self.ids)
+        self.assertEqual(self.es._memory._scrolls, {})
+
+    def test_scroll_is_cleared_when_closed_early(self):
+        ids = self.es.iter_ids("lithium", page_size=2)
+        self.assertEqual(next(ids), self.ids[0])
+        self.assertEqual(len(self.es._memory._scrolls), 1)
+        ids.close()
+        self.assertEqual(self.es._memory._scrolls, {})
+
+    def test_ids_page_stays_within_the_window(self):
+        with mock.patch.object(database, "ES_WINDOW", 5):
+            ids, total = self.es.ids_page("lithium", offset=3, size=4)
+            self.assertEqual((ids, total), (self.ids[3:5], {"value": 7, "relation": "eq"}))
+            self.assertEqual(self.es.ids_page("lithium", offset=5, size=4)[0], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
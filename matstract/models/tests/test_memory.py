@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+from bson import ObjectId
+from matstract.models.database import AtlasConnection, ElasticConnection, iter_ordered
+from matstract.models.memory import MemoryStore, BM25Index, dump_jsonl, parse_query
+
+ABSTRACTS = [
+    {"_id": ObjectId(), "title": "Lithium iron phosphate cathodes", "year": 2016,
+     "abstract": "Olivine LiFePO4 is a lithium ion battery cathode. The cathode is stable."},
+    {"_id": ObjectId(), "title": "Solid electrolyte interphases", "year": 2017,
+     "abstract": "The solid electrolyte interphase on lithium metal anodes limits battery life."},
+    {"_id": ObjectId(), "title": "Thermoelectric tellurides", "year": 2017,
+     "abstract": "Bi2Te3 is a thermoelectric material with low thermal conductivity."},
+    {"_id": ObjectId(), "title": "Perovskite solar cells", "year": 2018,
+     "abstract": "Lead halide perovskites are solar absorbers. Unlike lithium, lead is toxic."},
+]
+
+
+class TestMemoryBackend(unittest.TestCase):
+    def setUp(self):
+        self.fixtures = tempfile.TemporaryDirectory()
+        dump_jsonl(ABSTRACTS, os.path.join(self.fixtures.name, "abstracts.jsonl"))
+        dump_jsonl([{"material": "LiFePO4", "keywords_tf": {}}], os.path.join(self.fixtures.name, "keywords.jsonl"))
+        self.store = MemoryStore(self.fixtures.name)
+
+    def tearDown(self):
+        self.fixtures.cleanup()
+
+    def test_parse_query(self):
+        self.assertEqual(parse_query('Lithium "solid electrolyte" -sulfide'),
+                         (["lithium"], [["solid", "electrolyte"]], ["sulfide"]))
+
+    def test_find_and_aggregate(self):
+        db = self.store.database("production")
+        self.assertEqual(db.abstracts.count_documents({}), 4)
+        self.assertEqual(db.abstracts.find_one({"_id": ABSTRACTS[2]["_id"]})["title"], "Thermoelectric tellurides")
+        years = {d["_id"]: d["count"] for d in db.abstracts.aggregate(
+            [{"$match": {"year": {"$gte": 2017}}}, {"$group": {"_id": "$year", "count": {"$sum": 1}}}])}
+        self.assertEqual(years, {2017: 2, 2018: 1})
+        self.assertEqual(len(list(db.abstracts.aggregate([{"$sample": {"size": 1}}]))), 1)
+        self.assertEqual(db["keywords"].find_one({"material": "LiFePO4"})["keywords_tf"], {})
+
+    def test_databases_are_independent(self):
+        self.store.database("test").abstracts.delete_many({})
+        self.assertEqual(self.store.database("production").abstracts.count_documents({}), 4)
+
+    def test_text_search(self):
+        db = self.store.database("production")
+        self.assertEqual({d["_id"] for d in db.abstracts.find({"$text": {"$search": '"solid electrolyte"'}})},
+                         {ABSTRACTS[1]["_id"]})
+        self.assertEqual(db.abstracts.count_documents({"$text": {"$search": "lithium -lead"}, "year": 2016}), 1)
+        db.abstracts.insert_one({"title": "Lithium sulfur", "abstract": "A solid electrolyte for Li-S cells."})
+        self.assertEqual(db.abstracts.count_documents({"$text": {"$search": '"solid electrolyte"'}}), 2)
+
+    def test_elastic_search_ranks_with_bm25(self):
+        es = self.store.elastic()
+        resp = es.search(index="tri_abstracts", body={"query": {"simple_query_string": {"query": "lithium cathode"}}},
+                         size=10)
+        ids = [hit["_id"] for hit in resp["hits"]["hits"]]
+        self.assertEqual(resp["hits"]["total"], 3)
+        self.assertEqual(ids[0], str(ABSTRACTS[0]["_id"]))
+        self.assertEqual(set(ids), {str(a["_id"]) for a in (ABSTRACTS[0], ABSTRACTS[1], ABSTRACTS[3])})
+        self.assertIn("abstract", resp["hits"]["hits"][0]["_source"])
+
+    def test_more_like_this(self):
+        index = BM25Index(["abstract"])
+        for i, a in enumerate(ABSTRACTS):
+            index.add(i, a)
+        hits = index.more_like_this("lithium battery cathode, lithium battery cathode", min_doc_freq=1)
+        self.assertEqual(hits[0][0], 0)
+
+    def test_connections_scroll(self):
+        ac = AtlasConnection(backend="memory")
+        es = ElasticConnection(backend="memory")
+        self.assertIsNotNone(ac.db)
+        es._memory = self.store.elastic()
+        ids = list(es.iter_ids("lithium lead thermoelectric", page_size=1))
+        self.assertEqual(len(ids), 4)
+        self.assertEqual(es._memory._scrolls, {})
+        db = self.store.database("production")
+        docs = list(iter_ordered(db.abstracts, ids, projection=["title"]))
+        self.assertEqual([d["_id"] for d in docs], ids)
+
+
+if __name__ == '__main__':
+    unittest.main()
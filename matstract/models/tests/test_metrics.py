@@ -0,0 +1,67 @@
+import unittest
+from types import SimpleNamespace
+from matstract.models.database import ElasticConnection
+from matstract.models.memory import MemoryElastic, BM25Index
+from matstract.models import metrics
+from matstract.models.metrics import QueryMetrics, CommandMetrics, query_site
+
+
+class TestQueryMetrics(unittest.TestCase):
+    def test_histogram_and_slow_log(self):
+        qm = QueryMetrics(buckets=(0.1, 1.), slow_seconds=0.5)
+        qm.record("mongo", "find", "db.abstracts", "site", 0.05, documents=3, bytes=100)
+        with self.assertLogs("matstract.queries", level="WARNING") as logs:
+            qm.record("mongo", "find", "db.abstracts", "site", 0.7, documents=1, bytes=10, query=lambda: "{q}")
+        self.assertIn("{q}", logs.output[0])
+
+        series, = qm.snapshot()
+        self.assertEqual((series["count"], series["documents"], series["bytes"], series["slow"]), (2, 4, 110, 1))
+        self.assertEqual(series["buckets"], [1, 1])
+        text = qm.prometheus(pools=[{"db": "production", "checkouts": 2}])
+        self.assertIn('matstract_query_seconds_bucket{backend="mongo",operation="find",target="db.abstracts",'
+                      'site="site",le="1.0"} 2', text)
+        self.assertIn('matstract_query_documents_total{backend="mongo",operation="find",target="db.abstracts",'
+                      'site="site"} 4', text)
+        self.assertIn('matstract_mongo_pool_checkouts{db="production"} 2', text)
+
+    def test_command_listener(self):
+        qm = QueryMetrics()
+        command = {"aggregate": "abstracts", "pipeline": []}
+        for request_id, measure_bytes in ((7, True), (8, False)):
+            listener = CommandMetrics(qm, measure_bytes=measure_bytes)
+            listener.started(SimpleNamespace(command_name="aggregate", command=command, database_name="production",
+                                             connection_id=1, request_id=request_id))
+            listener.succeeded(SimpleNamespace(command_name="aggregate", connection_id=1, request_id=request_id,
+                                               duration_micros=2000, reply={"cursor": {"firstBatch": [{}, {}]}}))
+            series, = qm.snapshot()
+            if measure_bytes:
+                measured = series["bytes"]
+        self.assertEqual((series["operation"], series["target"], series["count"], series["documents"]),
+                         ("aggregate", "production.abstracts", 2, 4))
+        self.assertEqual(series["site"], __name__ + ":test_command_listener")
+        self.assertGreater(measured, 0)
+        self.assertEqual(series["bytes"], measured)
+
+    def test_response_bytes(self):
+        body = {"hits": {"hits": [{"_id": "1"}]}}
+        self.assertEqual(metrics.response_bytes(SimpleNamespace(meta=SimpleNamespace(
+            headers={"content-length": "123"}), body=body)), 123)
+        self.assertEqual(metrics.response_bytes(body, measure_bytes=False), 0)
+        self.assertEqual(metrics.response_bytes(body, measure_bytes=True), len('{"hits": {"hits": [{"_id": "1"}]}}'))
+
+    def test_elastic_calls_are_recorded(self):
+        index = BM25Index(["abstract"])
+        index.add("5b0d7a7e4a6d5b2a1c3e9f01", {"abstract": "lithium"})
+        es = ElasticConnection(backend="memory")
+        es._memory = MemoryElastic({"tri_abstracts": index})
+        metrics.QUERY_METRICS.reset()
+        with query_site("test"):
+            es.query("lithium")
+        scroll, search = metrics.QUERY_METRICS.snapshot()
+        self.assertEqual((search["backend"], search["operation"], search["target"], search["site"],
+                          search["documents"]), ("elastic", "search", "tri_abstracts", "test", 1))
+        self.assertEqual((scroll["operation"], scroll["documents"]), ("scroll", 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
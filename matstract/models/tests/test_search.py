@@ -0,0 +1,130 @@
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+from bson import ObjectId
+from matstract.models import database
+from matstract.models.memory import dump_jsonl
+from matstract.models import search
+from matstract.models.search import MatstractSearch, TABLE_FIELDS
+from matstract.models.search_collection import build_search_collection
+
+ABSTRACTS = [{"_id": ObjectId(), "doi": "10.1/{}".format(i), "title": "Title {}".format(i), "year": 2018,
+              "journal": "Journal", "authors": ["Doe, J."], "link": "https://doi.org/10.1/{}".format(i),
+              # earlier abstracts mention lithium more often, so that they rank higher
+              "abstract": "lithium " * (20 - i) + "cathode {}".format("oxide" if i % 2 else "phosphate")}
+             for i in range(12)]
+# fixtures are stored out of rank order
+FIXTURE_ORDER = random.Random(0).sample(range(len(ABSTRACTS)), len(ABSTRACTS))
+MATS = [{"doi": "10.1/{}".format(i), "unique_mats": ["FeLiO4P"] if i % 3 else ["O2Ti", "FeLiO4P"]}
+        for i in range(12)] + [{"doi": "10.1/missing", "unique_mats": ["FeLiO4P"]}]
+
+
+class TestMatstractSearch(unittest.TestCase):
+    def setUp(self):
+        self.fixtures = tempfile.TemporaryDirectory()
+        dump_jsonl([ABSTRACTS[i] for i in FIXTURE_ORDER], os.path.join(self.fixtures.name, "abstracts.jsonl"))
+        dump_jsonl(MATS, os.path.join(self.fixtures.name, "mats_.jsonl"))
+        self.patches = [mock.patch.object(database, "BACKEND", "memory"),
+                        mock.patch.dict(os.environ, {"MATSTRACT_FIXTURES": self.fixtures.name})]
+        for patch in self.patches:
+            patch.start()
+        self.search = MatstractSearch()
+        build_search_collection(self.search._ac.db)
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.fixtures.cleanup()
+
+    def test_projection(self):
+        docs = list(self.search.search(text="lithium", projection=["title"], max_results=3))
+        self.assertEqual([set(d) for d in docs], [{"_id", "title"}] * 3)
+        self.assertEqual([d["title"] for d in docs], ["Title 0", "Title 1", "Title 2"])
+        docs = self.search._ac.get_documents_by_id([ABSTRACTS[4]["_id"]], projection=["doi"])
+        self.assertEqual(docs, [{"_id": ABSTRACTS[4]["_id"], "doi": "10.1/4"}])
+
+    def test_chem_mentions(self):
+        projection = TABLE_FIELDS + ["chem_mentions"]
+        for concurrent in (True, False):
+            docs = list(self.search.search(text="lithium", materials="TiO2", projection=projection,
+                                           concurrent=concurrent))
+            self.assertEqual(sorted(d["title"] for d in docs), ["Title 0", "Title 3", "Title 6", "Title 9"])
+            self.assertEqual(set(docs[0]), set(projection) | {"_id"})
+            self.assertEqual(docs[0]["chem_mentions"], ["O2Ti", "FeLiO4P"])
+        docs = list(self.search.search(materials="TiO2 -LiFePO4", projection=projection))
+        self.assertEqual(docs, [])
+        docs = list(self.search.search(materials="TiO2", projection=["title"]))
+        self.assertEqual([set(d) for d in docs], [{"_id", "title"}] * 4)
+        page = self.search.search_page(materials="TiO2", projection=["chem_mentions"], page_size=2)
+        self.assertEqual([set(d) for d in page["results"]], [{"_id", "chem_mentions"}] * 2)
+
+
+    def test_intersect(self):
+        match = {"unique_mats": "O2Ti"}
+        expected = [ABSTRACTS[i]["_id"] for i in (0, 3, 6, 9)]
+        self.assertEqual(self.search.intersect_ids("lithium", match), expected)
+        self.assertEqual(set(self.search.timings), {"text", "materials", "queries", "overlap", "intersection",
+                                                    "results", "truncated"})
+        self.assertEqual((self.search.timings["results"], self.search.timings["truncated"]), (4, False))
+        self.assertEqual([d["_id"] for d in self.search.intersect("lithium", match, max_results=3)], expected[:3])
+        # shorter abstracts rank first for rarer terms
+        self.assertEqual(self.search.intersect_ids("oxide", match), [ABSTRACTS[i]["_id"] for i in (9, 3)])
+
+        concurrent = [d["_id"] for d in self.search.search(text="lithium", materials="TiO2")]
+        sequential = [d["_id"] for d in self.search.search(text="lithium", materials="TiO2", concurrent=False)]
+        self.assertEqual(concurrent, expected)
+        self.assertNotEqual(sequential, expected)
+        self.assertEqual(sorted(sequential), sorted(expected))
+
+
+    def pages(self, **kwargs):
+        pages = [self.search.search_page(**kwargs)]
+        while pages[-1]["next"] is not None:
+            pages.append(self.search.search_page(token=pages[-1]["next"], **kwargs))
+        return pages
+
+    def titles(self, pages):
+        return [[d["title"] for d in page["results"]] for page in pages]
+
+    def test_text_pages(self):
+        pages = self.pages(text="lithium", page_size=5, projection=["title"])
+        self.assertEqual([len(page["results"]) for page in pages], [5, 5, 2])
+        self.assertEqual(sum(self.titles(pages), []), ["Title {}".format(i) for i in range(12)])
+        self.assertEqual([page["total"] for page in pages], [{"value": 12, "relation": "eq"}] * 3)
+
+    def test_text_pages_stop_at_the_window(self):
+        # a page size that does not divide the window
+        self.search._ec._memory.max_result_window = 8
+        with mock.patch.object(database, "ES_WINDOW", 8), mock.patch.object(search, "ES_WINDOW", 8):
+            pages = self.pages(text="lithium", page_size=3, projection=["title"])
+        self.assertEqual([len(page["results"]) for page in pages], [3, 3, 2])
+
+    def test_material_pages(self):
+        pages = self.pages(materials="LiFePO4 -TiO2", page_size=3, projection=["title"])
+        self.assertEqual(sorted(sum(self.titles(pages), [])),
+                         sorted("Title {}".format(i) for i in range(12) if i % 3))
+        self.assertEqual([page["total"] for page in pages], [{"value": 8, "relation": "eq"}] * 3)
+
+    def test_combined_pages(self):
+        with mock.patch.object(search, "PAGE_CANDIDATES", 2), \
+                mock.patch.object(self.search, "_ranked_intersection",
+                                  wraps=self.search._ranked_intersection) as intersection:
+            for page_size, sizes in ((3, [3, 1]), (2, [2, 2]), (4, [4])):
+                pages = self.pages(text="lithium", materials="TiO2", page_size=page_size, projection=["title"])
+                self.assertEqual([len(page["results"]) for page in pages], sizes)
+                self.assertEqual(sum(self.titles(pages), []), ["Title 0", "Title 3", "Title 6", "Title 9"])
+                self.assertEqual([page["total"] for page in pages], [{"value": 4, "relation": "eq"}] * len(sizes))
+        # only the first pages intersect all results
+        self.assertEqual(intersection.call_count, 3)
+
+    def test_token_of_another_query(self):
+        token = self.search.search_page(text="lithium", page_size=2)["next"]
+        self.assertRaises(ValueError, self.search.search_page, text="cathode", page_size=2, token=token)
+        self.assertRaises(ValueError, self.search.search_page, text="lithium", materials="TiO2", token=token)
+        self.assertRaises(ValueError, self.search.search_page, text="lithium", token="not a token")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+import mongomock
+from matstract.models.search_collection import build_search_collection, SEARCH_COLLECTION, \
+    REBUILD_COLLECTION
+
+
+class TestBuildSearchCollection(unittest.TestCase):
+    def setUp(self):
+        self.db = mongomock.MongoClient().db
+        self.db.abstracts.insert_many([{"doi": "10.1/{}".format(i), "title": "Title {}".format(i), "year": 2018,
+                                        "abstract": "Abstract {}".format(i), "keywords": ["unused"]}
+                                       for i in range(5)])
+        self.db.mats_.insert_many([{"doi": "10.1/{}".format(i), "unique_mats": ["LiFePO4", "O{}".format(i)]}
+                                   for i in range(3)] + [{"doi": "10.1/missing", "unique_mats": ["ZnO"]}])
+
+    def test_incremental_build(self):
+        stats = build_search_collection(self.db, batch_size=2)
+        self.assertEqual((stats["mats"], stats["written"]), (4, 3))
+        search = self.db[SEARCH_COLLECTION]
+        doc = search.find_one({"unique_mats": "O1"})
+        abstract = self.db.abstracts.find_one({"doi": "10.1/1"})
+        self.assertEqual(doc["_id"], abstract["_id"])
+        self.assertEqual(doc["title"], "Title 1")
+        self.assertNotIn("keywords", doc)
+        self.assertEqual(search.count_documents({"unique_mats": {"$in": ["LiFePO4"]}}), 3)
+
+        self.db.mats_.insert_one({"doi": "10.1/4", "unique_mats": ["Bi2Te3"]})
+        stats = build_search_collection(self.db)
+        self.assertEqual((stats["mats"], stats["written"]), (1, 1))
+        self.assertEqual(search.count_documents({}), 4)
+
+    def test_rebuild_dois(self):
+        build_search_collection(self.db)
+        self.db.mats_.update_one({"doi": "10.1/0"}, {"$set": {"unique_mats": ["NaCl"]}})
+        stats = build_search_collection(self.db, dois=["10.1/0"])
+        self.assertEqual(stats["written"], 1)
+        self.assertEqual(self.db[SEARCH_COLLECTION].find_one({"doi": "10.1/0"})["unique_mats"], ["NaCl"])
+        self.assertEqual(build_search_collection(self.db)["mats"], 0)
+
+
+    def test_full_rebuild(self):
+        build_search_collection(self.db)
+        self.db.abstracts.insert_one({"doi": "10.1/missing", "title": "Late abstract", "abstract": "ZnO"})
+        self.db.abstracts.delete_one({"doi": "10.1/1"})
+        self.assertEqual(build_search_collection(self.db)["mats"], 0)
+        self.assertIsNone(self.db[SEARCH_COLLECTION].find_one({"doi": "10.1/missing"}))
+
+        stats = build_search_collection(self.db, full=True, batch_size=3)
+        self.assertEqual((stats["mats"], stats["written"]), (4, 3))
+        search = self.db[SEARCH_COLLECTION]
+        self.assertEqual(sorted(search.distinct("doi")), ["10.1/0", "10.1/2", "10.1/missing"])
+        self.assertNotIn(REBUILD_COLLECTION, self.db.list_collection_names())
+        self.assertIn("unique_mats_1__id_1", search.index_information())
+        self.db.mats_.insert_one({"doi": "10.1/4", "unique_mats": ["Bi2Te3"]})
+        self.assertEqual(build_search_collection(self.db)["written"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
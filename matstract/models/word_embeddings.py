@@ -58,6 +58,8 @@ class EmbeddingEngine:
         self.formulas = self.dp.load_obj(ds.abspath(formulas_url[:-4]))
         for abbr in self.ABBR_LIST:
             self.formulas.pop(abbr, None)
+        # normalize the most frequent formula writings ahead of the first requests
+        self.dp.simple_parser.warm_start(self.formulas)
 
         self.formula_counts = [0] * len(self.formulas)
         for i, formula in enumerate(self.formulas):
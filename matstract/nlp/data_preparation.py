@@ -7,7 +7,7 @@ import zipfile
 import os
 import regex
 import pickle
-from pymatgen.core.composition import Composition
+from matstract.extract.formula import ELEMENTS, parse_formula
 from monty.fractions import gcd_float
 
 
@@ -296,13 +296,11 @@ class DataPreparation:
         elif any(char.isdigit() or char.islower() for char in text):
             # has to contain at least one lowercase letter or at least one number (to ignore abbreviations)
             try:
-                composition = Composition(text)
-                # has to contain more than one element
-                if len(composition.keys()) < 2 or any([not self.simple_parser.is_element(key) for key in composition.keys()]):
-                    return False
-                return True
-            except Exception:
+                composition = parse_formula(text)
+            except ValueError:
                 return False
+            # has to contain more than one element
+            return len(composition) >= 2 and ELEMENTS.issuperset(composition)
         else:
             return False
 
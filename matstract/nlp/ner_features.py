@@ -258,11 +258,7 @@ class FeatureGenerator:
         all_outcomes = []
         for doc in tagged_documents:
             for sent in doc:
-                parser = TextParser()
-                reconstructed = ' '.join([word for (word, pos), ne_tag in sent])  # Should use raw sent not reconstruct tokenized
-                parsed = parser.extract_chemdata(reconstructed)
-                flatten = [cem[0].split() for cem in parsed]
-                chems_in_sent = [item for sublist in flatten for item in sublist]
+                chems_in_sent = self.chemical_mentions([word for (word, pos), ne_tag in sent])
                 for n, ((word, pos), NE_tag) in enumerate(sent):
                     feature_vector  = self.contextual_features(sent, n)
                     feature_vector += self.syntactical_features(word)
@@ -315,15 +311,13 @@ class FeatureGenerator:
         :param sent: list of tuples; sentence containing word
         :param idx: int; index of word
         :return: feature vector representation of word
+
+        This parses the whole sentence with ChemDataExtractor, use transform_sentence or predict_sentence to generate
+        the features of all words of a sentence.
         '''
         word, tag = word_tag
 
-        parser = TextParser()
-        reconstructed = ' '.join(
-            [word for (word, pos) in sent])  # Should use raw sent not reconstruct tokenized
-        parsed = parser.extract_chemdata(reconstructed)
-        flatten = [cem[0].split() for cem in parsed]
-        chems_in_sent = [item for sublist in flatten for item in sublist]
+        chems_in_sent = self.chemical_mentions([word for (word, pos) in sent])
 
         feature_vector = self.contextual_features(sent, idx,  NE_tagged = False)
         feature_vector += [prev_bio]
@@ -348,6 +342,111 @@ class FeatureGenerator:
         combined_vector = hstack([hot_encoded_vector, sparse.csr_matrix(scaled_vector)])
         return combined_vector
 
+    def chemical_mentions(self, words):
+        '''
+        Words of the chemical mentions found by ChemDataExtractor in a tokenized sentence
+
+        :param words: list of strings; words of the sentence
+        :return: list of the words of the first name of every mention
+        '''
+        parser = TextParser()
+        reconstructed = ' '.join(words)  # Should use raw sent not reconstruct tokenized
+        parsed = parser.extract_chemdata(reconstructed)
+        flatten = [cem[0].split() for cem in parsed]
+        return [item for sublist in flatten for item in sublist]
+
+    def sentence_blocks(self, sent):
+        '''
+        Encoded features of all words of a sentence, except the BIO tag of the previous word. The sentence is parsed
+        by ChemDataExtractor once, and every distinct word is parsed by pymatgen and looked up in the tables once.
+
+        :param sent: list of (word, pos) tuples
+        :return: tuple (before, encoders, after): sparse matrices with one row per word of the features preceding and
+        following the previous BIO tag in the vectors of transform, and the encoders of the previous BIO tag. The
+        matrices have no rows for an empty sentence.
+        '''
+        words = [word for (word, pos) in sent]
+        # contextual features of out of bounds words if the sentence is empty
+        n_contextual = len(self.contextual_features(sent, 0, NE_tagged=False))
+        if not words:
+            widths = [len(label_encoder.classes_) for label_encoder, onehot_encoder in self.encoders]
+            return (sparse.csr_matrix((0, sum(widths[:n_contextual]))), self.encoders[n_contextual],
+                    sparse.csr_matrix((0, sum(widths[n_contextual + 1:]) + len(self.scalers))))
+        chems_in_sent = set(self.chemical_mentions(words))
+        parser = parsing.SimpleParser()
+        is_formula = {word: 1 if parser.matgen_parser(word) else 0 for word in set(words)}
+        lookups = {word: self.lookup_features(word) for word in set(words)}
+
+        contextual = []
+        categorical = []
+        numerical = []
+        for idx, word in enumerate(words):
+            contextual.append(self.contextual_features(sent, idx, NE_tagged=False))
+            feature_vector = self.syntactical_features(word)
+            # same as is_material_features, out of bounds words are not formulas
+            feature_vector += [is_formula[word],
+                               1 if word in chems_in_sent else 0,
+                               is_formula[words[idx - 1]] if idx > 0 else 0,
+                               is_formula[words[idx + 1]] if idx + 1 < len(words) else 0]
+            feature_vector += lookups[word]
+            numerical.append([feature for feature in feature_vector if isinstance(feature, Number)])
+            categorical.append([feature for feature in feature_vector if not isinstance(feature, Number)])
+
+        before = [self.encode_column(column, encoders)
+                  for column, encoders in zip(zip(*contextual), self.encoders[:n_contextual])]
+        after = [self.encode_column(column, encoders)
+                 for column, encoders in zip(zip(*categorical), self.encoders[n_contextual + 1:])]
+        after += [sparse.csr_matrix(scaler.transform(np.array(column, dtype=float).reshape(-1, 1)))
+                  for column, scaler in zip(zip(*numerical), self.scalers)]
+        return sparse.hstack(before).tocsr(), self.encoders[n_contextual], sparse.hstack(after).tocsr()
+
+    def encode_column(self, column, encoders):
+        '''
+        Encode a column of new categorical features based on previously fit encoders, like encode_new
+
+        :param column: list of features
+        :param encoders: fitted label and onehot encoders
+        :return: sparse matrix with a onehot encoded row per feature, empty for unseen features
+        '''
+        label_encoder, onehot_encoder = encoders
+        classes = label_encoder.classes_
+        rows, cols = [], []
+        for row, idx in enumerate(np.searchsorted(classes, column)):
+            if idx < len(classes) and classes[idx] == column[row]:
+                rows.append(row)
+                cols.append(idx)
+        return sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(column), len(classes)))
+
+    def transform_sentence(self, sent, prev_bios):
+        '''
+        Generate the feature arrays of all words of a sentence, same as transform on every word
+
+        :param sent: list of (word, pos) tuples
+        :param prev_bios: list of strings; BIO tag of the word preceding every word, '<out_of_bounds>' for the first
+        :return: sparse matrix with the feature vector of every word as rows
+        '''
+        before, encoders, after = self.sentence_blocks(sent)
+        return sparse.hstack([before, self.encode_column(list(prev_bios), encoders), after]).tocsr()
+
+    def predict_sentence(self, sent, classifier):
+        '''
+        Tag the words of a sentence one after the other, the BIO tag predicted for a word being a feature of the next
+
+        :param sent: list of (word, pos) tuples
+        :param classifier: fitted classifier of the feature vectors
+        :return: list of the predicted BIO tags
+        '''
+        before, encoders, after = self.sentence_blocks(sent)
+        encoded = {}
+        prev_bio = '<out_of_bounds>'
+        tags = []
+        for idx in range(len(sent)):
+            if prev_bio not in encoded:
+                encoded[prev_bio] = self.encode_column([prev_bio], encoders)
+            prev_bio = classifier.predict(sparse.hstack([before[idx], encoded[prev_bio], after[idx]]))[0]
+            tags.append(prev_bio)
+        return tags
+
     def encode_new(self, feature, encoders):
         '''
         Encode new features based opn previously fit encoders.
@@ -0,0 +1,62 @@
+import random
+import unittest
+from unittest import mock
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+from matstract.extract.parsing import TextParser
+from matstract.nlp.ner_features import FeatureGenerator
+
+WORDS = [("LiFePO4", "NNP"), ("cathodes", "NNS"), ("were", "VBD"), ("synthesized", "VBN"), ("by", "IN"),
+         ("a", "DT"), ("sol-gel", "JJ"), ("method", "NN"), ("at", "IN"), ("700", "CD"), ("°C", "NN"), (".", "."),
+         ("TiO2", "NNP"), ("and", "CC"), ("ZnO", "NNP"), ("nanoparticles", "NNS"), ("show", "VBP"),
+         ("high", "JJ"), ("capacity", "NN"), ("in", "IN"), ("batteries", "NNS"), ("graphene", "NN")]
+UNSEEN = [("LiCoO2", "NNP"), ("unseenword", "NN"), ("Fe2O3", "NNP")]
+TAGS = ["B-MAT", "O", "B-PRO", "I-PRO", "B-SMT"]
+
+
+def extract_chemdata(self, text):
+    # stands in for ChemDataExtractor: capitalized words with a digit are chemical mentions
+    return [[word] for word in text.split() if word[0].isupper() and any(c.isdigit() for c in word)]
+
+
+class TestFeatureGenerator(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(TextParser, "extract_chemdata", extract_chemdata)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.rng = random.Random(0)
+        documents = [[[((word, pos), self.rng.choice(TAGS)) for word, pos in self.rng.sample(WORDS, 10)]
+                      for _ in range(5)] for _ in range(8)]
+        self.feature_generator = FeatureGenerator()
+        features, outcomes = self.feature_generator.fit_transform(documents)
+        self.clf = LogisticRegression().fit(features.tocsr(), outcomes)
+
+    def sentences(self):
+        return [self.rng.sample(WORDS + UNSEEN, self.rng.randint(1, 20)) for _ in range(10)]
+
+    def test_transform_sentence(self):
+        for sent in self.sentences():
+            prev_bios = ['<out_of_bounds>'] + [self.rng.choice(TAGS + ["B-UNSEEN"]) for _ in sent[1:]]
+            expected = [self.feature_generator.transform(word_tag, sent, idx, prev_bios[idx]).toarray()
+                        for idx, word_tag in enumerate(sent)]
+            transformed = self.feature_generator.transform_sentence(sent, prev_bios)
+            np.testing.assert_allclose(transformed.toarray(), np.vstack(expected))
+
+    def test_predict_sentence(self):
+        for sent in self.sentences():
+            # greedy tagging of the extract_ne callback before predict_sentence
+            expected = []
+            prev_bio = '<out_of_bounds>'
+            for idx, word_tag in enumerate(sent):
+                prev_bio = self.clf.predict(self.feature_generator.transform(word_tag, sent, idx, prev_bio))[0]
+                expected.append(prev_bio)
+            self.assertEqual(list(self.feature_generator.predict_sentence(sent, self.clf)), expected)
+
+    def test_empty_sentence(self):
+        n_features = self.feature_generator.transform(WORDS[0], WORDS[:1], 0, '<out_of_bounds>').shape[1]
+        self.assertEqual(self.feature_generator.transform_sentence([], []).shape, (0, n_features))
+        self.assertEqual(self.feature_generator.predict_sentence([], self.clf), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -72,11 +72,8 @@ def extract_ne(abstract):
     #NE tag
     tagged_doc = []
     for sent in tagged_tokens:
-        prev_BIO = '<out_of_bounds>'
-        for idx, word_tag in enumerate(sent):
-            predicted_BIO = clf.predict(feature_generator.transform(word_tag, sent, idx, prev_BIO))
-            prev_BIO = predicted_BIO
-            tagged_doc.append((word_tag[0], predicted_BIO[0]))
+        predicted_BIO = feature_generator.predict_sentence(sent, clf)
+        tagged_doc.extend((word, BIO_tag) for (word, pos), BIO_tag in zip(sent, predicted_BIO))
 
     #Unique list of NE tags found
     tags_found = list(set([BIO_tag[-3:] for word, BIO_tag in tagged_doc if BIO_tag != 'O']))
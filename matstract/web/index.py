@@ -5,13 +5,14 @@ import dash_materialsintelligence as dmi
 
 from flask_caching import Cache
 
-from flask import send_from_directory
+from flask import send_from_directory, Response
 from matstract.web.view import annotate_app, similar_app, \
     search_app, keyword_app, trends_app, mat2vec_app, matsearch_app, extract_app, summary_app
 from matstract.web.callbacks import search_callbacks, annotate_callbacks, summary_callbacks, \
     keyword_callbacks, trends_callbacks, similar_callbacks, mat2vec_callbacks, matsearch_callbacks, extract_callbacks
 from dash.dependencies import Input, Output, State
-from matstract.models.database import AtlasConnection
+from matstract.models.database import AtlasConnection, pool_stats
+from matstract.models.metrics import QUERY_METRICS
 
 import os
 
@@ -147,6 +148,12 @@ def get_stylesheet(path):
     return send_from_directory(static_folder, path)
 
 
+@app.server.route('/metrics')
+def get_metrics():
+    """ Query latency histograms and connection pool counters in the Prometheus text format. """
+    return Response(QUERY_METRICS.prometheus(pools=pool_stats()), mimetype="text/plain; version=0.0.4")
+
+
 # App Callbacks
 search_callbacks.bind(app, cache)
 trends_callbacks.bind(app, cache)
@@ -3,7 +3,7 @@ import dash_core_components as dcc
 import pandas as pd
 from matstract.models.database import AtlasConnection, ElasticConnection
 from matstract.extract import parsing
-from matstract.models.search import MatstractSearch
+from matstract.models.search import MatstractSearch, TABLE_FIELDS
 import re
 
 db = AtlasConnection(db="production").db
@@ -64,14 +64,14 @@ def sort_df(test_df, materials):
     return test_df
 
 
-def generate_nr_results(n, search=None, material=None):
+def generate_nr_results(total, shown, search=None, material=None):
     if material or search:
-        if n == 0:
+        if total["value"] == 0:
             return "No Results"
-        elif n == 1000:
-            return 'Showing {} of >{:,} results'.format(100, n)
+        elif total["relation"] == "gte":
+            return 'Showing {} of >{:,} results'.format(shown, total["value"])
         else:
-            return 'Showing {} of {:,} results'.format(min(100, n), n)
+            return 'Showing {} of {:,} results'.format(shown, total["value"])
     else:
         return ''
 
@@ -80,9 +80,10 @@ def generate_table(search=None, materials=None,
                    columns=('title', 'authors', 'year', 'journal', 'abstract'),
                    max_rows=100):
     MS = MatstractSearch()
-    results = list(MS.search(search, materials))
-    if results is not None:
-        print("{} search results".format(len(results)))
+    projection = TABLE_FIELDS + ["chem_mentions"] if materials else TABLE_FIELDS
+    page = MS.search_page(search, materials, page_size=max_rows, projection=projection)
+    results = page["results"]
+    print("{} search results".format(page["total"]["value"]))
     if materials:
         df = pd.DataFrame(results[:max_rows])
         if not df.empty:
@@ -93,7 +94,7 @@ def generate_table(search=None, materials=None,
         format_authors = lambda author_list: ", ".join(author_list)
         df['authors'] = df['authors'].apply(format_authors)
         hm = highlight_material
-        return [html.Label(generate_nr_results(len(results), search, materials), id="number_results"), html.Table(
+        return [html.Label(generate_nr_results(page["total"], len(results), search, materials), id="number_results"), html.Table(
             # Header
             [html.Tr([html.Th(col) for col in columns])] +
             # Body
@@ -105,7 +106,7 @@ def generate_table(search=None, materials=None,
                 else html.Td(df.iloc[i][col]) for col in columns])
                 for i in range(min(len(df), max_rows))],
             id="table-element")]
-    return [html.Label(generate_nr_results(len(results), search, materials), id="number_results"),
+    return [html.Label(generate_nr_results(page["total"], len(results), search, materials), id="number_results"),
             html.Table(id="table-element")]
 
 def serve_layout(path):
@@ -1,9 +1,9 @@
 import dash_html_components as html
 import dash_core_components as dcc
 import pandas as pd
-from matstract.models.database import AtlasConnection, ElasticConnection
+from matstract.models.database import AtlasConnection, ElasticConnection, iter_ordered
 from matstract.extract import parsing
-from matstract.models.search import MatstractSearch
+from matstract.models.search import MatstractSearch, TABLE_FIELDS
 from bson import ObjectId
 
 db = AtlasConnection(db="production").db
@@ -14,11 +14,6 @@ def random_abstract():
     return random_document['abstract']
 
 
-def sort_results(results, ids):
-    results_sorted = sorted(results, key=lambda k: ids.index(k['_id']))
-    return results_sorted
-
-
 def highlight_material(body, material):
     highlighted_phrase = html.Mark(material)
     if len(material) > 0 and material in body:
@@ -46,7 +41,7 @@ def get_search_results(search="", material="", max_results=10000):
         results = db.abstracts_leigh.find({"normalized_cems": parser.matgen_parser(material)})
     elif search and not material:
         ids = find_similar(search, max_results)
-        results = sort_results(db.abstracts.find({"_id": {"$in": ids[0:1000]}}), ids)
+        results = iter_ordered(db.abstracts, ids[0:1000])
     elif search and material:
         ids = find_similar(search, max_results)[0:1000]
         results = db.abstracts_leigh.aggregate([
@@ -90,7 +85,8 @@ def sort_df(test_df, materials):
 
 def generate_table(search='', materials='', columns=('title', 'authors', 'year', 'abstract'), max_rows=100):
     MS = MatstractSearch()
-    results = MS.more_like_this(search, materials, max_results=max_rows)
+    projection = TABLE_FIELDS + ["chem_mentions"] if materials else TABLE_FIELDS
+    results = MS.more_like_this(search, materials, max_results=max_rows, projection=projection)
     if results is not None:
         print(len(results))
     if materials:
@@ -7,7 +7,7 @@ import plotly.graph_objs as go
 
 def generate_trends_graph(search=None, material=None, layout=None):
     MS = MatstractSearch()
-    results = list(MS.search(search, material, max_results=10000))
+    results = list(MS.search(search, material, max_results=10000, projection=["year"]))
     hist = dict()
     if len(results) > 0:
         histdata = {}